@@ -73,7 +73,8 @@ def ask_question(question, server_url="http://127.0.0.1:5179"):
             f"{server_url}/ask",
             json={
                 'question': question,
-                'scene_context': scene_context
+                'scene_context': scene_context,
+                'blender_version': list(bpy.app.version)
             },
             timeout=60
         )
@@ -0,0 +1,240 @@
+"""
+Approximate Nearest-Neighbour Index for Blender Helper AI
+
+NumPy-only IVF (inverted file) index over the normalized vectors in
+vectors.bhvi. A spherical k-means coarse quantizer splits the corpus into
+n_lists clusters; a query only scores the rows of the n_probe clusters whose
+centroids are closest to it.
+
+The index stores cluster assignments only, never a second copy of the
+vectors, so the memory-mapped index file remains the single source of rows.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vector_index import normalize_rows, top_k_indices
+
+IVF_FILENAME = "ivf.npz"
+IVF_REPORT_FILENAME = "ivf_report.json"
+IVF_FORMAT_VERSION = 1
+# Queries scored per matrix product in exact_search: bounds the score matrix
+# to EXACT_SEARCH_CHUNK x n_docs however many queries a batch holds
+EXACT_SEARCH_CHUNK = 64
+
+
+def default_n_lists(count):
+    """Rule of thumb: about 4 * sqrt(N) lists, at least 1."""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def spherical_kmeans(vectors, n_lists, n_iter=20, sample_size=100_000, seed=0):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Trains on a random sample of at most sample_size rows, which is plenty for
+    a coarse quantizer and keeps build time bounded on large corpora.
+
+    Returns:
+        (n_lists, dim) float32 array of unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    count = vectors.shape[0]
+    if count > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))])
+    else:
+        sample = np.asarray(vectors)
+
+    n_lists = min(n_lists, sample.shape[0])
+    centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_lists)
+
+        # Re-seed empty clusters from random points so no list is wasted
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(sample.shape[0], len(empty), replace=False)]
+
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+def assign_lists(vectors, centroids, batch_size=65_536):
+    """Nearest centroid for every row, computed in batches to bound memory."""
+    count = vectors.shape[0]
+    assign = np.empty(count, dtype=np.int32)
+    for start in range(0, count, batch_size):
+        block = np.asarray(vectors[start:start + batch_size])
+        assign[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """Inverted-file index: centroids plus a CSR layout of row ids per list."""
+
+    def __init__(self, centroids, list_offsets, list_ids, index_checksum=None):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.index_checksum = index_checksum
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=20, seed=0, index_checksum=None, centroids=None):
+        """
+        Train the quantizer and bucket every row of vectors.
+
+        Passing the centroids of a previous build skips training, which is
+        fine while the corpus has only changed a little.
+        """
+        count = vectors.shape[0]
+        if centroids is None:
+            n_lists = n_lists or default_n_lists(count)
+            centroids = spherical_kmeans(vectors, n_lists, n_iter=n_iter, seed=seed)
+        assign = assign_lists(vectors, centroids)
+
+        list_ids = np.argsort(assign, kind="stable").astype(np.int32)
+        counts = np.bincount(assign, minlength=centroids.shape[0])
+        list_offsets = np.zeros(centroids.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=list_offsets[1:])
+
+        return cls(centroids, list_offsets, list_ids, index_checksum=index_checksum)
+
+    def save(self, path):
+        np.savez(
+            path,
+            format_version=np.array(IVF_FORMAT_VERSION),
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_ids=self.list_ids,
+            index_checksum=np.array(self.index_checksum or ""),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["format_version"]) != IVF_FORMAT_VERSION:
+                raise ValueError(f"{path} has unsupported IVF format version {int(data['format_version'])}")
+            return cls(
+                data["centroids"],
+                data["list_offsets"],
+                data["list_ids"],
+                index_checksum=str(data["index_checksum"]) or None,
+            )
+
+    def candidates(self, centroid_scores, n_probe):
+        """Row ids in the n_probe best lists for one query's centroid scores."""
+        probe = top_k_indices(centroid_scores, n_probe)
+        return np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+            for c in probe
+        ])
+
+    def search(self, vectors, query_embeddings, k, n_probe=8):
+        """
+        Approximate top-k for each unit-length query. n_probe is clamped to
+        1..n_lists, so a misconfigured value never probes nothing.
+
+        Returns:
+            List of (indices, scores) pairs, one per query, best first.
+        """
+        n_probe = min(max(int(n_probe), 1), self.n_lists)
+        query_embeddings = np.atleast_2d(query_embeddings)
+        centroid_scores = query_embeddings @ self.centroids.T
+
+        results = []
+        for row, query in enumerate(query_embeddings):
+            ids = self.candidates(centroid_scores[row], n_probe)
+            if len(ids) == 0:
+                results.append((ids.astype(np.intp), np.empty(0, dtype=np.float32)))
+                continue
+            # Sorted ids turn the gather into a forward scan over the memmap
+            ids = np.sort(ids)
+            scores = np.asarray(vectors[ids]) @ query
+            best = top_k_indices(scores, k)
+            results.append((ids[best].astype(np.intp), scores[best]))
+        return results
+
+
+def exact_search(vectors, query_embeddings, k):
+    """Brute-force top-k, same return shape as IVFIndex.search."""
+    query_embeddings = np.atleast_2d(query_embeddings)
+    vectors_t = np.asarray(vectors).T
+    results = []
+    for start in range(0, query_embeddings.shape[0], EXACT_SEARCH_CHUNK):
+        scores = query_embeddings[start:start + EXACT_SEARCH_CHUNK] @ vectors_t
+        top = top_k_indices(scores, k)
+        results.extend((top[row], scores[row, top[row]]) for row in range(top.shape[0]))
+    return results
+
+
+def recall_report(vectors, ivf, query_embeddings, k=10, probe_values=(1, 2, 4, 8, 16, 32)):
+    """
+    Measure recall@k and latency of the IVF index against the exact scan.
+
+    Returns:
+        Dict with the exact-scan latency and one entry per n_probe value.
+    """
+    query_embeddings = np.atleast_2d(query_embeddings)
+    n_queries = query_embeddings.shape[0]
+
+    start = time.perf_counter()
+    truth = exact_search(vectors, query_embeddings, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    rows = []
+    for n_probe in probe_values:
+        if n_probe > ivf.n_lists:
+            break
+        start = time.perf_counter()
+        approx = ivf.search(vectors, query_embeddings, k, n_probe=n_probe)
+        ivf_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+        hits = sum(
+            len(np.intersect1d(found, expected))
+            for (found, _), (expected, _) in zip(approx, truth)
+        )
+        rows.append({
+            'n_probe': n_probe,
+            f'recall_at_{k}': round(hits / (n_queries * min(k, vectors.shape[0])), 4),
+            'ms_per_query': round(ivf_ms, 4),
+        })
+
+    return {
+        'k': k,
+        'queries': n_queries,
+        'corpus_size': int(vectors.shape[0]),
+        'n_lists': ivf.n_lists,
+        'exact_ms_per_query': round(exact_ms, 4),
+        'ivf': rows,
+    }
+
+
+def sample_queries(vectors, n_queries=200, noise=0.3, seed=1):
+    """
+    Synthetic query set: perturbed copies of random corpus rows.
+
+    noise is the expected length of the random perturbation added to each
+    unit row. Lets the build measure recall offline, without real query text.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(vectors.shape[0], min(n_queries, vectors.shape[0]), replace=False)
+    queries = np.asarray(vectors[np.sort(picks)], dtype=np.float32)
+    scale = noise / np.sqrt(queries.shape[1])
+    queries = queries + rng.normal(0, scale, size=queries.shape).astype(np.float32)
+    return normalize_rows(queries)
+
+
+def write_report(path, report):
+    Path(path).write_text(json.dumps(report, indent=2), encoding="utf-8")
@@ -0,0 +1,383 @@
+"""
+Retrieval Benchmark for Blender Helper AI
+
+Measures RAGSystem.retrieve_context on synthetic knowledge bases, offline
+and without the embedding model:
+- corpora of clustered unit vectors (default 1k, 10k, 100k and 1M x 384)
+  with matching synthetic chunk text, written as real shards (vectors.bhvi,
+  ivf.npz, bm25.npz, metadata.json, knowledge.sqlite)
+- query sets made of perturbed corpus rows plus words from their chunks
+- every search mode the server offers: exact, ivf, exact+bm25, ivf+bm25
+
+Each (corpus, mode) runs in its own subprocess with the server's caches
+disabled, so load time and peak memory are per mode. Reported per run:
+p50/p99 latency, sequential, threaded and batch throughput, peak RSS and
+recall@k against exact search (for +bm25 modes this is the overlap with the
+dense exact ranking).
+
+Usage:
+    python bench_retrieval.py --sizes 1000,10000 --output bench.json
+
+Corpora are cached in --work-dir and reused on later runs.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import IVF_FILENAME, IVFIndex, exact_search
+from encoders import rss_mb
+from knowledge_store import STORE_FILENAME, write_store
+from lexical_index import BM25_FILENAME, BM25Index
+from vector_index import INDEX_FILENAME, normalize_rows, write_index
+
+RAG_DIR = Path(__file__).parent
+BENCH_FORMAT_VERSION = 1
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+CORPUS_MARKER = "corpus.json"
+QUERIES_FILENAME = "queries.npz"
+# mode -> (BLENDER_HELPER_RAG_SEARCH, BLENDER_HELPER_RAG_HYBRID)
+MODES = {
+    'exact': ('exact', '0'),
+    'ivf': ('ivf', '0'),
+    'exact+bm25': ('exact', 'auto'),
+    'ivf+bm25': ('ivf', 'auto'),
+}
+TOPIC_WORDS = 40
+COMMON_WORDS = 5_000
+
+
+def synthetic_corpus(count, dim=384, n_topics=None, seed=0, block_size=100_000):
+    """
+    Clustered unit vectors and matching chunk dicts.
+
+    Each chunk belongs to a topic: its vector is the topic centre plus noise
+    and its text mixes topic words with common words, so dense and BM25
+    retrieval both have structure to find, like real documentation.
+
+    Returns:
+        (float32 array of shape (count, dim), list of chunk dicts)
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = n_topics or max(8, int(np.sqrt(count)))
+    centres = normalize_rows(rng.standard_normal((n_topics, dim)).astype(np.float32))
+    topics = rng.integers(0, n_topics, size=count)
+
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, block_size):
+        end = min(count, start + block_size)
+        noise = rng.standard_normal((end - start, dim)).astype(np.float32) * (0.8 / np.sqrt(dim))
+        vectors[start:end] = normalize_rows(centres[topics[start:end]] + noise)
+
+    # Zipf-like common vocabulary shared by every topic
+    common_p = 1.0 / np.arange(1, COMMON_WORDS + 1)
+    common_p /= common_p.sum()
+    topic_picks = rng.integers(0, TOPIC_WORDS, size=(count, 6))
+    common_picks = rng.choice(COMMON_WORDS, size=(count, 6), p=common_p)
+
+    chunks = []
+    for row in range(count):
+        topic = int(topics[row])
+        words = [f"topic{topic}term{w}" for w in topic_picks[row]] + [f"word{w}" for w in common_picks[row]]
+        chunks.append({
+            'text': " ".join(words),
+            'signature': f"bpy.types.Synthetic{topic}.item{row}",
+            'url': f"synthetic://chunk/{row}",
+        })
+    return vectors, chunks
+
+
+def synthetic_queries(vectors, chunks, n_queries=500, noise=0.5, seed=1):
+    """
+    Perturbed copies of random rows, with a few words of their chunk as text.
+
+    Returns:
+        (list of query strings, float32 unit query embeddings)
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(vectors.shape[0], min(n_queries, vectors.shape[0]), replace=False)
+    embeddings = np.asarray(vectors[picks], dtype=np.float32)
+    embeddings = normalize_rows(
+        embeddings + rng.normal(0, noise / np.sqrt(embeddings.shape[1]), size=embeddings.shape).astype(np.float32)
+    )
+    texts = []
+    for n, row in enumerate(picks):
+        words = chunks[int(row)]['text'].split()
+        chosen = rng.choice(len(words), 3, replace=False)
+        # Prefix keeps query strings unique even when the words repeat
+        texts.append(f"q{n} " + " ".join(words[i] for i in sorted(chosen)))
+    return texts, embeddings
+
+
+def build_corpus(db_dir, count, dim=384, n_queries=500, seed=0, max_lexical_docs=100_000):
+    """Write a synthetic shard plus its query set to db_dir, unless already there."""
+    db_dir = Path(db_dir)
+    marker = db_dir / CORPUS_MARKER
+    if marker.exists():
+        return json.loads(marker.read_text(encoding='utf-8'))
+
+    db_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    print(f"[INFO] Generating {count} x {dim} corpus in {db_dir}...")
+    vectors, chunks = synthetic_corpus(count, dim=dim, seed=seed)
+    header = write_index(db_dir / INDEX_FILENAME, vectors, EMBEDDING_MODEL_NAME)
+
+    ivf = IVFIndex.build(vectors, index_checksum=header['checksum'])
+    ivf.save(db_dir / IVF_FILENAME)
+
+    # BM25 build is pure Python; past max_lexical_docs the +bm25 modes are skipped
+    has_lexical = count <= max_lexical_docs
+    if has_lexical:
+        BM25Index.build(chunks).save(db_dir / BM25_FILENAME)
+
+    with open(db_dir / "metadata.json", 'w', encoding='utf-8') as f:
+        json.dump(chunks, f)
+    write_store(db_dir / STORE_FILENAME, chunks, vectors, EMBEDDING_MODEL_NAME, index_checksum=header['checksum'])
+
+    texts, query_embeddings = synthetic_queries(vectors, chunks, n_queries=n_queries, seed=seed + 1)
+    np.savez(db_dir / QUERIES_FILENAME, texts=np.array(texts, dtype=str), embeddings=query_embeddings)
+
+    info = {
+        'count': count,
+        'dim': dim,
+        'seed': seed,
+        'n_queries': len(texts),
+        'ivf_lists': ivf.n_lists,
+        'lexical': has_lexical,
+        'build_seconds': round(time.perf_counter() - start, 2),
+    }
+    marker.write_text(json.dumps(info, indent=2), encoding='utf-8')
+    return info
+
+
+def ground_truth(db_dir, k):
+    """Exact top-k row ids for every benchmark query of a corpus."""
+    from vector_index import load_index
+
+    vectors, _ = load_index(Path(db_dir) / INDEX_FILENAME)
+    with np.load(Path(db_dir) / QUERIES_FILENAME) as data:
+        query_embeddings = data['embeddings']
+    results = []
+    for start in range(0, len(query_embeddings), 256):
+        results.extend(ids for ids, _ in exact_search(vectors, query_embeddings[start:start + 256], k))
+    return results
+
+
+class PrecomputedEncoder:
+    """Stands in for the embedding model: returns the stored vector of each query."""
+
+    backend = 'precomputed'
+    model_name = EMBEDDING_MODEL_NAME
+
+    def __init__(self, texts, embeddings):
+        self.rows = {text: row for row, text in enumerate(texts)}
+        self.embeddings = embeddings
+
+    def encode(self, texts, batch_size=32):
+        return self.embeddings[[self.rows[text] for text in texts]]
+
+    def stats(self):
+        return {'backend': self.backend, 'model': self.model_name}
+
+
+def _percentile_ms(seconds, q):
+    return round(float(np.percentile(seconds, q)) * 1000, 3)
+
+
+def _row_ids(contexts):
+    return [int(context['url'].rsplit('/', 1)[1]) for context in contexts]
+
+
+def measure(db_dir, mode, k=10, threads=4, batch_size=32):
+    """
+    Benchmark one search mode in this process; server settings must already be in os.environ.
+
+    Returns:
+        Dict of timings and memory, plus the row ids returned for each query.
+    """
+    import server
+
+    with np.load(Path(db_dir) / QUERIES_FILENAME) as data:
+        texts = data['texts'].tolist()
+        embeddings = data['embeddings']
+    server.query_embedder.model = PrecomputedEncoder(texts, embeddings)
+
+    rag = server.RAGSystem(Path(db_dir), 'bench')
+    start = time.perf_counter()
+    if not rag.initialize():
+        raise RuntimeError(f"Knowledge base at {db_dir} failed to load")
+    load_seconds = time.perf_counter() - start
+    if rag.search_mode != mode:
+        raise RuntimeError(f"Expected search mode {mode}, server is using {rag.search_mode}")
+
+    # Warm-up (first touches of memory-mapped pages, lazy SQLite connections)
+    for text in texts[:10]:
+        rag.retrieve_context(text, n_results=k)
+
+    latencies = []
+    returned = []
+    for text in texts:
+        start = time.perf_counter()
+        contexts = rag.retrieve_context(text, n_results=k)
+        latencies.append(time.perf_counter() - start)
+        returned.append(_row_ids(contexts))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda text: rag.retrieve_context(text, n_results=k), texts))
+    threaded_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        rag.retrieve_batch(texts[offset:offset + batch_size], n_results=k)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = np.array(latencies)
+    peak_rss = rss_mb(peak=True)
+    return {
+        'load_seconds': round(load_seconds, 3),
+        'latency_ms': {
+            'p50': _percentile_ms(latencies, 50),
+            'p99': _percentile_ms(latencies, 99),
+            'mean': round(float(latencies.mean()) * 1000, 3),
+        },
+        'qps_sequential': round(len(texts) / latencies.sum(), 1),
+        'qps_threaded': round(len(texts) / threaded_seconds, 1),
+        'threads': threads,
+        'qps_batch': round(len(texts) / batch_seconds, 1),
+        'batch_size': batch_size,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        'ids': returned,
+    }
+
+
+def run_mode(db_dir, mode, store, k, threads, n_probe):
+    """Run measure() for one mode in a fresh subprocess with the server configured for it."""
+    search, hybrid = MODES[mode]
+    env = dict(os.environ)
+    env.update({
+        'BLENDER_HELPER_RAG_SEARCH': search,
+        'BLENDER_HELPER_RAG_HYBRID': hybrid,
+        'BLENDER_HELPER_RAG_STORE': store,
+        'BLENDER_HELPER_IVF_NPROBE': str(n_probe),
+        'BLENDER_HELPER_RESULT_CACHE_SIZE': '0',
+        'BLENDER_HELPER_QUERY_CACHE_SIZE': '0',
+        'BLENDER_HELPER_QUERY_CACHE_PATH': '',
+    })
+    proc = subprocess.run(
+        [sys.executable, __file__, '--measure', str(db_dir), '--mode', mode, '--k', str(k), '--threads', str(threads)],
+        capture_output=True, text=True, cwd=str(RAG_DIR), env=env
+    )
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else 'failed'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def recall_at_k(returned, truth, k):
+    hits = sum(len(set(ids[:k]) & set(int(i) for i in exact[:k])) for ids, exact in zip(returned, truth))
+    return round(hits / (k * len(truth)), 4) if truth else 0.0
+
+
+def run_benchmark(sizes, work_dir, modes=tuple(MODES), stores=('sqlite',), dim=384, k=10,
+                  n_queries=500, threads=4, n_probe_values=(8,), max_lexical_docs=100_000):
+    """Build (or reuse) every corpus and benchmark each mode against it."""
+    results = []
+    for count in sizes:
+        db_dir = Path(work_dir) / f"n{count}_d{dim}_q{n_queries}"
+        corpus = build_corpus(db_dir, count, dim=dim, n_queries=n_queries, max_lexical_docs=max_lexical_docs)
+        truth = ground_truth(db_dir, k)
+
+        for mode in modes:
+            if mode.endswith('+bm25') and not corpus['lexical']:
+                results.append({'size': count, 'mode': mode, 'skipped': f"no BM25 index above {max_lexical_docs} docs"})
+                continue
+            probes = n_probe_values if mode.startswith('ivf') else (None,)
+            for store in stores:
+                for n_probe in probes:
+                    print(f"[INFO] {count} docs, {mode}, {store} store" + (f", n_probe={n_probe}" if n_probe else ""))
+                    result = run_mode(db_dir, mode, store, k, threads, n_probe or 8)
+                    row = {'size': count, 'dim': dim, 'mode': mode, 'store': store, 'n_probe': n_probe}
+                    if 'error' in result:
+                        row['error'] = result['error']
+                    else:
+                        row[f'recall_at_{k}'] = recall_at_k(result.pop('ids'), truth, k)
+                        row.update(result)
+                    results.append(row)
+
+    return {
+        'format_version': BENCH_FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {'k': k, 'n_queries': n_queries, 'threads': threads, 'dim': dim},
+        'results': results,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval on synthetic corpora")
+    parser.add_argument('--sizes', default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated corpus sizes (default: %(default)s)")
+    parser.add_argument('--modes', default=",".join(MODES), help="Comma-separated search modes (default: all)")
+    parser.add_argument('--stores', default="sqlite", help="Comma-separated chunk stores: json, sqlite")
+    parser.add_argument('--nprobe', default="8", help="Comma-separated IVF n_probe values")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--max-lexical-docs', type=int, default=100_000,
+                        help="Largest corpus that gets a BM25 index (building it is pure Python)")
+    parser.add_argument('--work-dir', default=str(Path(tempfile.gettempdir()) / "blender_helper_bench"))
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--measure', metavar='DB_DIR', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.mode, k=args.k, threads=args.threads)))
+        return
+
+    modes = args.modes.split(",")
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    report = run_benchmark(
+        [int(size) for size in args.sizes.split(",")],
+        args.work_dir,
+        modes=modes,
+        stores=args.stores.split(","),
+        dim=args.dim,
+        k=args.k,
+        n_queries=args.queries,
+        threads=args.threads,
+        n_probe_values=[int(p) for p in args.nprobe.split(",")],
+        max_lexical_docs=args.max_lexical_docs,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+        print(f"[OK] Report written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,10 @@ Run this ONCE before using the RAG server.
 
 import os
 import json
-import requests
-from bs4 import BeautifulSoup
+import hashlib
 from pathlib import Path
 import pickle
+import shutil
 import numpy as np
 try:
     from sentence_transformers import SentenceTransformer
@@ -20,13 +20,95 @@ except ImportError:
     exit(1)
 import time
 
+from ann_index import IVF_FILENAME, IVF_REPORT_FILENAME, IVFIndex, recall_report, sample_queries, write_report
+from build_staging import STAGING_DIRNAME, BuildStaging
+from cache import EmbeddingStore
+from docs_crawler import MODULE_SUMMARY_FILENAME, DocsCrawler, module_summary
+from docs_embedder import EMBED_REPORT_FILENAME, EmbeddingStage, embed_report
+from docs_fetcher import CRAWL_STATE_FILENAME, DocsFetcher
+from docs_parser import DEFAULT_BACKEND, PARSE_REPORT_FILENAME, ParsePool, parse_page, parse_report, resolve_backend
+from knowledge_store import STORE_FILENAME, chunk_hash, iter_chunks_json, write_chunks_json, write_store
+from lexical_index import BM25_FILENAME, BM25Index
+from shard_generations import (
+    current_generation, new_generation, publish_generation, remove_legacy_files, remove_old_generations
+)
+from vector_index import INDEX_FILENAME, IndexFormatError, load_index, normalize_rows, read_header, write_index_blocks
+
 # Configuration
 BLENDER_VERSION = os.getenv("BLENDER_VERSION", "4.2")
-DOCS_BASE_URL = f"https://docs.blender.org/api/{BLENDER_VERSION}"
+# Override to build against a mirror or a local server with fixture pages
+DOCS_BASE_URL = os.getenv("BLENDER_DOCS_BASE_URL", f"https://docs.blender.org/api/{BLENDER_VERSION}")
+# One knowledge base shard per Blender version: simple_db/<BLENDER_VERSION>/,
+# each build in a new generation directory inside it (see shard_generations.py)
 DB_PATH = Path(__file__).parent / "simple_db"
 CACHE_PATH = Path(__file__).parent / "docs_cache"
-
-# Key API pages to index
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Files a build may write (embeddings.npy and metadata.pkl only on request);
+# older builds wrote them straight into the shard directory
+SHARD_FILES = (
+    INDEX_FILENAME, "embeddings.npy", "metadata.json", "metadata.pkl", STORE_FILENAME,
+    BM25_FILENAME, IVF_FILENAME, IVF_REPORT_FILENAME, MODULE_SUMMARY_FILENAME,
+)
+# Generations kept per shard (the current one and the one before it)
+KEEP_GENERATIONS = int(os.getenv("KEEP_GENERATIONS", "2"))
+
+# Page fetching: FETCH_WORKERS concurrent downloads over one pooled session,
+# at most FETCH_PER_HOST in flight per host, FETCH_MIN_INTERVAL seconds apart
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))
+FETCH_MIN_INTERVAL = float(os.getenv("FETCH_MIN_INTERVAL", "0.25"))
+
+# HTML parsing runs in PARSE_WORKERS processes (0 = one per CPU).
+# PARSE_BACKEND: "html.parser" (default), "lxml" or "selectolax"; check
+# that a faster backend yields the same chunks with --parse-report first
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+PARSE_BACKEND = os.getenv("PARSE_BACKEND", "html.parser")
+# Passes over the pages per measurement in --parse-report
+PARSE_REPORT_REPEAT = int(os.getenv("PARSE_REPORT_REPEAT", "3"))
+
+# Chunks are embedded and committed to disk in batches of this size; memory
+# use depends on it, not on the size of the corpus
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Texts are sorted by token length into model batches of EMBED_MODEL_BATCH;
+# EMBED_WORKERS > 1 runs them in that many processes, each loading the model
+# and getting an equal share of the cores
+EMBED_MODEL_BATCH = int(os.getenv("EMBED_MODEL_BATCH", "32"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+# Chunks sampled from the shard by --embed-report
+EMBED_REPORT_DOCS = int(os.getenv("EMBED_REPORT_DOCS", "2000"))
+# Vectors shared by the builds of every version, keyed by (model, chunk hash);
+# set to "" to disable. Prune it with --gc-embeddings
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_PATH / "embeddings.sqlite"))
+# metadata.pkl is a legacy fallback that needs every chunk in memory at once
+BUILD_PICKLE_METADATA = os.getenv("BUILD_PICKLE_METADATA", "0") == "1"
+# embeddings.npy is only for external tools: the server reads vectors.bhvi, and
+# the vectors are in knowledge.sqlite too, so by default they are not stored a third time
+BUILD_NUMPY_EMBEDDINGS = os.getenv("BUILD_NUMPY_EMBEDDINGS", "0") == "1"
+
+# Approximate nearest-neighbour index: "auto" builds it once the corpus is
+# large enough for brute force to matter, "1" always, "0" never
+BUILD_ANN_INDEX = os.getenv("BUILD_ANN_INDEX", "auto")
+ANN_MIN_DOCS = int(os.getenv("ANN_MIN_DOCS", "20000"))
+ANN_LISTS = int(os.getenv("ANN_LISTS", "0")) or None
+# Incremental rebuilds keep the previous IVF centroids while at most this
+# fraction of the chunks is new; beyond it the quantizer is retrained
+ANN_RETRAIN_FRACTION = float(os.getenv("ANN_RETRAIN_FRACTION", "0.2"))
+
+# Page discovery: crawl from the API index (DOCS_CRAWL=1) or index only
+# API_PAGES (DOCS_CRAWL=0). CRAWL_INCLUDE / CRAWL_EXCLUDE are comma-separated
+# glob patterns on page names, e.g. CRAWL_INCLUDE="bpy.types.*Node*,bmesh*".
+# Excluded pages are not followed; pages outside CRAWL_INCLUDE are followed
+# but not indexed. CRAWL_MAX_DEPTH counts links from the seed pages, and
+# CRAWL_MAX_PAGES caps the index (nearest pages win).
+DOCS_CRAWL = os.getenv("DOCS_CRAWL", "1") == "1"
+CRAWL_SEEDS = os.getenv("CRAWL_SEEDS", "/index.html").split(",")
+CRAWL_INCLUDE = os.getenv("CRAWL_INCLUDE", "").split(",")
+# Search/index pages, the change log and the removed game engine API
+CRAWL_EXCLUDE = os.getenv("CRAWL_EXCLUDE", "genindex,search,py-modindex,change_log,bge.*").split(",")
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "4000"))
+
+# Key API pages to index (DOCS_CRAWL=0, or when the index cannot be reached)
 API_PAGES = [
     "/bpy.ops.mesh.html",
     "/bpy.ops.object.html",
@@ -46,135 +128,483 @@ API_PAGES = [
 
 
 class BlenderDocsIndexer:
-    def __init__(self):
-        self.cache_path = CACHE_PATH
-        self.cache_path.mkdir(exist_ok=True)
-        self.db_path = DB_PATH
-        self.db_path.mkdir(exist_ok=True)
-
-        print("Loading embedding model...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, full_rebuild=False, load_model=True, track_crawl=True):
+        # Re-embed every chunk instead of reusing vectors from the previous build
+        self.full_rebuild = full_rebuild
+        self.changed_fraction = 1.0
+        # Cached pages are per version: the same path differs between releases
+        self.cache_path = CACHE_PATH / BLENDER_VERSION
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.db_path = DB_PATH / BLENDER_VERSION
+        self.db_path.mkdir(parents=True, exist_ok=True)
+        self.parse_backend = resolve_backend(PARSE_BACKEND)
+        # Only builds record crawl progress; a report run must neither resume
+        # an interrupted build's crawl nor leave progress for the next build
+        self.fetcher = DocsFetcher(
+            DOCS_BASE_URL,
+            self.cache_path,
+            state_path=self.db_path / CRAWL_STATE_FILENAME if track_crawl else None,
+            max_workers=FETCH_WORKERS,
+            per_host=FETCH_PER_HOST,
+            min_interval=FETCH_MIN_INTERVAL
+        )
+
+        self.embedding_store = EmbeddingStore(EMBEDDING_CACHE_PATH, EMBEDDING_MODEL_NAME) if EMBEDDING_CACHE_PATH else None
+        self.embedding_model = None
+        if load_model:
+            print("Loading embedding model...")
+            self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        self.embedder = EmbeddingStage(self.embedding_model, EMBEDDING_MODEL_NAME, EMBED_WORKERS, EMBED_MODEL_BATCH)
 
     def fetch_page(self, url_path):
-        """Fetch and cache documentation page."""
-        cache_file = self.cache_path / url_path.replace("/", "_")
-
-        if cache_file.exists():
-            print(f"  [CACHE] {url_path}")
-            return cache_file.read_text(encoding='utf-8')
-
-        full_url = DOCS_BASE_URL + url_path
-        print(f"  [FETCH] {full_url}")
-
-        try:
-            response = requests.get(full_url, timeout=10)
-            response.raise_for_status()
-            html = response.text
-            cache_file.write_text(html, encoding='utf-8')
-            time.sleep(1)  # Be nice to server
-            return html
-        except Exception as e:
-            print(f"  [ERROR] {e}")
-            return None
+        """Fetch (or revalidate) and cache one documentation page."""
+        return self.fetcher.fetch(url_path)
 
     def parse_page(self, html, url_path):
         """Extract documentation chunks."""
-        soup = BeautifulSoup(html, 'html.parser')
-        chunks = []
-
-        # Extract API references
-        for section in soup.find_all(['dl', 'div'], class_=['function', 'method', 'attribute', 'class', 'data']):
-            sig = section.find(['dt', 'h3', 'h4'])
-            if not sig:
+        return parse_page(html, url_path, self.parse_backend)
+
+    def load_previous_vectors(self):
+        """
+        Vectors of the shard being rebuilt, keyed by chunk hash.
+
+        Returns:
+            (dict of hash -> row, vectors), or ({}, None) if there is no
+            previous build or it cannot be reused.
+        """
+        generation = current_generation(self.db_path)
+        index_file = generation / INDEX_FILENAME
+        metadata_json_file = generation / "metadata.json"
+        if self.full_rebuild or not index_file.exists() or not metadata_json_file.exists():
+            return {}, None
+
+        rows = {}
+        try:
+            vectors, header = load_index(index_file)
+            count = 0
+            for row, chunk in enumerate(iter_chunks_json(metadata_json_file)):
+                # Builds from before chunk hashes get them computed here
+                rows.setdefault(chunk.get("hash") or chunk_hash(chunk["text"]), row)
+                count = row + 1
+        except (IndexFormatError, OSError, ValueError) as e:
+            print(f"[WARN] Previous build is unreadable ({e}), embedding every chunk")
+            return {}, None
+
+        if header['model'] != EMBEDDING_MODEL_NAME or header['count'] != count:
+            print("[WARN] Previous build used another model or is inconsistent, embedding every chunk")
+            return {}, None
+        return rows, vectors
+
+    def embed_batch(self, chunks, previous_rows, previous_vectors):
+        """
+        Normalized embeddings for one batch of chunks, in order.
+
+        Vectors come from the shared embedding store, then from the previous
+        build of this shard; only text neither has is sent to the model, once
+        per distinct text. Vectors the store lacks are added to it.
+
+        Returns:
+            (embeddings, number of reused vectors)
+        """
+        hashes = [chunk["hash"] for chunk in chunks]
+        known = {}
+        if self.embedding_store is not None and not self.full_rebuild:
+            known = self.embedding_store.get_many(set(hashes))
+
+        missing = {}
+        to_embed = {}
+        for chunk in chunks:
+            h = chunk["hash"]
+            if h in known or h in missing or h in to_embed:
                 continue
-
-            signature = sig.get_text(strip=True)
-            desc_elem = section.find(['dd', 'p'])
-            description = desc_elem.get_text(strip=True) if desc_elem else ""
-
-            chunk_text = f"{signature}\n\n{description}"
-            chunks.append({
-                "text": chunk_text,
-                "signature": signature,
-                "url": url_path,
-            })
-
-        # Extract code examples
-        for code_block in soup.find_all('pre'):
-            code = code_block.get_text(strip=True)
-            if 'bpy.' in code and len(code) > 50:
-                context_elem = code_block.find_previous(['p', 'h2', 'h3'])
-                context = context_elem.get_text(strip=True) if context_elem else ""
-
-                chunks.append({
-                    "text": f"Example:\n{context}\n\n```python\n{code}\n```",
-                    "signature": f"Example from {url_path}",
-                    "url": url_path,
-                })
-
-        return chunks
+            if h in previous_rows:
+                missing[h] = previous_vectors[previous_rows[h]]
+            else:
+                to_embed[h] = chunk["text"]
+
+        if to_embed:
+            new_vectors = normalize_rows(self.embedder.encode(to_embed.values()))
+            missing.update(zip(to_embed, new_vectors))
+
+        if self.embedding_store is not None:
+            self.embedding_store.put_many(missing)
+        known.update(missing)
+
+        embeddings = np.stack([known[h] for h in hashes]).astype(np.float32, copy=False)
+        return embeddings, sum(1 for h in hashes if h not in to_embed)
+
+    def discover_pages(self):
+        """Pages to index: crawled from the API index, or API_PAGES."""
+        if not DOCS_CRAWL:
+            return API_PAGES
+
+        crawler = DocsCrawler(
+            self.fetcher,
+            seeds=CRAWL_SEEDS,
+            include=CRAWL_INCLUDE,
+            exclude=CRAWL_EXCLUDE,
+            max_depth=CRAWL_MAX_DEPTH,
+            max_pages=CRAWL_MAX_PAGES,
+        )
+        print(f"[INFO] Discovering pages from {', '.join(CRAWL_SEEDS)} (depth {CRAWL_MAX_DEPTH})...")
+        pages = crawler.discover()
+        if not pages:
+            print(f"[WARN] API index unreachable, indexing the {len(API_PAGES)} key pages only")
+            return API_PAGES
+        print(f"[OK] Discovered {len(pages)} pages: {crawler.stats()}")
+        return pages
+
+    def stream_chunks(self, pages, start_page=0, skip_chunks=0):
+        """
+        Fetch and parse pages[start_page:] and yield their chunks one at a time.
+
+        Pages are parsed in PARSE_WORKERS processes while later ones are
+        still downloading.
+
+        Yields:
+            (chunk, page index, chunk index within the page, is last chunk of the page)
+        """
+        with ParsePool(PARSE_WORKERS, self.parse_backend) as pool:
+            parsed = pool.imap(self.fetcher.fetch_all(pages[start_page:]))
+            for offset, (page_url, chunks) in enumerate(parsed):
+                page_index = start_page + offset
+                print(f"\n[PROCESS] {page_url}")
+                if chunks is None:
+                    continue
+
+                print(f"  [OK] Extracted {len(chunks)} chunks")
+                first = skip_chunks if page_index == start_page else 0
+                for i in range(first, len(chunks)):
+                    yield chunks[i], page_index, i, i == len(chunks) - 1
 
     def build_database(self):
-        """Build the knowledge base."""
+        """
+        Build the knowledge base as a stream: fetch -> parse -> embed -> append.
+
+        Chunks are embedded in batches of EMBED_BATCH_SIZE and each batch is
+        committed to the staging area before the next one starts, so memory
+        does not grow with the corpus and a rerun after an interruption
+        continues from the last committed batch.
+        """
         print(f"\n{'='*60}")
-        print("Building Blender API Knowledge Base")
+        print(f"Building Blender {BLENDER_VERSION} API Knowledge Base")
         print(f"{'='*60}\n")
 
-        all_chunks = []
-
-        for page_url in API_PAGES:
-            print(f"\n[PROCESS] {page_url}")
-            html = self.fetch_page(page_url)
-            if not html:
-                continue
-
-            chunks = self.parse_page(html, page_url)
-            print(f"  [OK] Extracted {len(chunks)} chunks")
-            all_chunks.extend(chunks)
-
-        if not all_chunks:
+        pages = self.discover_pages()
+        staging = BuildStaging(self.db_path / STAGING_DIRNAME, {
+            'version': BLENDER_VERSION,
+            'base_url': DOCS_BASE_URL,
+            'model': EMBEDDING_MODEL_NAME,
+            'pages': hashlib.sha256("\n".join(pages).encode('utf-8')).hexdigest(),
+            'full_rebuild': self.full_rebuild,
+        })
+        progress = staging.progress
+        if staging.resumed:
+            print(f"[RESUME] {staging.count} chunks in {progress['batches']} batches already committed, "
+                  f"continuing at page {progress['pages_done'] + 1}/{len(pages)}")
+
+        # Unchanged chunks reuse the embedding store's or the previous build's vectors
+        previous_rows, previous_vectors = self.load_previous_vectors()
+
+        print(f"[INFO] Fetching {len(pages) - progress['pages_done']} pages from {DOCS_BASE_URL} "
+              f"({FETCH_WORKERS} workers), parsing with {self.parse_backend} ({PARSE_WORKERS} workers), "
+              f"embedding in batches of {EMBED_BATCH_SIZE} ({EMBED_WORKERS} workers)")
+        start = time.perf_counter()
+        # Worker processes (EMBED_WORKERS > 1) live for the length of the stream
+        with self.embedder:
+            batch = []
+            for chunk, page_index, chunk_index, is_last in self.stream_chunks(pages, progress['pages_done'], progress['page_chunks_done']):
+                batch.append(chunk)
+                if len(batch) < EMBED_BATCH_SIZE:
+                    continue
+                embeddings, reused = self.embed_batch(batch, previous_rows, previous_vectors)
+                if is_last:
+                    staging.commit(batch, embeddings, page_index + 1, 0, reused)
+                else:
+                    staging.commit(batch, embeddings, page_index, chunk_index + 1, reused)
+                print(f"  [BATCH] {progress['batches']} committed: {staging.count} chunks ({reused} of {len(batch)} reused)")
+                batch = []
+
+            if batch:
+                embeddings, reused = self.embed_batch(batch, previous_rows, previous_vectors)
+            else:
+                embeddings, reused = np.empty((0, staging.dim or 0), dtype=np.float32), 0
+            staging.commit(batch, embeddings, len(pages), 0, reused)
+        # Drop the memory map of the previous generation so it can be deleted later
+        # (Windows keeps mapped files locked)
+        del previous_vectors
+
+        print(f"\n[INFO] Fetch summary: {self.fetcher.stats()}")
+        if staging.count == 0:
+            staging.clear()
             print("\n[ERROR] No content extracted. Check internet connection.")
             return
 
+        seconds = time.perf_counter() - start
+        # The IVF quantizer was trained on the previous build, so only chunks
+        # carried over from it count as unchanged
+        unchanged = sum(1 for chunk in staging.iter_chunks() if chunk["hash"] in previous_rows)
+        self.changed_fraction = 1 - unchanged / staging.count
         print(f"\n{'='*60}")
-        print(f"[INFO] Total chunks: {len(all_chunks)}")
-        print("[INFO] Creating embeddings...")
+        print(f"[INFO] Total chunks: {staging.count} ({progress['reused']} reused from the embedding cache "
+              f"or the previous build, {staging.count - progress['reused']} embedded)")
+        if self.embedding_store is not None:
+            print(f"[INFO] Embedding cache: {self.embedding_store.stats()}")
+        print(f"[INFO] Encoder: {self.embedder.stats()}")
+        print(f"[INFO] Streamed in {seconds:.1f}s")
         print(f"{'='*60}\n")
 
-        # Create embeddings
-        texts = [chunk["text"] for chunk in all_chunks]
-        print(f"Embedding {len(texts)} documents...")
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True)
-
-        # Save as NumPy array
-        embeddings_file = self.db_path / "embeddings.npy"
-        np.save(embeddings_file, embeddings)
-        print(f"\n[OK] Embeddings saved: {embeddings_file}")
-
-        # Save metadata
-        metadata_file = self.db_path / "metadata.pkl"
-        with open(metadata_file, 'wb') as f:
-            pickle.dump(all_chunks, f)
-        print(f"[OK] Metadata saved: {metadata_file}")
-
-        # Save JSON metadata for Rust Tier 2 loader
-        metadata_json_file = self.db_path / "metadata.json"
-        with open(metadata_json_file, 'w', encoding='utf-8') as f:
-            json.dump(all_chunks, f, ensure_ascii=False)
-        print(f"[OK] Metadata JSON saved: {metadata_json_file}")
+        generation = self.write_shard(staging)
+        self.write_module_summary(pages, staging, generation)
+        self.publish(generation)
+
+        # Build finished: the next one starts fresh and revalidates every page
+        staging.clear()
+        self.fetcher.state.clear()
 
         print(f"\n{'='*60}")
-        print(f"[OK] Built knowledge base with {len(all_chunks)} documents")
+        print(f"[OK] Built knowledge base with {staging.count} documents")
         print(f"{'='*60}")
-        print(f"\n[INFO] Database location: {self.db_path}")
+        print(f"\n[INFO] Database location: {generation}")
         print("\n[INFO] Next steps:")
         print("  1. Start server: python server.py")
+        print(f"     (requests with blender_version={BLENDER_VERSION} use this shard)")
         print("  2. Open Blender and use the addon")
         print()
 
+    def write_shard(self, staging):
+        """
+        Write the shard files from the staging area into a new generation directory.
+
+        Files are written one block or chunk at a time. The generation is not
+        used until publish(); a failed write removes it again.
+
+        Returns:
+            Path of the generation directory.
+        """
+        generation = new_generation(self.db_path)
+        print(f"[INFO] Writing generation {generation.name}")
+        try:
+            self._write_shard_files(staging, generation)
+        except BaseException:
+            shutil.rmtree(generation, ignore_errors=True)
+            raise
+        return generation
+
+    def _write_shard_files(self, staging, generation):
+        count, dim = staging.count, staging.dim
+
+        if BUILD_NUMPY_EMBEDDINGS:
+            embeddings_file = generation / "embeddings.npy"
+            tmp_file = generation / "embeddings.tmp.npy"
+            out = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.float32, shape=(count, dim))
+            offset = 0
+            for block in staging.iter_vector_blocks():
+                out[offset:offset + len(block)] = block
+                offset += len(block)
+            out.flush()
+            del out
+            os.replace(tmp_file, embeddings_file)
+            print(f"[OK] Embeddings saved: {embeddings_file}")
+
+        # Save normalized, memory-mappable index for the server
+        index_file = generation / INDEX_FILENAME
+        header = write_index_blocks(index_file, staging.iter_vector_blocks(), count, dim, EMBEDDING_MODEL_NAME)
+        print(f"[OK] Vector index saved: {index_file} ({header['count']} x {header['dim']}, {header['checksum'][:19]})")
+
+        self.build_ann_index(index_file, generation)
+
+        # Save BM25 inverted index for hybrid retrieval
+        bm25_file = generation / BM25_FILENAME
+        lexical_index = BM25Index.build(staging.iter_chunks())
+        lexical_index.save(bm25_file)
+        print(f"[OK] BM25 index saved: {bm25_file} ({len(lexical_index.terms)} terms, {len(lexical_index.doc_ids)} postings)")
+        del lexical_index
+
+        # Pickle needs the whole list in memory, so it is opt-in; both the
+        # server and the Rust loader read metadata.json first
+        if BUILD_PICKLE_METADATA:
+            metadata_file = generation / "metadata.pkl"
+            with open(metadata_file, 'wb') as f:
+                pickle.dump(list(staging.iter_chunks()), f)
+            print(f"[OK] Metadata saved: {metadata_file}")
+
+        # Save JSON metadata for the Rust Tier 2 loader (src-tauri/src/rag/index.rs),
+        # which reads it from the current generation of the newest shard
+        metadata_json_file = generation / "metadata.json"
+        write_chunks_json(metadata_json_file, staging.iter_chunks())
+        print(f"[OK] Metadata JSON saved: {metadata_json_file}")
+
+        # Save SQLite knowledge store (server reads only the rows it returns)
+        store_file = generation / STORE_FILENAME
+        vectors = staging.vectors()
+        write_store(store_file, staging.iter_chunks(), vectors, EMBEDDING_MODEL_NAME, header['checksum'])
+        del vectors
+        print(f"[OK] Knowledge store saved: {store_file}")
+
+    def publish(self, generation):
+        """Point the shard at generation and delete generations no longer needed."""
+        publish_generation(self.db_path, generation)
+        print(f"[OK] Shard {BLENDER_VERSION} now serves {generation.name} (POST /admin/reload to load it)")
+
+        removed, in_use = remove_old_generations(self.db_path, KEEP_GENERATIONS)
+        removed += remove_legacy_files(self.db_path, SHARD_FILES)
+        if removed:
+            print(f"[INFO] Removed old files: {', '.join(removed)}")
+        if in_use:
+            print(f"[INFO] Still in use, removed by a later build: {', '.join(in_use)}")
+
+    def write_module_summary(self, pages, staging, generation):
+        """Print and save pages and chunks per module."""
+        summary = module_summary(pages, staging.iter_chunks())
+        print(f"\n[INFO] Coverage: {summary['pages']} pages, {summary['chunks']} chunks")
+        for module, counts in summary['modules'].items():
+            empty = f" ({counts['empty_pages']} without chunks)" if counts['empty_pages'] else ""
+            print(f"  {module:<24} {counts['pages']:>5} pages {counts['chunks']:>7} chunks{empty}")
+
+        summary_file = generation / MODULE_SUMMARY_FILENAME
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"[OK] Module summary saved: {summary_file}")
+
+    def gc_embedding_cache(self):
+        """Remove embedding cache entries that no shard on disk references."""
+        if self.embedding_store is None:
+            print("[ERROR] Embedding cache is disabled (EMBEDDING_CACHE_PATH is empty)")
+            return
+
+        def live_keys():
+            for shard_path in [DB_PATH] + sorted(p for p in DB_PATH.iterdir() if p.is_dir()):
+                generation = current_generation(shard_path)
+                index_file = generation / INDEX_FILENAME
+                metadata_json_file = generation / "metadata.json"
+                if not index_file.exists() or not metadata_json_file.exists():
+                    continue
+                model = read_header(index_file)['model']
+                print(f"  [SHARD] {shard_path.name} ({model})")
+                for chunk in iter_chunks_json(metadata_json_file):
+                    yield model, chunk.get("hash") or chunk_hash(chunk["text"])
+
+        print(f"[INFO] Collecting chunk hashes of every shard in {DB_PATH}...")
+        removed, kept = self.embedding_store.gc(live_keys())
+        print(f"[OK] Embedding cache: removed {removed} unreferenced entries, {kept} kept ({EMBEDDING_CACHE_PATH})")
+
+    def report_embed_throughput(self):
+        """Time the embedding stage per worker count on chunks of the current shard."""
+        metadata_json_file = current_generation(self.db_path) / "metadata.json"
+        if not metadata_json_file.exists():
+            print(f"[ERROR] No shard at {self.db_path}, build it first")
+            return
+
+        texts = []
+        for chunk in iter_chunks_json(metadata_json_file):
+            texts.append(chunk["text"])
+            if len(texts) >= EMBED_REPORT_DOCS:
+                break
+        print(f"[INFO] Embedding {len(texts)} chunks per configuration...")
+        report = embed_report(self.embedding_model, EMBEDDING_MODEL_NAME, texts, batch_size=EMBED_MODEL_BATCH)
+
+        print(f"\n[INFO] Embedding throughput: {report['docs']} chunks, {report['cpus']} CPUs, {report['model']}")
+        for run in report['runs']:
+            order = "length-sorted" if run['length_sorted'] else "input order  "
+            print(f"  workers={run['workers']:<3} {order} {run['docs_per_second']} docs/s  "
+                  f"padding efficiency {run['padding_efficiency']}")
+
+        report_file = self.db_path / EMBED_REPORT_FILENAME
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] Embedding report saved: {report_file}")
+
+    def report_parse_throughput(self):
+        """Time every installed parser backend per worker count on the docs pages."""
+        print(f"[INFO] Loading {len(API_PAGES)} pages for the parse report...")
+        pages = list(self.fetcher.fetch_all(API_PAGES))
+        report = parse_report(pages, repeat=PARSE_REPORT_REPEAT)
+
+        print(f"\n[INFO] Parse throughput: {report['pages']} pages, {report['megabytes']} MB, {report['cpus']} CPUs")
+        for backend, result in report['backends'].items():
+            status = "identical chunks" if result['identical'] else f"{len(result['mismatched_pages'])} pages differ"
+            print(f"  {backend} ({result['chunks']} chunks, {status})")
+            for run in result['runs']:
+                print(f"    workers={run['workers']:<3} {run['pages_per_second']} pages/s  {run['mb_per_second']} MB/s")
+            for url_path in result['mismatched_pages']:
+                print(f"    [WARN] differs from {DEFAULT_BACKEND}: {url_path}")
+
+        report_file = self.db_path / PARSE_REPORT_FILENAME
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] Parse report saved: {report_file}")
+
+    def build_ann_index(self, index_file, generation):
+        """Build the IVF index next to the vector index and report its recall."""
+        ivf_file = generation / IVF_FILENAME
+        previous_ivf_file = current_generation(self.db_path) / IVF_FILENAME
+        vectors, header = load_index(index_file)
+
+        if BUILD_ANN_INDEX == "0" or (BUILD_ANN_INDEX == "auto" and header['count'] < ANN_MIN_DOCS):
+            print(f"[INFO] Skipping ANN index ({header['count']} docs, exact search is fast enough)")
+            return
+
+        centroids = None
+        if previous_ivf_file.exists() and self.changed_fraction <= ANN_RETRAIN_FRACTION:
+            try:
+                centroids = IVFIndex.load(previous_ivf_file).centroids
+            except Exception as e:
+                print(f"[WARN] Could not reuse previous IVF centroids: {e}")
+            if centroids is not None and centroids.shape[1] != header['dim']:
+                centroids = None
+
+        print(f"\n[INFO] Building IVF index over {header['count']} vectors"
+              f"{' (reusing centroids)' if centroids is not None else ''}...")
+        start = time.perf_counter()
+        ivf = IVFIndex.build(vectors, n_lists=ANN_LISTS, index_checksum=header['checksum'], centroids=centroids)
+        ivf.save(ivf_file)
+        print(f"[OK] IVF index saved: {ivf_file} ({ivf.n_lists} lists, {time.perf_counter() - start:.1f}s)")
+
+        report = recall_report(vectors, ivf, sample_queries(vectors), k=10)
+        write_report(generation / IVF_REPORT_FILENAME, report)
+        print(f"[INFO] Exact scan: {report['exact_ms_per_query']} ms/query")
+        for row in report['ivf']:
+            print(f"  n_probe={row['n_probe']:<3} recall@10={row['recall_at_10']:.3f}  {row['ms_per_query']} ms/query")
+
 
 def main():
-    indexer = BlenderDocsIndexer()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the Blender API knowledge base")
+    parser.add_argument('--export-onnx', action='store_true',
+                        help="Export the embedding model to ONNX for the torch-free server encoder and exit")
+    parser.add_argument('--full', action='store_true',
+                        help="Re-embed every chunk instead of reusing vectors from the previous build")
+    parser.add_argument('--gc-embeddings', action='store_true',
+                        help="Remove embedding cache entries that no shard references and exit")
+    parser.add_argument('--embed-report', action='store_true',
+                        help="Measure embedding throughput per worker count on the current shard and exit")
+    parser.add_argument('--parse-report', action='store_true',
+                        help="Measure parse throughput per backend and worker count and exit")
+    args = parser.parse_args()
+
+    if args.gc_embeddings:
+        BlenderDocsIndexer(load_model=False).gc_embedding_cache()
+        return
+
+    if args.embed_report:
+        BlenderDocsIndexer().report_embed_throughput()
+        return
+
+    if args.parse_report:
+        BlenderDocsIndexer(load_model=False, track_crawl=False).report_parse_throughput()
+        return
+
+    if args.export_onnx:
+        from encoders import compare_backends, export_onnx
+        out_dir = export_onnx(EMBEDDING_MODEL_NAME)
+        print(f"[OK] ONNX encoder exported: {out_dir}")
+        print(json.dumps(compare_backends(EMBEDDING_MODEL_NAME), indent=2))
+        print("\n[INFO] Start the server with BLENDER_HELPER_ENCODER=onnx to use it")
+        return
+
+    indexer = BlenderDocsIndexer(full_rebuild=args.full)
     indexer.build_database()
 
 
@@ -0,0 +1,163 @@
+"""
+Build Staging for Blender Helper AI
+
+Append-only work area that build_database.py streams a build into, so peak
+memory stays flat however large the corpus is and an interrupted build can
+resume:
+- chunks.jsonl: one chunk dict per line
+- vectors.f32: normalized float32 rows, in the same order
+- progress.json: what has been committed (pages, chunks, byte lengths)
+
+A batch is committed by appending to both data files, flushing them to
+disk and then atomically replacing progress.json. On resume the data files
+are truncated back to the committed lengths, so a batch that was only
+partly written when the build died is redone from scratch.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+STAGING_DIRNAME = ".build"
+STAGING_FORMAT_VERSION = 1
+
+
+class BuildStaging:
+    """Committed-batch log of chunks and vectors for one shard build."""
+
+    def __init__(self, path, fingerprint):
+        """
+        Open the staging area at path.
+
+        fingerprint identifies the build (version, source, model, page list).
+        Committed work is only resumed when it matches; otherwise the area is
+        wiped and the build starts over.
+        """
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.chunks_file = self.path / "chunks.jsonl"
+        self.vectors_file = self.path / "vectors.f32"
+        self.progress_file = self.path / "progress.json"
+        self.resumed = False
+
+        progress = None
+        if self.progress_file.exists():
+            try:
+                progress = json.loads(self.progress_file.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                progress = None
+
+        if (progress is not None
+                and progress.get('format_version') == STAGING_FORMAT_VERSION
+                and progress.get('fingerprint') == fingerprint
+                and self._truncate(progress)):
+            self.progress = progress
+            self.resumed = progress['chunks'] > 0
+        else:
+            self.reset()
+
+    def _truncate(self, progress):
+        """Cut both data files back to their committed lengths; False if they are too short."""
+        for file, length in ((self.chunks_file, progress['chunks_bytes']), (self.vectors_file, progress['vectors_bytes'])):
+            if not file.exists() or file.stat().st_size < length:
+                return False
+            with open(file, 'r+b') as f:
+                f.truncate(length)
+        return True
+
+    def reset(self):
+        """Discard everything and start an empty staging area."""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        self.chunks_file.touch()
+        self.vectors_file.touch()
+        self.progress = {
+            'format_version': STAGING_FORMAT_VERSION,
+            'fingerprint': self.fingerprint,
+            'pages_done': 0,
+            'page_chunks_done': 0,
+            'chunks': 0,
+            'batches': 0,
+            'reused': 0,
+            'dim': None,
+            'chunks_bytes': 0,
+            'vectors_bytes': 0,
+        }
+        self._write_progress()
+        self.resumed = False
+
+    def _write_progress(self):
+        tmp_file = self.progress_file.with_name(self.progress_file.name + ".tmp")
+        tmp_file.write_text(json.dumps(self.progress, indent=2), encoding='utf-8')
+        os.replace(tmp_file, self.progress_file)
+
+    @property
+    def count(self):
+        return self.progress['chunks']
+
+    @property
+    def dim(self):
+        return self.progress['dim']
+
+    def commit(self, chunks, vectors, pages_done, page_chunks_done, reused=0):
+        """
+        Append one batch and record it as committed.
+
+        pages_done / page_chunks_done say where the page stream stands after
+        this batch: pages_done leading pages are fully stored, plus
+        page_chunks_done chunks of the next one.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(chunks) != vectors.shape[0]:
+            raise ValueError(f"{len(chunks)} chunks but {vectors.shape[0]} vectors")
+        if self.dim is not None and len(chunks) and vectors.shape[1] != self.dim:
+            raise ValueError(f"Batch has dimension {vectors.shape[1]}, staging has {self.dim}")
+
+        with open(self.chunks_file, 'ab') as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            chunks_bytes = f.tell()
+        with open(self.vectors_file, 'ab') as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            vectors_bytes = f.tell()
+
+        if len(chunks):
+            self.progress['dim'] = int(vectors.shape[1])
+        self.progress['chunks'] += len(chunks)
+        self.progress['batches'] += 1
+        self.progress['reused'] += reused
+        self.progress['pages_done'] = pages_done
+        self.progress['page_chunks_done'] = page_chunks_done
+        self.progress['chunks_bytes'] = chunks_bytes
+        self.progress['vectors_bytes'] = vectors_bytes
+        self._write_progress()
+
+    def iter_chunks(self):
+        """Committed chunks in order, read one line at a time."""
+        with open(self.chunks_file, 'r', encoding='utf-8') as f:
+            for _ in range(self.count):
+                yield json.loads(f.readline())
+
+    def vectors(self):
+        """Committed vectors as a read-only (count, dim) memory map."""
+        if self.count == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+
+    def iter_vector_blocks(self, block_rows=65_536):
+        vectors = self.vectors()
+        for start in range(0, self.count, block_rows):
+            yield np.asarray(vectors[start:start + block_rows])
+
+    def clear(self):
+        """Remove the staging area once the shard files are written."""
+        if self.path.exists():
+            shutil.rmtree(self.path)
@@ -0,0 +1,598 @@
+"""
+Caches for Blender Helper AI
+
+Small, dependency-free building blocks shared by the RAG server:
+- LRUCache: bounded in-memory cache with optional TTL and hit/miss counters
+- PersistentStore: SQLite key -> blob table that survives restarts
+- QueryEmbeddingCache: query text -> embedding vector, built on the two above
+- EmbeddingStore: (model, chunk hash) -> embedding, shared by every build
+- AnswerCache: /ask request fingerprint -> generated answer
+- SemanticAnswerCache: question embedding -> answer, for rephrased questions
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, max_entries, ttl_seconds=None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Insert or refresh key, evicting the least recently used entries."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry but keep the counters."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate; returns how many."""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Counters for /health."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class PersistentStore:
+    """
+    SQLite-backed key -> blob store.
+
+    Entries older than the newest max_entries (by last write) are pruned
+    periodically so the file stays bounded.
+    """
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path, table="entries", max_entries=100_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the stored blob for key, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, value):
+        """Insert or replace key."""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(value), time.time()),
+            )
+            self._conn.commit()
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= self.PRUNE_EVERY:
+                self._prune_locked()
+
+    def get_many(self, keys, batch_size=500):
+        """Return {key: blob} for the keys that are stored."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", batch
+                ).fetchall())
+        return found
+
+    def put_many(self, items):
+        """Insert or replace (key, blob) pairs in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                [(key, sqlite3.Binary(value), now) for key, value in items],
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def retain(self, keys):
+        """Delete every entry whose key is not in keys and compact the file; returns how many."""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS retained (key TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM retained")
+            self._conn.executemany("INSERT OR IGNORE INTO retained (key) VALUES (?)", ((key,) for key in keys))
+            removed = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key NOT IN (SELECT key FROM retained)"
+            ).rowcount
+            self._conn.execute("DROP TABLE retained")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            return removed
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _prune_locked(self):
+        self._puts_since_prune = 0
+        if not self.max_entries:
+            return
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key NOT IN ("
+            f"SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query_text(text):
+    """
+    Canonical form of a query for cache keys.
+
+    all-MiniLM-L6-v2 uses an uncased tokenizer that also ignores runs of
+    whitespace, so lowercasing and collapsing whitespace does not change the
+    embedding.
+    """
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded query text -> embedding cache with optional on-disk persistence.
+
+    Lookups check the in-memory LRU first, then the persistent store (if any),
+    promoting disk hits back into memory.
+    """
+
+    def __init__(self, model_name, max_entries=1024, persist_path=None):
+        self.model_name = model_name
+        self.memory = LRUCache(max_entries)
+        self.store = PersistentStore(persist_path, table="query_embeddings") if persist_path else None
+        self.disk_hits = 0
+
+    @property
+    def enabled(self):
+        return self.memory.enabled
+
+    def _key(self, query):
+        return f"{self.model_name}\x00{normalize_query_text(query)}"
+
+    def get(self, query):
+        """Return the cached embedding for query, or None."""
+        if not self.enabled:
+            return None
+        key = self._key(query)
+        vector = self.memory.get(key)
+        if vector is not None or self.store is None:
+            return vector
+
+        blob = self.store.get(key)
+        if blob is None:
+            return None
+        vector = np.frombuffer(blob, dtype=np.float32)
+        self.memory.put(key, vector)
+        self.disk_hits += 1
+        return vector
+
+    def put(self, query, vector):
+        """Remember the embedding for query."""
+        if not self.enabled:
+            return
+        key = self._key(query)
+        vector = np.asarray(vector, dtype=np.float32)
+        self.memory.put(key, vector)
+        if self.store is not None:
+            self.store.put(key, vector.tobytes())
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['persistent'] = self.store is not None
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+
+class EmbeddingStore:
+    """
+    Persistent (embedding model, chunk hash) -> normalized embedding store.
+
+    Shared by the builds of every Blender version, so text that is the same
+    across versions is only encoded once. Entries are never pruned by age;
+    gc() removes the ones no live index references.
+    """
+
+    def __init__(self, path, model_name):
+        self.model_name = model_name
+        self.store = PersistentStore(path, table="chunk_embeddings", max_entries=0)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _key(self, text_hash, model_name=None):
+        return f"{model_name or self.model_name}\x00{text_hash}"
+
+    def get_many(self, hashes):
+        """Return {hash: vector} for the hashes that are stored."""
+        hashes = list(hashes)
+        blobs = self.store.get_many(self._key(h) for h in hashes)
+        found = {}
+        for h in hashes:
+            blob = blobs.get(self._key(h))
+            if blob is not None:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, vectors):
+        """Store {hash: vector}."""
+        if not vectors:
+            return
+        self.store.put_many(
+            (self._key(h), np.asarray(v, dtype=np.float32).tobytes()) for h, v in vectors.items()
+        )
+        self.writes += len(vectors)
+
+    def gc(self, live):
+        """
+        Drop every entry not in live, an iterable of (model name, hash).
+
+        Returns:
+            (entries removed, entries kept)
+        """
+        removed = self.store.retain(self._key(h, model_name) for model_name, h in live)
+        return removed, len(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def stats(self):
+        return {
+            'entries': len(self.store),
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+        }
+
+    def close(self):
+        self.store.close()
+
+
+def answer_cache_key(question, scene_fields, model, temperature, context_ids):
+    """
+    Fingerprint of everything that shapes an /ask answer.
+
+    scene_fields are the scene values the prompt includes (None without a
+    scene); context_ids identify the retrieved chunks, in rank order.
+    """
+    fingerprint = json.dumps([
+        normalize_query_text(question),
+        scene_fields,
+        model,
+        temperature,
+        list(context_ids),
+    ], sort_keys=True, default=str)
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    Bounded answer cache with a TTL and optional on-disk persistence.
+
+    Works like QueryEmbeddingCache: memory first, then the persistent store,
+    with disk hits promoted into memory. Disk entries carry their write time,
+    so the TTL also holds across restarts.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=None, persist_path=None):
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+        self.store = (
+            PersistentStore(persist_path, table="answers", max_entries=max(1, max_entries) * 16)
+            if persist_path else None
+        )
+        self.disk_hits = 0
+
+    @property
+    def enabled(self):
+        return self.memory.enabled
+
+    def get(self, key):
+        """Return the cached answer for key, or None."""
+        if not self.enabled:
+            return None
+        answer = self.memory.get(key)
+        if answer is not None or self.store is None:
+            return answer
+
+        blob = self.store.get(key)
+        if blob is None:
+            return None
+        entry = json.loads(blob)
+        if self.ttl_seconds is not None and time.time() - entry['stored_at'] > self.ttl_seconds:
+            self.store.delete(key)
+            return None
+        self.memory.put(key, entry['answer'])
+        self.disk_hits += 1
+        return entry['answer']
+
+    def put(self, key, answer):
+        """Remember the answer for key."""
+        if not self.enabled:
+            return
+        self.memory.put(key, answer)
+        if self.store is not None:
+            entry = {'answer': answer, 'stored_at': time.time()}
+            self.store.put(key, json.dumps(entry).encode('utf-8'))
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['persistent'] = self.store is not None
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+
+class SemanticAnswerCache:
+    """
+    Answers to earlier questions, found again by question embedding.
+
+    A lookup matches the most similar stored question in the same partition
+    (model, knowledge base, scene class) if its cosine similarity reaches the
+    threshold. Embeddings live in one preallocated (max_entries, dim) matrix,
+    so a lookup is a single matrix-vector product; at these sizes that is
+    faster than an approximate index. When full, the least recently used
+    entry is replaced.
+
+    Recent hits are kept for review: forget() drops an answer that was
+    served for the wrong question and counts it as a false hit.
+    """
+
+    def __init__(self, max_entries=1024, threshold=0.92, review_size=200):
+        self.max_entries = max(0, int(max_entries))
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._vectors = None
+        # Partition code per slot; -1 marks a free slot
+        self._codes = np.full(self.max_entries, -1, dtype=np.int64)
+        # partition -> code, code -> partition and live entries per code.
+        # A partition is dropped with its last entry, so there are never more
+        # than max_entries of them
+        self._partitions = {}
+        self._partition_of = {}
+        self._partition_sizes = {}
+        self._next_code = 0
+        self._entries = [None] * self.max_entries
+        self._slot_of = {}
+        self._lru = OrderedDict()
+        self._next_id = 1
+        self.recent_hits = deque(maxlen=review_size)
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.false_hits = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _best_locked(self, vector, partition):
+        code = self._partitions.get(partition)
+        if self._vectors is None or code is None or self._vectors.shape[1] != vector.shape[0]:
+            return None, 0.0
+        scores = self._vectors @ vector
+        scores[self._codes != code] = -np.inf
+        slot = int(np.argmax(scores))
+        if not np.isfinite(scores[slot]):
+            return None, 0.0
+        return slot, float(scores[slot])
+
+    def lookup(self, vector, partition, question=None):
+        """
+        Stored entry for the question closest to vector, or None.
+
+        Returns a dict with id, question, answer and similarity.
+        """
+        if not self.enabled:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self.lookups += 1
+            slot, similarity = self._best_locked(vector, partition)
+            if slot is None or similarity < self.threshold:
+                return None
+            entry = self._entries[slot]
+            entry['hits'] += 1
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            self.recent_hits.append({
+                'id': entry['id'],
+                'question': question,
+                'matched_question': entry['question'],
+                'similarity': round(similarity, 4),
+                'partition': list(partition),
+                'at': time.time(),
+            })
+            return {
+                'id': entry['id'],
+                'question': entry['question'],
+                'answer': entry['answer'],
+                'similarity': similarity,
+            }
+
+    def put(self, vector, partition, question, answer):
+        """Store answer for question; a near-identical stored question is replaced."""
+        if not self.enabled:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._codes[:] = -1
+                self._entries = [None] * self.max_entries
+                self._slot_of.clear()
+                self._lru.clear()
+                self._partitions.clear()
+                self._partition_of.clear()
+                self._partition_sizes.clear()
+
+            slot, similarity = self._best_locked(vector, partition)
+            if slot is not None and similarity >= 0.999:
+                self._drop_locked(slot)
+            elif len(self._lru) >= self.max_entries:
+                slot, _ = self._lru.popitem(last=False)
+                self._drop_locked(slot)
+                self.evictions += 1
+            else:
+                slot = int(np.flatnonzero(self._codes == -1)[0])
+
+            code = self._partitions.get(partition)
+            if code is None:
+                code = self._next_code
+                self._next_code += 1
+                self._partitions[partition] = code
+                self._partition_of[code] = partition
+                self._partition_sizes[code] = 0
+            self._partition_sizes[code] += 1
+            entry_id = self._next_id
+            self._next_id += 1
+            self._vectors[slot] = vector
+            self._codes[slot] = code
+            self._entries[slot] = {
+                'id': entry_id,
+                'question': question,
+                'answer': answer,
+                'stored_at': time.time(),
+                'hits': 0,
+            }
+            self._slot_of[entry_id] = slot
+            self._lru[slot] = None
+
+    def _drop_locked(self, slot):
+        entry = self._entries[slot]
+        if entry is not None:
+            self._slot_of.pop(entry['id'], None)
+            code = int(self._codes[slot])
+            self._partition_sizes[code] -= 1
+            if not self._partition_sizes[code]:
+                del self._partition_sizes[code]
+                del self._partitions[self._partition_of.pop(code)]
+        self._entries[slot] = None
+        self._codes[slot] = -1
+        self._lru.pop(slot, None)
+
+    def forget(self, entry_id, false_hit=True):
+        """Drop an entry (e.g. one served for the wrong question); False if it is gone already."""
+        with self._lock:
+            slot = self._slot_of.get(entry_id)
+            if slot is None:
+                return False
+            self._drop_locked(slot)
+            if false_hit:
+                self.false_hits += 1
+            return True
+
+    def review(self, limit=50):
+        """Most recent hits first, for checking that matched questions really are the same."""
+        with self._lock:
+            return list(reversed(self.recent_hits))[:limit]
+
+    def __len__(self):
+        return len(self._lru)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._lru),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'partitions': len(self._partitions),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_ratio': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'evictions': self.evictions,
+                'false_hits': self.false_hits,
+            }
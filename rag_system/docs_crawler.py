@@ -0,0 +1,174 @@
+"""
+Docs Crawler for Blender Helper AI
+
+Discovers the pages build_database.py indexes by following links from the
+API index (index.html), instead of a fixed list:
+- breadth-first from the seed pages, up to max_depth links away
+- include / exclude glob patterns on page names (e.g. "bpy.types.*Node*")
+- a cap on the number of pages, nearest pages first
+
+Pages are fetched through DocsFetcher, so they land in the docs cache and
+the build that follows reads them from there instead of downloading again.
+Only pages closer than max_depth are fetched during discovery; the pages at
+max_depth are just listed.
+
+Also summarises a build per module (pages and chunks), for checking that
+areas like geometry nodes or bmesh are actually covered.
+"""
+
+import posixpath
+import re
+from collections import Counter
+from fnmatch import fnmatchcase
+
+MODULE_SUMMARY_FILENAME = "module_summary.json"
+
+# Sphinx writes every internal link as a double-quoted relative href
+_HREF_RE = re.compile(r'href="([^"#?:]+\.html)(?:[#?][^"]*)?"')
+
+
+def page_name(url_path):
+    """bpy.types.Object for /bpy.types.Object.html."""
+    name = posixpath.basename(url_path)
+    return name[:-len(".html")] if name.endswith(".html") else name
+
+
+def page_module(url_path):
+    """
+    Module a page belongs to, for summaries.
+
+    The first two dotted parts of the page name (bpy.types, bpy.ops,
+    bmesh.ops, mathutils); info_* and other guide pages group as "info".
+    """
+    name = page_name(url_path)
+    if "." not in name:
+        return "info" if name.startswith("info_") else name
+    return ".".join(name.split(".")[:2])
+
+
+def link_paths(html, url_path):
+    """Internal .html pages linked from html, as url_paths relative to the docs root."""
+    base_dir = posixpath.dirname(url_path)
+    paths = []
+    seen = set()
+    for match in _HREF_RE.finditer(html):
+        href = match.group(1)
+        path = posixpath.normpath(posixpath.join(base_dir, href)) if not href.startswith("/") else href
+        if path.startswith("/..") or path in seen:
+            continue
+        seen.add(path)
+        paths.append(path)
+    return paths
+
+
+class PageFilter:
+    """Include / exclude glob patterns matched against page names."""
+
+    def __init__(self, include=(), exclude=()):
+        self.include = [p for p in include if p]
+        self.exclude = [p for p in exclude if p]
+
+    def excluded(self, url_path):
+        name = page_name(url_path)
+        return any(fnmatchcase(name, p) for p in self.exclude)
+
+    def included(self, url_path):
+        name = page_name(url_path)
+        if self.excluded(url_path):
+            return False
+        return not self.include or any(fnmatchcase(name, p) for p in self.include)
+
+
+class DocsCrawler:
+    """
+    Breadth-first page discovery over a DocsFetcher.
+
+    Excluded pages are neither indexed nor followed. Pages that fail the
+    include patterns are still followed (hub pages such as bpy.types.html
+    lead to the included ones) but not indexed.
+    """
+
+    def __init__(self, fetcher, seeds=("/index.html",), include=(), exclude=(), max_depth=2, max_pages=4000):
+        self.fetcher = fetcher
+        self.seeds = list(seeds)
+        self.filter = PageFilter(include, exclude)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.counts = Counter()
+
+    def discover(self):
+        """
+        Pages to index, sorted by path.
+
+        Returns an empty list if none of the seed pages could be fetched.
+        """
+        depth_of = {}
+        frontier = []
+        for seed in self.seeds:
+            if seed not in depth_of and not self.filter.excluded(seed):
+                depth_of[seed] = 0
+                frontier.append(seed)
+
+        pages = []
+        depth = 0
+        while frontier:
+            for url_path in frontier:
+                if self.filter.included(url_path) and len(pages) < self.max_pages:
+                    pages.append(url_path)
+                elif self.filter.included(url_path):
+                    self.counts['over_max_pages'] += 1
+                else:
+                    self.counts['not_included'] += 1
+            if depth >= self.max_depth or len(pages) >= self.max_pages:
+                break
+
+            next_frontier = []
+            for url_path, html in self.fetcher.fetch_all(frontier):
+                if not html:
+                    self.counts['failed'] += 1
+                    continue
+                self.counts['followed'] += 1
+                for link in link_paths(html, url_path):
+                    if link in depth_of:
+                        continue
+                    if self.filter.excluded(link):
+                        self.counts['excluded'] += 1
+                        depth_of[link] = None
+                        continue
+                    depth_of[link] = depth + 1
+                    next_frontier.append(link)
+            frontier = next_frontier
+            depth += 1
+
+        if self.counts['failed'] and not self.counts['followed']:
+            return []
+        self.counts['discovered'] = sum(1 for d in depth_of.values() if d is not None)
+        self.counts['indexed'] = len(pages)
+        return sorted(pages)
+
+    def stats(self):
+        return dict(self.counts, max_depth=self.max_depth, max_pages=self.max_pages)
+
+
+def module_summary(pages, chunks):
+    """
+    Pages and chunks per module.
+
+    pages is the page list of a build, chunks any iterable of its chunks.
+    Pages that produced no chunks are counted separately, since they usually
+    mean an index page or markup the parser does not recognise.
+    """
+    chunks_per_page = Counter(chunk['url'] for chunk in chunks)
+    modules = {}
+    for url_path in pages:
+        module = modules.setdefault(page_module(url_path), {'pages': 0, 'chunks': 0, 'empty_pages': 0})
+        module['pages'] += 1
+        module['chunks'] += chunks_per_page[url_path]
+        if not chunks_per_page[url_path]:
+            module['empty_pages'] += 1
+    modules = dict(sorted(modules.items(), key=lambda item: (-item[1]['chunks'], item[0])))
+    return {
+        'pages': len(pages),
+        'chunks': sum(chunks_per_page.values()),
+        'modules': modules,
+    }
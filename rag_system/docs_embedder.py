@@ -0,0 +1,181 @@
+"""
+Docs Embedder for Blender Helper AI
+
+Embedding stage for build_database.py:
+- texts are ordered by token length and cut into batches of similar length,
+  so short attribute docs are not padded to the length of code examples
+- batches run in the build process or in worker processes that each load
+  the model, and the vectors come back in the original order
+- throughput counters (docs/second, padding efficiency) for sizing build
+  machines, plus embed_report to compare worker counts
+
+Padding efficiency is real tokens / tokens actually computed: 1.0 means no
+padding at all.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+EMBED_REPORT_FILENAME = "embed_report.json"
+
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_job(texts):
+    return np.asarray(_worker_model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+
+
+def token_lengths(model, texts):
+    """
+    Token count of each text as the model sees it (truncated to its max length).
+
+    Falls back to a characters / 4 estimate when the model has no tokenizer.
+    """
+    tokenizer = getattr(model, 'tokenizer', None)
+    max_length = getattr(model, 'max_seq_length', None) or 512
+    if tokenizer is None:
+        return np.array([min(max_length, len(text) // 4 + 2) for text in texts], dtype=np.int64)
+    encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+    return np.array([len(ids) for ids in encoded['input_ids']], dtype=np.int64)
+
+
+def padded_tokens(lengths, batches):
+    """Tokens computed when every batch is padded to its longest text."""
+    return int(sum(lengths[batch].max() * len(batch) for batch in batches if len(batch)))
+
+
+def plan_batches(lengths, batch_size, sort=True):
+    """Index arrays of the batches: by token length when sort, else in input order."""
+    order = np.argsort(lengths, kind='stable') if sort else np.arange(len(lengths))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class EmbeddingStage:
+    """
+    Length-bucketed encoder over an optional process pool.
+
+    Use as a context manager to start and stop the worker processes. With
+    one worker the batches run on the model already loaded in the build.
+    """
+
+    def __init__(self, model, model_name, workers=1, batch_size=32, sort=True):
+        self.model = model
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.sort = sort
+        self._executor = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.docs = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.tokens = 0
+        self.computed_tokens = 0
+        self.unsorted_tokens = 0
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Each worker gets an equal share of the cores for PyTorch's own threads.
+            # Spawned, not forked: forking a process that has PyTorch's thread pools
+            # running can deadlock the child
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.model_name, threads),
+            )
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def encode(self, texts):
+        """Embeddings of texts, in their original order (not normalized)."""
+        texts = list(texts)
+        if not texts:
+            return None
+        start = time.perf_counter()
+        lengths = token_lengths(self.model, texts)
+        batches = plan_batches(lengths, self.batch_size, self.sort)
+
+        if self._executor is None:
+            results = [self._encode_local([texts[i] for i in batch]) for batch in batches]
+        else:
+            futures = [self._executor.submit(_encode_job, [texts[i] for i in batch]) for batch in batches]
+            results = [future.result() for future in futures]
+
+        out = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+        for batch, vectors in zip(batches, results):
+            out[batch] = vectors
+
+        self.seconds += time.perf_counter() - start
+        self.docs += len(texts)
+        self.batches += len(batches)
+        self.tokens += int(lengths.sum())
+        self.computed_tokens += padded_tokens(lengths, batches)
+        self.unsorted_tokens += padded_tokens(lengths, plan_batches(lengths, self.batch_size, sort=False))
+        return out
+
+    def _encode_local(self, texts):
+        return np.asarray(self.model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'batch_size': self.batch_size,
+            'length_sorted': self.sort,
+            'docs': self.docs,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 2),
+            'docs_per_second': round(self.docs / self.seconds, 1) if self.seconds else None,
+            'padding_efficiency': round(self.tokens / self.computed_tokens, 3) if self.computed_tokens else None,
+            'padding_efficiency_unsorted': round(self.tokens / self.unsorted_tokens, 3) if self.unsorted_tokens else None,
+        }
+
+
+def embed_report(model, model_name, texts, worker_counts=None, batch_size=32):
+    """
+    docs/second for the texts in input order and length-bucketed, per worker count.
+
+    The first run of every configuration is discarded as warm-up (worker
+    start-up and model load).
+    """
+    texts = list(texts)
+    cpus = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+
+    runs = []
+    configurations = [(1, False)] + [(workers, True) for workers in worker_counts]
+    for workers, sort in configurations:
+        with EmbeddingStage(model, model_name, workers, batch_size, sort) as stage:
+            stage.encode(texts[:batch_size * workers])
+            stage.reset_stats()
+            stage.encode(texts)
+            runs.append(stage.stats())
+    return {
+        'model': model_name,
+        'docs': len(texts),
+        'cpus': cpus,
+        'runs': runs,
+    }
@@ -0,0 +1,261 @@
+"""
+Docs Fetcher for Blender Helper AI
+
+Downloads documentation pages for build_database.py:
+- one pooled requests.Session (keep-alive, retries with backoff) shared by
+  a bounded thread pool
+- per-host politeness: a cap on requests in flight and a minimum interval
+  between request starts to the same host
+- conditional requests: cached pages are revalidated with If-None-Match /
+  If-Modified-Since, and a 304 reuses the cached copy
+- resumable crawl state: finished pages are recorded in a state file, so a
+  restarted build does not request them again
+
+The base URL is a parameter (BLENDER_DOCS_BASE_URL in build_database.py), so
+a build can run against a local stand-in serving the fixture pages in
+rag_system/fixtures (also used by test_docs_fetcher.py):
+    python -m http.server 8000 --directory fixtures
+    BLENDER_DOCS_BASE_URL=http://127.0.0.1:8000 python build_database.py
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CRAWL_STATE_FILENAME = "crawl_state.json"
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2), encoding='utf-8')
+    tmp_path.replace(path)
+
+
+class HostLimiter:
+    """Per-host cap on concurrent requests plus a minimum spacing between their starts."""
+
+    def __init__(self, max_in_flight=2, min_interval=0.25):
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, host):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_in_flight))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+class CrawlState:
+    """
+    Pages already fetched by the current crawl, persisted as JSON.
+
+    The file is removed once the build that owns it finishes; if the build
+    is interrupted, the next run picks up where it stopped. Pages loaded
+    from the file (rather than fetched by this run) are in resumed.
+    """
+
+    SAVE_EVERY = 25
+
+    def __init__(self, path, base_url):
+        self.path = Path(path) if path else None
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.done = {}
+        self.resumed = frozenset()
+        if self.path is not None and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                data = {}
+            if data.get('base_url') == base_url:
+                self.done = data.get('done', {})
+                self.resumed = frozenset(self.done)
+                print(f"  [RESUME] {len(self.done)} pages already fetched ({self.path.name})")
+
+    def is_done(self, url_path):
+        return url_path in self.done
+
+    def mark(self, url_path, status):
+        with self._lock:
+            self.done[url_path] = status
+            self._unsaved += 1
+            if self._unsaved >= self.SAVE_EVERY:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        self._unsaved = 0
+        if self.path is not None:
+            _write_json_atomic(self.path, {'base_url': self.base_url, 'done': self.done})
+
+    def clear(self):
+        """Forget the crawl; the next build revalidates every page."""
+        with self._lock:
+            self.done = {}
+            self.resumed = frozenset()
+            self._unsaved = 0
+            if self.path is not None and self.path.exists():
+                self.path.unlink()
+
+
+class DocsFetcher:
+    """Concurrent, cache-aware fetcher for documentation pages under one base URL."""
+
+    def __init__(self, base_url, cache_path, state_path=None, max_workers=8, per_host=2,
+                 min_interval=0.25, timeout=(5, 30), retries=3):
+        self.base_url = base_url.rstrip("/")
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.limiter = HostLimiter(per_host, min_interval)
+        self.state = CrawlState(state_path, self.base_url)
+
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers['User-Agent'] = "BlenderHelperAI-docs-indexer"
+
+        self._stats_lock = threading.Lock()
+        self.counts = {'fetched': 0, 'not_modified': 0, 'resumed': 0, 'reused': 0, 'stale_cache': 0, 'failed': 0}
+        self.bytes_downloaded = 0
+
+    def _count(self, key, n_bytes=0):
+        with self._stats_lock:
+            self.counts[key] += 1
+            self.bytes_downloaded += n_bytes
+
+    def cache_file(self, url_path):
+        return self.cache_path / url_path.replace("/", "_")
+
+    def _read_validators(self, cache_file, full_url):
+        meta_file = cache_file.with_name(cache_file.name + ".meta.json")
+        try:
+            meta = json.loads(meta_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        # Validators only apply to the URL they came from
+        return meta if meta.get('url') == full_url else {}
+
+    def _write_cache(self, cache_file, full_url, response):
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        tmp_file.write_text(response.text, encoding='utf-8')
+        tmp_file.replace(cache_file)
+        _write_json_atomic(cache_file.with_name(cache_file.name + ".meta.json"), {
+            'url': full_url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        })
+
+    def fetch(self, url_path):
+        """
+        Return the HTML for url_path, or None if it could not be obtained.
+
+        Pages finished earlier in this crawl come straight from the cache
+        (counted as resumed if an interrupted run fetched them, reused if
+        this run did, e.g. while discovering pages);
+        other cached pages are revalidated, and served from the cache if the
+        server cannot be reached.
+        """
+        cache_file = self.cache_file(url_path)
+        if self.state.is_done(url_path) and cache_file.exists():
+            self._count('resumed' if url_path in self.state.resumed else 'reused')
+            return cache_file.read_text(encoding='utf-8')
+
+        full_url = self.base_url + url_path
+        headers = {}
+        if cache_file.exists():
+            validators = self._read_validators(cache_file, full_url)
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        try:
+            with self.limiter.slot(urlsplit(full_url).netloc):
+                response = self.session.get(full_url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cache_file.exists():
+                print(f"  [304] {url_path}")
+                self._count('not_modified')
+                html = cache_file.read_text(encoding='utf-8')
+            else:
+                response.raise_for_status()
+                print(f"  [FETCH] {full_url}")
+                self._write_cache(cache_file, full_url, response)
+                self._count('fetched', len(response.content))
+                html = response.text
+        except Exception as e:
+            if cache_file.exists():
+                print(f"  [CACHE] {url_path} (revalidation failed: {e})")
+                self._count('stale_cache')
+                html = cache_file.read_text(encoding='utf-8')
+            else:
+                print(f"  [ERROR] {url_path}: {e}")
+                self._count('failed')
+                return None
+
+        self.state.mark(url_path, 'done')
+        return html
+
+    def fetch_all(self, url_paths):
+        """
+        Fetch pages concurrently and yield (url_path, html) in input order.
+
+        At most a few times max_workers pages are in flight or waiting to be
+        consumed, so memory stays bounded for long page lists. html is None
+        for pages that failed.
+        """
+        url_paths = iter(url_paths)
+        window = self.max_workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='docs-fetch') as pool:
+            for url_path in url_paths:
+                pending.append((url_path, pool.submit(self.fetch, url_path)))
+                if len(pending) >= window:
+                    break
+            while pending:
+                url_path, future = pending.popleft()
+                next_path = next(url_paths, None)
+                if next_path is not None:
+                    pending.append((next_path, pool.submit(self.fetch, next_path)))
+                yield url_path, future.result()
+        self.state.save()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counts, bytes_downloaded=self.bytes_downloaded)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,271 @@
+"""
+Docs Parser for Blender Helper AI
+
+Turns documentation pages into chunks for build_database.py:
+- parse_page: the extraction rules, on a choice of parser backend
+- ParsePool: parses pages in a process pool and yields them in input order
+- parse_report: pages/second per backend and worker count, and whether each
+  backend produces exactly the chunks of the default one
+
+Backends (PARSER_BACKENDS):
+- "html.parser": BeautifulSoup with the standard-library parser (default)
+- "lxml": BeautifulSoup on lxml's C parser, same traversal code
+- "selectolax": the same rules on selectolax's Lexbor tree, much faster
+
+lxml and selectolax are optional (pip install lxml / selectolax). Parsers
+build trees differently for malformed markup, so run parse_report on the
+cached pages before switching: it lists every page whose chunks differ.
+"""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from knowledge_store import chunk_hash
+
+DEFAULT_BACKEND = "html.parser"
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+PARSE_REPORT_FILENAME = "parse_report.json"
+
+SECTION_TAGS = ('dl', 'div')
+SECTION_CLASSES = frozenset(['function', 'method', 'attribute', 'class', 'data'])
+SIGNATURE_TAGS = ('dt', 'h3', 'h4')
+DESCRIPTION_TAGS = ('dd', 'p')
+CONTEXT_TAGS = ('p', 'h2', 'h3')
+
+
+def available_backends():
+    """Backends whose parser library is importable."""
+    backends = [DEFAULT_BACKEND]
+    try:
+        import lxml  # noqa: F401
+        backends.append("lxml")
+    except ImportError:
+        pass
+    try:
+        import selectolax  # noqa: F401
+        backends.append("selectolax")
+    except ImportError:
+        pass
+    return backends
+
+
+def resolve_backend(name):
+    """Backend to use for name; unknown or missing backends fall back to the default."""
+    if name not in PARSER_BACKENDS:
+        print(f"[WARN] Unknown parser backend '{name}', using {DEFAULT_BACKEND}")
+        return DEFAULT_BACKEND
+    if name not in available_backends():
+        print(f"[WARN] Parser backend '{name}' is not installed (pip install {name}), using {DEFAULT_BACKEND}")
+        return DEFAULT_BACKEND
+    return name
+
+
+def _api_chunk(signature, description, url_path):
+    chunk_text = f"{signature}\n\n{description}"
+    return {
+        "text": chunk_text,
+        "signature": signature,
+        "url": url_path,
+        "hash": chunk_hash(chunk_text),
+    }
+
+
+def _example_chunk(context, code, url_path):
+    chunk_text = f"Example:\n{context}\n\n```python\n{code}\n```"
+    return {
+        "text": chunk_text,
+        "signature": f"Example from {url_path}",
+        "url": url_path,
+        "hash": chunk_hash(chunk_text),
+    }
+
+
+def _parse_soup(html, url_path, features):
+    soup = BeautifulSoup(html, features)
+    chunks = []
+
+    # Extract API references
+    for section in soup.find_all(list(SECTION_TAGS), class_=list(SECTION_CLASSES)):
+        sig = section.find(list(SIGNATURE_TAGS))
+        if not sig:
+            continue
+
+        signature = sig.get_text(strip=True)
+        desc_elem = section.find(list(DESCRIPTION_TAGS))
+        description = desc_elem.get_text(strip=True) if desc_elem else ""
+        chunks.append(_api_chunk(signature, description, url_path))
+
+    # Extract code examples
+    for code_block in soup.find_all('pre'):
+        code = code_block.get_text(strip=True)
+        if 'bpy.' in code and len(code) > 50:
+            context_elem = code_block.find_previous(list(CONTEXT_TAGS))
+            context = context_elem.get_text(strip=True) if context_elem else ""
+            chunks.append(_example_chunk(context, code, url_path))
+
+    return chunks
+
+
+def _lexbor_text(node):
+    """BeautifulSoup's get_text(strip=True): every text node stripped, then joined."""
+    return "".join(
+        text for text in (n.text_content.strip() for n in node.traverse(include_text=True) if n.tag == '-text')
+        if text
+    )
+
+
+def _lexbor_first(node, tags):
+    """First descendant of node (in document order) with one of tags."""
+    for child in node.traverse():
+        if child is not node and child.tag in tags:
+            return child
+    return None
+
+
+def _parse_selectolax(html, url_path):
+    from selectolax.lexbor import LexborHTMLParser
+
+    api_chunks = []
+    example_chunks = []
+    last_context = None
+    # One pass in document order: the last context tag seen before a <pre>
+    # is exactly what find_previous returns for it
+    for node in LexborHTMLParser(html).root.traverse():
+        tag = node.tag
+        if tag in SECTION_TAGS and SECTION_CLASSES.intersection((node.attributes.get('class') or "").split()):
+            sig = _lexbor_first(node, SIGNATURE_TAGS)
+            if sig is not None:
+                desc_elem = _lexbor_first(node, DESCRIPTION_TAGS)
+                description = _lexbor_text(desc_elem) if desc_elem is not None else ""
+                api_chunks.append(_api_chunk(_lexbor_text(sig), description, url_path))
+        elif tag == 'pre':
+            code = _lexbor_text(node)
+            if 'bpy.' in code and len(code) > 50:
+                context = _lexbor_text(last_context) if last_context is not None else ""
+                example_chunks.append(_example_chunk(context, code, url_path))
+        if tag in CONTEXT_TAGS:
+            last_context = node
+
+    return api_chunks + example_chunks
+
+
+def parse_page(html, url_path, backend=DEFAULT_BACKEND):
+    """Extract documentation chunks from one page."""
+    if backend == "selectolax":
+        return _parse_selectolax(html, url_path)
+    return _parse_soup(html, url_path, backend)
+
+
+def _parse_job(args):
+    html, url_path, backend = args
+    return parse_page(html, url_path, backend)
+
+
+class ParsePool:
+    """
+    Parses pages across worker processes.
+
+    Parsing is CPU-bound, so threads would serialize on the GIL. With one
+    worker pages are parsed inline and no processes are started.
+    """
+
+    def __init__(self, workers=None, backend=DEFAULT_BACKEND):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.backend = backend
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Spawned, not forked: the build runs the pool next to the fetcher's
+            # threads (and the embedding model's), which a forked child inherits
+            # mid-flight, locks included
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def imap(self, pages):
+        """
+        Parse (url_path, html) pairs and yield (url_path, chunks) in input order.
+
+        At most a few times workers pages are queued, so a long page stream is
+        never held in memory. Pages whose html is None yield None.
+        """
+        if self._executor is None:
+            for url_path, html in pages:
+                yield url_path, parse_page(html, url_path, self.backend) if html else None
+            return
+
+        window = self.workers * 4
+        pending = deque()
+        for url_path, html in pages:
+            future = self._executor.submit(_parse_job, (html, url_path, self.backend)) if html else None
+            pending.append((url_path, future))
+            if len(pending) >= window:
+                url_path, future = pending.popleft()
+                yield url_path, future.result() if future else None
+        while pending:
+            url_path, future = pending.popleft()
+            yield url_path, future.result() if future else None
+
+
+def parse_report(pages, worker_counts=None, backends=None, repeat=1):
+    """
+    Measure parse throughput and check that backends agree.
+
+    pages is a list of (url_path, html). Every backend is timed at every
+    worker count; its chunks are compared page by page with the default
+    backend's, and pages that differ are listed.
+    """
+    pages = [(url_path, html) for url_path, html in pages if html]
+    cpus = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    backends = backends or available_backends()
+    total_bytes = sum(len(html.encode('utf-8')) for _, html in pages)
+
+    reference = [parse_page(html, url_path) for url_path, html in pages]
+    report = {
+        'pages': len(pages),
+        'megabytes': round(total_bytes / 1e6, 2),
+        'cpus': cpus,
+        'backends': {},
+    }
+    for backend in backends:
+        chunks = [parse_page(html, url_path, backend) for url_path, html in pages]
+        mismatched = [url_path for (url_path, _), a, b in zip(pages, chunks, reference) if a != b]
+        runs = []
+        for workers in worker_counts:
+            with ParsePool(workers, backend) as pool:
+                # Warm-up pass starts the processes and imports the parser
+                for _ in pool.imap(pages[:workers]):
+                    pass
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    for _ in pool.imap(pages):
+                        pass
+                seconds = time.perf_counter() - start
+            runs.append({
+                'workers': workers,
+                'seconds': round(seconds, 3),
+                'pages_per_second': round(len(pages) * repeat / seconds, 1) if seconds else None,
+                'mb_per_second': round(total_bytes * repeat / 1e6 / seconds, 2) if seconds else None,
+            })
+        report['backends'][backend] = {
+            'chunks': sum(len(c) for c in chunks),
+            'identical': not mismatched,
+            'mismatched_pages': mismatched,
+            'runs': runs,
+        }
+    return report
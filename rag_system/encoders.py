@@ -0,0 +1,452 @@
+"""
+Query Encoders for Blender Helper AI
+
+Backends that turn query text into all-MiniLM-L6-v2 embeddings:
+- sentence-transformers: the reference implementation (imports PyTorch)
+- onnx: the same network exported to ONNX and run with onnxruntime plus the
+  Rust `tokenizers` package, with no PyTorch import on the serving path
+
+Both return unit-length float32 rows. The ONNX backend applies the same
+mean pooling + L2 normalization as the sentence-transformers pipeline, so
+its vectors can be compared directly with the ones build_database.py wrote.
+
+Export the ONNX model (needs sentence-transformers, build machines only):
+    python build_database.py --export-onnx
+
+Compare backends (import time, load time, memory, numeric agreement):
+    python encoders.py --compare
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+RAG_DIR = Path(__file__).parent
+ONNX_MODEL_DIR = Path(os.getenv(
+    "BLENDER_HELPER_ONNX_MODEL_DIR",
+    RAG_DIR / "models" / "all-MiniLM-L6-v2-onnx"
+))
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_CONFIG_FILENAME = "encoder_config.json"
+ENCODER_BACKENDS = ('sentence-transformers', 'onnx')
+
+
+class EncoderUnavailable(Exception):
+    """Raised when a backend's dependencies or model files are missing."""
+
+
+def rss_mb(peak=False):
+    """
+    Resident set size of this process in MB (its peak so far if peak), or
+    None if it cannot be measured.
+    """
+    # Linux carries ru_maxrss over from the parent across exec; VmHWM does not
+    field = 'VmHWM:' if peak else 'VmRSS:'
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if not peak:
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / (1024 * 1024)
+        except ImportError:
+            pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak RSS: kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+class SentenceTransformerEncoder:
+    """Reference encoder backed by sentence-transformers / PyTorch."""
+
+    backend = 'sentence-transformers'
+
+    def __init__(self, model_name):
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise EncoderUnavailable("sentence-transformers not installed")
+        self.import_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.model = SentenceTransformer(model_name)
+        self.load_seconds = time.perf_counter() - start
+        rss_after = rss_mb()
+        self.rss_delta_mb = rss_after - rss_before if rss_before is not None else None
+        self.model_name = model_name
+
+    def encode(self, texts, batch_size=32):
+        return np.asarray(
+            self.model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+    def stats(self):
+        return _encoder_stats(self)
+
+
+class OnnxEncoder:
+    """MiniLM forward pass on onnxruntime (CPU), without importing PyTorch."""
+
+    backend = 'onnx'
+
+    def __init__(self, model_name, model_dir=ONNX_MODEL_DIR):
+        model_dir = Path(model_dir)
+        model_file = model_dir / ONNX_MODEL_FILENAME
+        tokenizer_file = model_dir / "tokenizer.json"
+        config_file = model_dir / ONNX_CONFIG_FILENAME
+        if not model_file.exists() or not tokenizer_file.exists():
+            raise EncoderUnavailable(
+                f"ONNX model not found in {model_dir}. Run: python build_database.py --export-onnx"
+            )
+
+        config = json.loads(config_file.read_text(encoding='utf-8')) if config_file.exists() else {}
+        if config.get('model_name', model_name) != model_name:
+            raise EncoderUnavailable(
+                f"ONNX model in {model_dir} is {config['model_name']}, expected {model_name}"
+            )
+
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise EncoderUnavailable("onnxruntime and tokenizers are required for the onnx encoder")
+        self.import_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            str(model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_file))
+        self.tokenizer.enable_truncation(max_length=config.get('max_seq_length', 256))
+        self.tokenizer.enable_padding()
+        self.load_seconds = time.perf_counter() - start
+        rss_after = rss_mb()
+        self.rss_delta_mb = rss_after - rss_before if rss_before is not None else None
+        self.model_name = model_name
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        rows = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, as in the sentence-transformers pipeline
+            mask = attention_mask[:, :, None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            rows.append(summed / counts)
+
+        if not rows:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.vstack(rows).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.clip(norms, 1e-12, None)
+
+    def stats(self):
+        return _encoder_stats(self)
+
+
+def _encoder_stats(encoder):
+    return {
+        'backend': encoder.backend,
+        'model': encoder.model_name,
+        'import_seconds': round(encoder.import_seconds, 3),
+        'load_seconds': round(encoder.load_seconds, 3),
+        'rss_delta_mb': round(encoder.rss_delta_mb, 1) if encoder.rss_delta_mb is not None else None,
+    }
+
+
+class _EncodeRequest:
+    __slots__ = ('texts', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEncoder:
+    """
+    Coalesces concurrent encode() calls into one call on the wrapped encoder.
+
+    A single worker thread takes the first waiting request, collects whatever
+    else arrives within max_wait_ms (up to max_batch_size texts), encodes the
+    lot together and hands each caller its own rows. Concurrent requests stop
+    competing for the GIL and the model's thread pool, and a lone request
+    waits at most max_wait_ms longer than it would have.
+    """
+
+    STATS_WINDOW = 1024
+
+    def __init__(self, encoder, max_batch_size=32, max_wait_ms=5.0):
+        self.encoder = encoder
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._batch_sizes = deque(maxlen=self.STATS_WINDOW)
+        self._queue_waits = deque(maxlen=self.STATS_WINDOW)
+        self._encode_seconds = deque(maxlen=self.STATS_WINDOW)
+        self._worker = threading.Thread(target=self._run, name='encode-batcher', daemon=True)
+        self._worker.start()
+
+    @property
+    def backend(self):
+        return self.encoder.backend
+
+    @property
+    def model_name(self):
+        return self.encoder.model_name
+
+    def encode(self, texts, batch_size=32):
+        """Encode texts as part of the next batch; blocks until its rows are ready."""
+        request = _EncodeRequest(list(texts))
+        if not request.texts:
+            return self.encoder.encode(request.texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or its wait is up."""
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = batch[0].enqueued + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._encode_batch(batch)
+            except Exception as e:
+                # Whatever went wrong, no caller may be left waiting on its request
+                for request in batch:
+                    if not request.done.is_set():
+                        request.error = e
+                        request.done.set()
+
+    def _encode_batch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        vectors = self.encoder.encode(texts, batch_size=self.max_batch_size)
+        finished = time.perf_counter()
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"Encoder returned {len(vectors)} vectors for {len(texts)} texts")
+
+        offset = 0
+        for request in batch:
+            request.result = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.done.set()
+
+        with self._stats_lock:
+            self.requests += len(batch)
+            self.texts += len(texts)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(texts))
+            self._batch_sizes.append(len(texts))
+            self._queue_waits.extend(started - request.enqueued for request in batch)
+            self._encode_seconds.append(finished - started)
+
+    def stats(self):
+        """Wrapped encoder stats plus batching metrics over the recent window."""
+        stats = self.encoder.stats()
+        with self._stats_lock:
+            waits_ms = np.array(self._queue_waits) * 1000
+            stats['batching'] = {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'requests': self.requests,
+                'texts': self.texts,
+                'batches': self.batches,
+                'largest_batch': self.largest_batch,
+                'mean_batch_size': round(float(np.mean(self._batch_sizes)), 2) if self._batch_sizes else 0.0,
+                'queue_wait_ms_p50': round(float(np.percentile(waits_ms, 50)), 3) if len(waits_ms) else 0.0,
+                'queue_wait_ms_p99': round(float(np.percentile(waits_ms, 99)), 3) if len(waits_ms) else 0.0,
+                'encode_ms_mean': round(float(np.mean(self._encode_seconds)) * 1000, 3) if self._encode_seconds else 0.0,
+                'queued': self._queue.qsize(),
+            }
+        return stats
+
+
+def load_encoder(backend, model_name):
+    """Create the encoder for a backend name from ENCODER_BACKENDS."""
+    if backend == 'sentence-transformers':
+        return SentenceTransformerEncoder(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name)
+    raise EncoderUnavailable(f"Unknown encoder backend '{backend}' (choose from {', '.join(ENCODER_BACKENDS)})")
+
+
+def export_onnx(model_name, out_dir=ONNX_MODEL_DIR):
+    """
+    Export a sentence-transformers model to ONNX for the onnx backend.
+
+    Writes model.onnx (token embeddings), tokenizer.json and
+    encoder_config.json to out_dir. Requires PyTorch, so this runs at build
+    time only.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = tokenizer(["Add a bevel modifier"], return_tensors='pt')
+    torch.onnx.export(
+        TokenEmbeddings(transformer),
+        (sample['input_ids'], sample['attention_mask'], sample['token_type_ids']),
+        str(out_dir / ONNX_MODEL_FILENAME),
+        input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+        output_names=['token_embeddings'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'token_type_ids': {0: 'batch', 1: 'sequence'},
+            'token_embeddings': {0: 'batch', 1: 'sequence'},
+        },
+        opset_version=14,
+    )
+    tokenizer.backend_tokenizer.save(str(out_dir / "tokenizer.json"))
+    (out_dir / ONNX_CONFIG_FILENAME).write_text(json.dumps({
+        'model_name': model_name,
+        'max_seq_length': st_model.max_seq_length,
+        'dim': st_model.get_sentence_embedding_dimension(),
+        'pooling': 'mean',
+        'normalize': True,
+    }, indent=2), encoding='utf-8')
+
+    return out_dir
+
+
+COMPARE_TEXTS = [
+    "what is a modifier?",
+    "How do I bevel the edges of a cube",
+    "bpy.ops.mesh.primitive_uv_sphere_add(radius=1.0)",
+    "SubsurfModifier levels render_levels",
+]
+
+
+def _measure_backend(backend, model_name):
+    """Load one backend in this (fresh) process and print its stats as JSON."""
+    encoder = load_encoder(backend, model_name)
+    start = time.perf_counter()
+    vectors = encoder.encode(COMPARE_TEXTS)
+    stats = encoder.stats()
+    stats['encode_ms_per_query'] = round((time.perf_counter() - start) * 1000 / len(COMPARE_TEXTS), 2)
+    stats['vectors'] = vectors.tolist()
+    print(json.dumps(stats))
+
+
+def compare_backends(model_name):
+    """
+    Run every backend in its own subprocess so import cost is measured cold.
+
+    Returns:
+        Dict of per-backend stats plus the minimum cosine similarity between
+        each backend's vectors and the sentence-transformers reference.
+    """
+    results = {}
+    for backend in ENCODER_BACKENDS:
+        proc = subprocess.run(
+            [sys.executable, __file__, '--measure', backend, '--model', model_name],
+            capture_output=True, text=True, cwd=str(RAG_DIR)
+        )
+        if proc.returncode != 0:
+            results[backend] = {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    reference = results.get('sentence-transformers', {}).get('vectors')
+    for backend, stats in results.items():
+        vectors = stats.pop('vectors', None)
+        if reference is not None and vectors is not None:
+            cosines = np.sum(np.asarray(reference) * np.asarray(vectors), axis=1)
+            stats['min_cosine_vs_reference'] = round(float(cosines.min()), 6)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query encoder backends")
+    parser.add_argument('--compare', action='store_true', help="Report import time, memory and agreement for every backend")
+    parser.add_argument('--measure', choices=ENCODER_BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    if args.measure:
+        _measure_backend(args.measure, args.model)
+    elif args.compare:
+        print(json.dumps(compare_backends(args.model), indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Knowledge Store for Blender Helper AI
+
+Chunk metadata backends for RAGSystem:
+- JsonChunkStore: the whole of metadata.json held in memory (original layout)
+- SqliteChunkStore: knowledge.sqlite written by build_database.py; only the
+  rows a query actually returns are read from disk
+
+Both expose len(store), store.get_many(ids) and store.close() so the server
+does not care which one is in use.
+"""
+
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+STORE_FILENAME = "knowledge.sqlite"
+STORE_FORMAT_VERSION = 1
+
+
+def chunk_hash(text):
+    """Content hash of a chunk's embedded text; chunks with equal hashes share a vector."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class JsonChunkStore:
+    """In-memory list of chunk dicts."""
+
+    backend = 'json'
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def get_many(self, ids):
+        return [self.chunks[int(i)] for i in ids]
+
+
+class SqliteChunkStore:
+    """
+    Read-only view of knowledge.sqlite.
+
+    Each query checks a connection out of a pool of at most pool_size and
+    returns it afterwards, so concurrent requests read in parallel without
+    sharing a cursor, while the threaded web server (a new thread per
+    request) cannot open more. close() closes them all.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, pool_size=4):
+        self.path = Path(path)
+        self.pool_size = max(1, pool_size)
+        self._pool = queue.Queue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.closed = False
+        with self._connection() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if int(meta.get('format_version', 0)) != STORE_FORMAT_VERSION:
+            raise ValueError(f"{self.path} has unsupported store format version {meta.get('format_version')}")
+        self.count = int(meta['count'])
+        self.dim = int(meta['dim'])
+        self.model = meta.get('model')
+        self.index_checksum = meta.get('index_checksum') or None
+
+    @contextmanager
+    def _connection(self):
+        """Check a connection out of the pool, opening one if the pool is not full yet."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self.closed:
+                    raise ValueError(f"{self.path.name} store is closed")
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+            if self.closed:
+                self._close_idle()
+
+    def _close_idle(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """Close every connection; ones checked out are closed when they come back."""
+        with self._lock:
+            self.closed = True
+        self._close_idle()
+
+    def __len__(self):
+        return self.count
+
+    def get_many(self, ids):
+        """Chunk dicts for ids, in the order given."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT id, text, signature, url FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {row[0]: {'text': row[1], 'signature': row[2], 'url': row[3]} for row in rows}
+        return [by_id[i] for i in ids]
+
+    def load_vectors(self, batch_size=10_000):
+        """All vectors as a (count, dim) float32 array, for databases without vectors.bhvi."""
+        vectors = np.empty((self.count, self.dim), dtype=np.float32)
+        with self._connection() as conn:
+            cursor = conn.execute("SELECT id, vector FROM chunks ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row_id, blob in rows:
+                    vectors[row_id] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
+
+
+def write_store(path, chunks, embeddings, model_name, index_checksum=None):
+    """
+    Write chunks and their vectors to a fresh SQLite knowledge store.
+
+    Row ids match positions in the vector index, so a search result index is
+    also the primary key of its chunk. chunks may be any iterable and
+    embeddings a memory map; rows are inserted as they are read.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+    count = 0
+
+    def rows():
+        nonlocal count
+        for i, chunk in enumerate(chunks):
+            count = i + 1
+            yield i, chunk['text'], chunk['signature'], chunk['url'], np.asarray(embeddings[i], dtype=np.float32).tobytes()
+
+    conn = sqlite3.connect(str(tmp_path))
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL, "
+            "signature TEXT NOT NULL, url TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        conn.executemany("INSERT INTO chunks (id, text, signature, url, vector) VALUES (?, ?, ?, ?, ?)", rows())
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ('format_version', str(STORE_FORMAT_VERSION)),
+            ('count', str(count)),
+            ('dim', str(dim)),
+            ('model', model_name),
+            ('index_checksum', index_checksum or ''),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+
+    tmp_path.replace(path)
+
+
+def write_chunks_json(path, chunks):
+    """
+    Write chunks as the metadata.json array, one chunk per line.
+
+    chunks may be any iterable, so the file is produced without holding the
+    whole list. The output is an ordinary JSON array for every reader.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for i, chunk in enumerate(chunks):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(chunk, ensure_ascii=False))
+        f.write("\n]\n")
+    tmp_path.replace(path)
+
+
+def iter_chunks_json(path):
+    """
+    Yield the chunks of a metadata.json file.
+
+    Files written by write_chunks_json are read line by line; older files
+    (a single-line array) are loaded whole.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.readline()
+        if first.strip() != "[":
+            yield from json.loads(first + f.read())
+            return
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line and line != "]":
+                yield json.loads(line)
@@ -0,0 +1,200 @@
+"""
+Lexical (BM25) Index for Blender Helper AI
+
+In-memory inverted index over the text and signature of every chunk, built
+by build_database.py and loaded by server.py for hybrid retrieval.
+
+Postings are stored as flat NumPy arrays in CSR form (term_offsets points
+into doc_ids / term_freqs), so a query only touches the postings of its own
+terms and scoring cost grows with query terms rather than corpus size.
+"""
+
+import re
+from array import array
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+BM25_FILENAME = "bm25.npz"
+BM25_FORMAT_VERSION = 1
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*|[0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms.
+
+    API identifiers are indexed whole as well as by their parts, so
+    "bpy.ops.mesh.bevel" yields the dotted path plus bpy/ops/mesh/bevel, and
+    "SubsurfModifier" yields subsurfmodifier plus subsurf/modifier.
+    """
+    terms = []
+    for match in _IDENTIFIER_RE.finditer(text):
+        token = match.group(0)
+        whole = token.lower()
+        terms.append(whole)
+
+        parts = set()
+        for part in re.split(r"[._]", token):
+            if part:
+                parts.add(part.lower())
+                parts.update(piece.lower() for piece in _CAMEL_RE.findall(part))
+        parts.discard(whole)
+        terms.extend(sorted(parts))
+    return terms
+
+
+def chunk_terms(chunk):
+    """Terms indexed for one metadata chunk."""
+    return tokenize(chunk.get("signature", "")) + tokenize(chunk.get("text", ""))
+
+
+class BM25Index:
+    """Okapi BM25 over CSR postings."""
+
+    def __init__(self, terms, term_offsets, doc_ids, term_freqs, doc_lengths, k1=1.2, b=0.75):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(doc_lengths)
+        doc_freq = np.diff(term_offsets).astype(np.float32)
+        self.idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        avgdl = float(doc_lengths.mean()) if n_docs else 1.0
+        # Per-document length normalization, precomputed once
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(avgdl, 1e-9))).astype(np.float32)
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, chunks):
+        """
+        Index metadata chunks (row i of the index is the i-th chunk).
+
+        chunks may be any iterable. Postings are collected in compact typed
+        arrays rather than Python tuples, so memory grows with the postings
+        the server will hold anyway, not with the chunk text.
+        """
+        vocab = {}
+        posting_terms = array('l')
+        posting_docs = array('l')
+        posting_tfs = array('f')
+        doc_lengths = array('f')
+
+        for doc_id, chunk in enumerate(chunks):
+            terms = chunk_terms(chunk)
+            doc_lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                posting_terms.append(vocab.setdefault(term, len(vocab)))
+                posting_docs.append(doc_id)
+                posting_tfs.append(tf)
+
+        terms = [None] * len(vocab)
+        for term, term_id in vocab.items():
+            terms[term_id] = term
+
+        posting_terms = np.frombuffer(posting_terms, dtype=np.dtype('l')).astype(np.int64)
+        # Postings are produced in doc order; a stable sort by term keeps it
+        order = np.argsort(posting_terms, kind="stable")
+        posting_terms = posting_terms[order]
+        doc_ids = np.frombuffer(posting_docs, dtype=np.dtype('l'))[order]
+        term_freqs = np.frombuffer(posting_tfs, dtype=np.float32)[order]
+        doc_lengths = np.frombuffer(doc_lengths, dtype=np.float32).copy()
+
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(terms)), out=term_offsets[1:])
+
+        return cls(
+            terms,
+            term_offsets,
+            doc_ids.astype(np.int32),
+            term_freqs.astype(np.float32),
+            doc_lengths,
+        )
+
+    def save(self, path):
+        np.savez(
+            path,
+            format_version=np.array(BM25_FORMAT_VERSION),
+            terms=np.array(self.terms, dtype=str),
+            term_offsets=self.term_offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["format_version"]) != BM25_FORMAT_VERSION:
+                raise ValueError(f"{path} has unsupported BM25 format version {int(data['format_version'])}")
+            return cls(
+                data["terms"].tolist(),
+                data["term_offsets"],
+                data["doc_ids"],
+                data["term_freqs"],
+                data["doc_lengths"],
+            )
+
+    def score(self, query):
+        """
+        BM25 scores for the documents that contain at least one query term.
+
+        Returns:
+            (doc_ids, scores) arrays, unordered.
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        ids = []
+        contributions = []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            ids.append(docs)
+            contributions.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs]))
+
+        ids = np.concatenate(ids)
+        contributions = np.concatenate(contributions)
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        return unique_ids, np.bincount(inverse, weights=contributions).astype(np.float32)
+
+    def search(self, query, k):
+        """Top-k (doc_ids, scores) for query, best first."""
+        doc_ids, scores = self.score(query)
+        best = top_k_indices(scores, k)
+        return doc_ids[best], scores[best]
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k=60):
+    """
+    Fuse several best-first lists of doc ids.
+
+    Each list contributes weight / (k + rank) for every document it ranks,
+    which combines dense and BM25 results without having to calibrate their
+    score scales against each other.
+
+    Returns:
+        Doc ids sorted by fused score, best first.
+    """
+    fused = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc_id in enumerate(ranked):
+            doc_id = int(doc_id)
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
@@ -0,0 +1,526 @@
+"""
+Ollama Client for Blender Helper AI
+
+One shared client for every LLM call the RAG server makes:
+- a pooled requests.Session, so chat requests reuse keep-alive connections
+- separate connect and read timeouts: a stopped Ollama fails in seconds,
+  while a slow first token (model load on a CPU-only machine) is still
+  waited for
+- retries with jittered exponential backoff, only where nothing was
+  generated yet: connection failures and 429/502/503/504 replies
+- a circuit breaker: after a run of consecutive failures calls fail at once
+  with LLMUnavailable, until a cool-down passes and one trial call is let
+  through
+- RequestCoalescer: identical requests made while one is already running
+  share its generation (and its stream) instead of starting their own
+
+The base URL is a parameter (OLLAMA_URL in server.py), so the server can be
+pointed at a local fake Ollama for testing.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+
+class LLMUnavailable(Exception):
+    """Ollama cannot be reached, or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls go through. open: calls are refused until reset_seconds
+    have passed. half_open: one trial call goes through; its outcome closes
+    or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=3, reset_seconds=30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.opens = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def allow(self):
+        """Whether a call may go out now; a refused call is counted."""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a trial call through."""
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+            }
+
+
+class ChatStream:
+    """
+    Streamed chat reply: iterate to get the content fragments as they arrive.
+
+    Time to first token and total time are measured from when the request
+    was made. A failure part-way through counts against the circuit breaker.
+    """
+
+    def __init__(self, client, response, started):
+        self._client = client
+        self._response = response
+        self.started = started
+        self.first_token_seconds = None
+        self.total_seconds = None
+        self.chars = 0
+        self.eval_count = None
+
+    def __iter__(self):
+        # Ollama sends one JSON object per line; the last one has "done": true
+        try:
+            for line in self._response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get('error'):
+                    raise Exception(f"Ollama request failed: {data['error']}")
+                content = data.get('message', {}).get('content', '')
+                if content:
+                    if self.first_token_seconds is None:
+                        self.first_token_seconds = time.perf_counter() - self.started
+                    self.chars += len(content)
+                    yield content
+                if data.get('done'):
+                    self.eval_count = data.get('eval_count')
+                    break
+        except requests.exceptions.RequestException as e:
+            self._client.breaker.record_failure(e)
+            raise Exception(f"Ollama request failed: {e}")
+        finally:
+            # Also reached when the client disconnects: closing stops the generation
+            self.total_seconds = time.perf_counter() - self.started
+            self._response.close()
+
+    def close(self):
+        """Stop the generation early (e.g. the client went away before reading it)."""
+        self._response.close()
+
+    def timings(self):
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            'time_to_first_token_ms': ms(self.first_token_seconds),
+            'total_ms': ms(self.total_seconds),
+        }
+
+    def describe_timings(self):
+        first = f"{self.first_token_seconds:.2f}s" if self.first_token_seconds is not None else "n/a"
+        tokens = f", {self.eval_count} tokens" if self.eval_count else ""
+        return f"first token after {first}, complete after {self.total_seconds:.2f}s, {self.chars} chars{tokens}"
+
+
+class OllamaClient:
+    """Pooled, retrying, circuit-broken client for Ollama's /api/chat."""
+
+    def __init__(self, base_url="http://127.0.0.1:11434", connect_timeout=3.0, read_timeout=120.0,
+                 retries=2, backoff=0.5, max_backoff=5.0, pool_size=8,
+                 failure_threshold=3, reset_seconds=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats_lock = threading.Lock()
+        self.counts = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.counts[key] += 1
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: concurrent callers do not retry in lockstep
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def _post(self, payload, stream, read_timeout=None):
+        """
+        POST /api/chat with retries, returning the open response.
+
+        Retries only failures where Ollama cannot have started generating:
+        refused or timed-out connections and RETRY_STATUSES replies.
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable(
+                f"{self.breaker.last_error} (Ollama calls paused, retrying in {self.breaker.retry_in():.0f}s)"
+            )
+
+        self._count('requests')
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(f"{self.base_url}/api/chat", json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.ConnectionError as e:
+                # Includes connect timeouts and dropped keep-alive connections
+                if last:
+                    return self._fail(e)
+                self._count('retries')
+                self._sleep_before_retry(attempt)
+                continue
+            except requests.exceptions.RequestException as e:
+                # Read timeout: Ollama is wedged or still loading; waiting again would double the wait
+                return self._fail(e)
+
+            if response.status_code in RETRY_STATUSES and not last:
+                response.close()
+                self._count('retries')
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code >= 500 or response.status_code in RETRY_STATUSES:
+                detail = f"{response.status_code} {response.text[:200]}"
+                response.close()
+                return self._fail(Exception(detail))
+            if response.status_code >= 400:
+                # Bad request or unknown model: Ollama itself is fine
+                detail = f"{response.status_code} {response.text[:200]}"
+                response.close()
+                self.breaker.record_success()
+                self._count('failed')
+                raise Exception(f"Ollama request failed: {detail}")
+            return response
+
+    def _fail(self, error):
+        if isinstance(error, requests.exceptions.Timeout):
+            message = f"Ollama did not respond in time ({type(error).__name__})"
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            message = "Ollama not running. Start it with: ollama serve"
+        else:
+            message = f"Ollama request failed: {error}"
+        self.breaker.record_failure(message)
+        self._count('failed')
+        raise LLMUnavailable(message)
+
+    @staticmethod
+    def _payload(system_prompt, user_prompt, model, temperature, stream):
+        return {
+            "model": model,
+            "stream": stream,
+            "options": {"temperature": temperature},
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+
+    def chat(self, system_prompt, user_prompt, model, temperature=0.7, read_timeout=None):
+        """Whole reply as one string."""
+        response = self._post(self._payload(system_prompt, user_prompt, model, temperature, False), False, read_timeout)
+        try:
+            content = response.json()["message"]["content"]
+        except (ValueError, KeyError) as e:
+            self.breaker.record_failure(e)
+            self._count('failed')
+            raise Exception(f"Ollama request failed: unexpected reply ({e})")
+        self.breaker.record_success()
+        self._count('succeeded')
+        return content
+
+    def chat_stream(self, system_prompt, user_prompt, model, temperature=0.7, read_timeout=None):
+        """
+        Open a streamed reply and return it as a ChatStream.
+
+        The read timeout then bounds the wait between tokens.
+        """
+        started = time.perf_counter()
+        response = self._post(self._payload(system_prompt, user_prompt, model, temperature, True), True, read_timeout)
+        self.breaker.record_success()
+        self._count('succeeded')
+        return ChatStream(self, response, started)
+
+    @property
+    def unavailable(self):
+        return self.breaker.state == 'open'
+
+    def stats(self):
+        with self._stats_lock:
+            counts = dict(self.counts)
+        return {
+            'url': self.base_url,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            **counts,
+            'circuit': self.breaker.stats(),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def request_key(system_prompt, user_prompt, model, temperature):
+    """Identity of an LLM request for coalescing: same prompts, model and temperature."""
+    fingerprint = json.dumps([system_prompt, user_prompt, model, temperature])
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+class _StreamFlight:
+    """One upstream generation and the fragments it has produced so far."""
+
+    def __init__(self):
+        self.opened = Future()
+        self.cond = threading.Condition()
+        self.fragments = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.upstream = None
+
+
+class CoalescedStream(ChatStream):
+    """
+    One subscriber's view of a shared generation.
+
+    Replays the fragments produced before it joined, then follows the live
+    ones; same interface as ChatStream. Timings are measured from when this
+    subscriber joined. The subscription ends when iteration finishes or on
+    close(), whichever comes first, so a stream that is never iterated must
+    be closed or the generation runs on for nobody.
+    """
+
+    def __init__(self, flight, coalesced, started):
+        # No upstream response of its own: the flight's pump thread reads it
+        self._flight = flight
+        self._subscribed = True
+        self.coalesced = coalesced
+        self.started = started
+        self.first_token_seconds = None
+        self.total_seconds = None
+        self.chars = 0
+
+    @property
+    def eval_count(self):
+        upstream = self._flight.upstream
+        return upstream.eval_count if upstream is not None else None
+
+    def __iter__(self):
+        flight = self._flight
+        position = 0
+        try:
+            while True:
+                with flight.cond:
+                    while position == len(flight.fragments) and not flight.done:
+                        flight.cond.wait()
+                    fragments = flight.fragments[position:]
+                    position = len(flight.fragments)
+                    finished = flight.done
+                for content in fragments:
+                    if self.first_token_seconds is None:
+                        self.first_token_seconds = time.perf_counter() - self.started
+                    self.chars += len(content)
+                    yield content
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            self.total_seconds = time.perf_counter() - self.started
+            self.close()
+
+    def close(self):
+        """Leave the shared generation; it stops once every subscriber has left."""
+        with self._flight.cond:
+            if self._subscribed:
+                self._subscribed = False
+                self._flight.subscribers -= 1
+
+    def describe_timings(self):
+        description = super().describe_timings()
+        return description + (", joined an identical in-flight request" if self.coalesced else "")
+
+
+class RequestCoalescer:
+    """
+    Single-flight coalescing of identical LLM requests.
+
+    The first request for a key (the leader) runs; identical requests that
+    arrive while it is in flight wait for it and get the same result or
+    exception. Streams are pumped by a background thread into a shared
+    buffer, so every subscriber gets every fragment and a subscriber that
+    disconnects does not cut the others off; the generation is only
+    abandoned once all of them have gone. A key is released as soon as its
+    request finishes, so later requests generate afresh.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.counts = {'calls': 0, 'coalesced_calls': 0, 'streams': 0, 'coalesced_streams': 0, 'abandoned_streams': 0}
+
+    def call(self, key, fn):
+        """
+        fn() for the leader, the leader's outcome for everyone else.
+
+        Returns:
+            (result, True if this request joined one already in flight)
+        """
+        if not self.enabled:
+            return fn(), False
+        with self._lock:
+            future = self._calls.get(key)
+            coalesced = future is not None
+            if coalesced:
+                self.counts['coalesced_calls'] += 1
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.counts['calls'] += 1
+        if coalesced:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stream(self, key, open_stream):
+        """
+        Subscribe to the generation for key, starting it with open_stream() if none is running.
+
+        Errors opening the stream (e.g. LLMUnavailable) are raised to every
+        subscriber that was waiting for it.
+        """
+        if not self.enabled:
+            return open_stream()
+        started = time.perf_counter()
+        with self._lock:
+            flight = self._streams.get(key)
+            coalesced = flight is not None
+            if coalesced:
+                self.counts['coalesced_streams'] += 1
+            else:
+                flight = _StreamFlight()
+                self._streams[key] = flight
+                self.counts['streams'] += 1
+            with flight.cond:
+                flight.subscribers += 1
+
+        if coalesced:
+            try:
+                flight.opened.result()
+            except BaseException:
+                with flight.cond:
+                    flight.subscribers -= 1
+                raise
+            return CoalescedStream(flight, True, started)
+
+        try:
+            flight.upstream = open_stream()
+        except BaseException as e:
+            with self._lock:
+                del self._streams[key]
+            flight.opened.set_exception(e)
+            raise
+        subscriber = CoalescedStream(flight, False, started)
+        flight.opened.set_result(True)
+        threading.Thread(target=self._pump, args=(key, flight), daemon=True).start()
+        return subscriber
+
+    def _pump(self, key, flight):
+        fragments = iter(flight.upstream)
+        abandoned = False
+        try:
+            for content in fragments:
+                with flight.cond:
+                    abandoned = flight.subscribers == 0
+                    if not abandoned:
+                        flight.fragments.append(content)
+                        flight.cond.notify_all()
+                if abandoned:
+                    self._count('abandoned_streams')
+                    break
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Closing the generator closes the Ollama response, which stops generation
+            fragments.close()
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._calls) + len(self._streams),
+                **self.counts,
+            }
@@ -9,31 +9,30 @@ This server runs in system Python (outside Blender) and handles:
 Runs completely offline on localhost:5179
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
-import sys
 from pathlib import Path
+from collections import OrderedDict
 import traceback
 import json
 import re
 import time
+import threading
+from contextlib import contextmanager
 import numpy as np
 
-# Try to import RAG dependencies
-try:
-    from sentence_transformers import SentenceTransformer
-    HAS_TRANSFORMERS = True
-except ImportError:
-    print("[RAG] Warning: sentence-transformers not found, RAG will be disabled")
-    HAS_TRANSFORMERS = False
+from ann_index import IVF_FILENAME, IVFIndex, exact_search
+from cache import (
+    AnswerCache, LRUCache, QueryEmbeddingCache, SemanticAnswerCache, answer_cache_key, normalize_query_text
+)
+from encoders import BatchingEncoder, EncoderUnavailable, load_encoder
+from knowledge_store import STORE_FILENAME, JsonChunkStore, SqliteChunkStore, chunk_hash
+from lexical_index import BM25_FILENAME, BM25Index, reciprocal_rank_fusion
+from shard_generations import current_generation
+from vector_index import INDEX_FILENAME, IndexFormatError, load_index, normalize_rows
 
-try:
-    import requests as req_lib
-    HAS_REQUESTS = True
-except ImportError:
-    print("[Dependencies] Error: requests library required")
-    sys.exit(1)
+from ollama_client import LLMUnavailable, OllamaClient, RequestCoalescer, request_key
 
 
 app = Flask(__name__)
@@ -47,67 +46,600 @@ CORS(app, origins=[
 # Configuration
 RAG_DIR = Path(__file__).parent
 DB_PATH = RAG_DIR / "simple_db"
+# Knowledge bases: one shard per Blender version under DB_PATH (see
+# KnowledgeBaseRegistry); "default" is a database stored directly in DB_PATH
+DEFAULT_KB_KEY = "default"
+DEFAULT_BLENDER_VERSION = os.getenv("BLENDER_HELPER_DEFAULT_VERSION") or None
+MAX_LOADED_KNOWLEDGE_BASES = int(os.getenv("BLENDER_HELPER_MAX_LOADED_VERSIONS", "2"))
+KNOWLEDGE_BASE_IDLE_SECONDS = float(os.getenv("BLENDER_HELPER_VERSION_IDLE_SECONDS", "900"))
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Query encoder backend: "sentence-transformers" (PyTorch) or "onnx"
+# (onnxruntime, no PyTorch import). See encoders.py
+ENCODER_BACKEND = os.getenv("BLENDER_HELPER_ENCODER", "sentence-transformers")
+MAX_BATCH_QUERIES = 1000
+# Micro-batching of query encodes: concurrent requests arriving within
+# ENCODE_BATCH_WAIT_MS share one encoder call ("0" encodes each request directly)
+ENCODE_BATCH_WAIT_MS = float(os.getenv("BLENDER_HELPER_ENCODE_BATCH_WAIT_MS", "5"))
+ENCODE_MAX_BATCH = int(os.getenv("BLENDER_HELPER_ENCODE_MAX_BATCH", "32"))
+QUERY_CACHE_SIZE = int(os.getenv("BLENDER_HELPER_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_PATH = os.getenv("BLENDER_HELPER_QUERY_CACHE_PATH") or None
+# Retrieval result cache: (knowledge base, index version, query, n_results) -> contexts
+RESULT_CACHE_SIZE = int(os.getenv("BLENDER_HELPER_RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("BLENDER_HELPER_RESULT_CACHE_TTL", "3600")) or None
+# /ask answer cache: (question, scene fields, model, temperature, retrieved
+# chunks) -> answer. "0" entries disables it; set a path to keep answers
+# across restarts
+ANSWER_CACHE_SIZE = int(os.getenv("BLENDER_HELPER_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("BLENDER_HELPER_ANSWER_CACHE_TTL", "3600")) or None
+ANSWER_CACHE_PATH = os.getenv("BLENDER_HELPER_ANSWER_CACHE_PATH") or None
+# Semantic answer cache: reuse the answer of an earlier question whose
+# embedding is at least BLENDER_HELPER_SEMANTIC_CACHE_THRESHOLD similar
+# (same model, knowledge base and scene class). Off unless a size is set
+SEMANTIC_CACHE_SIZE = int(os.getenv("BLENDER_HELPER_SEMANTIC_CACHE_SIZE", "0"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("BLENDER_HELPER_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+ASK_TEMPERATURE = 0.7
+# Search mode: "exact" brute-force scan, "ivf" approximate index, or "auto"
+# (use the IVF index when build_database.py produced one)
+RAG_SEARCH_MODE = os.getenv("BLENDER_HELPER_RAG_SEARCH", "auto")
+IVF_NPROBE = int(os.getenv("BLENDER_HELPER_IVF_NPROBE", "8"))
+# Hybrid retrieval: fuse BM25 (bm25.npz) with dense results. "auto" enables
+# it whenever the lexical index exists, "0" turns it off
+RAG_HYBRID_MODE = os.getenv("BLENDER_HELPER_RAG_HYBRID", "auto")
+HYBRID_CANDIDATES = int(os.getenv("BLENDER_HELPER_HYBRID_CANDIDATES", "50"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("BLENDER_HELPER_HYBRID_LEXICAL_WEIGHT", "1.0"))
+# Chunk metadata backend: "json" (metadata.json in memory), "sqlite"
+# (knowledge.sqlite, rows read per query) or "auto" (sqlite when present)
+RAG_STORE_MODE = os.getenv("BLENDER_HELPER_RAG_STORE", "auto")
+# Read-only SQLite connections per knowledge base, shared by all request threads
+STORE_CONNECTIONS = int(os.getenv("BLENDER_HELPER_STORE_CONNECTIONS", "4"))
+# Seconds a request waits for background warm-up before answering without RAG
+RAG_WARMUP_WAIT = float(os.getenv("BLENDER_HELPER_RAG_WARMUP_WAIT", "10"))
+# Hot reload: POST /admin/reload always works; with BLENDER_HELPER_RELOAD_WATCH=1
+# loaded knowledge bases are also reloaded when their files change on disk
+RELOAD_WATCH = os.getenv("BLENDER_HELPER_RELOAD_WATCH", "0") == "1"
+RELOAD_POLL_SECONDS = float(os.getenv("BLENDER_HELPER_RELOAD_POLL_SECONDS", "10"))
+# Ollama: base URL (point it at a fake server for testing), timeouts for
+# connecting and for each read, retries for failures before generation
+# starts, and the circuit breaker (fail fast for OLLAMA_BREAKER_RESET_SECONDS
+# after OLLAMA_BREAKER_FAILURES consecutive failures)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "3"))
+OLLAMA_BREAKER_RESET_SECONDS = float(os.getenv("OLLAMA_BREAKER_RESET_SECONDS", "30"))
+# Identical requests (same prompts, model and temperature) arriving while one
+# is being generated share that generation ("0" generates each separately)
+OLLAMA_COALESCE = os.getenv("OLLAMA_COALESCE", "1") == "1"
+
+WATCHED_FILES = (
+    INDEX_FILENAME, "embeddings.npy", "metadata.json", STORE_FILENAME, BM25_FILENAME, IVF_FILENAME
+)
+
+
+class QueryEmbedder:
+    """Query encoder and embedding cache shared by every knowledge base."""
 
+    def __init__(self):
+        self.model = None
+        self.load_error = None
+        self._lock = threading.Lock()
+        self.query_cache = QueryEmbeddingCache(
+            EMBEDDING_MODEL_NAME,
+            max_entries=QUERY_CACHE_SIZE,
+            persist_path=QUERY_CACHE_PATH
+        )
 
-class RAGSystem:
-    """Simple RAG using NumPy arrays."""
+    def load(self):
+        """Load the encoder backend once; returns True when it is usable."""
+        if self.model is not None:
+            return True
+        with self._lock:
+            if self.model is not None:
+                return True
+            if self.load_error is not None:
+                return False
 
-    def __init__(self):
-        self.initialized = False
+            # Imported lazily so the backend choice decides whether PyTorch is
+            # ever loaded
+            try:
+                model = load_encoder(ENCODER_BACKEND, EMBEDDING_MODEL_NAME)
+            except EncoderUnavailable as e:
+                self.load_error = str(e)
+                print(f"[RAG] Warning: RAG disabled - {e}")
+                return False
+
+            stats = model.stats()
+            print(f"[RAG] Info: {stats['backend']} encoder ready "
+                  f"(import {stats['import_seconds']}s, load {stats['load_seconds']}s, "
+                  f"+{stats['rss_delta_mb']} MB)")
+            if ENCODE_BATCH_WAIT_MS > 0:
+                model = BatchingEncoder(model, max_batch_size=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_BATCH_WAIT_MS)
+            self.model = model
+            return True
+
+    def embed(self, queries):
+        """
+        Embed queries as unit vectors, consulting the query cache first.
+
+        Only cache misses reach the encoder, and they are encoded together in
+        a single call.
+        """
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            encoded = normalize_rows(self.model.encode([queries[i] for i in missing]))
+            for row, i in enumerate(missing):
+                vectors[i] = encoded[row]
+                self.query_cache.put(queries[i], encoded[row])
+
+        return np.vstack(vectors)
+
+    def stats(self):
+        if self.model is not None:
+            return self.model.stats()
+        return {'backend': ENCODER_BACKEND, 'error': self.load_error}
+
+
+def database_fingerprint(db_path):
+    """
+    Current generation and (name, size, mtime) of each of its database
+    files, used to notice rebuilds.
+    """
+    generation = current_generation(db_path)
+    entries = [generation.name]
+    for name in WATCHED_FILES:
+        try:
+            file_stat = (generation / name).stat()
+        except OSError:
+            continue
+        entries.append((name, file_stat.st_size, file_stat.st_mtime_ns))
+    return tuple(entries)
+
+
+class KnowledgeBaseUnloaded(Exception):
+    """The knowledge base was evicted while a request was about to use it."""
+
+
+class IndexSnapshot:
+    """
+    Everything a search reads from one knowledge base directory: vectors,
+    optional IVF / BM25 indexes and chunk metadata.
+
+    A snapshot is not modified once loaded. Reloading builds a new one and
+    RAGSystem swaps the reference, so a request that picked up the old
+    snapshot finishes against it unchanged. Requests hold it between
+    acquire() and release(); a retired snapshot closes its files once the
+    last of them is done, so the build can delete its generation (Windows
+    cannot delete files that are mapped or open).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
         self.embeddings = None
+        self.index_header = None
+        self.index_version = None
+        self.ann_index = None
+        self.lexical_index = None
         self.metadata = None
-        self.embedding_model = None
-
-    def initialize(self):
-        """Load the RAG database."""
-        if self.initialized:
+        self._use_lock = threading.Lock()
+        self._users = 0
+        self.retired = False
+        self.closed = False
+
+    def acquire(self):
+        """Start using the snapshot; False once it has been retired."""
+        with self._use_lock:
+            if self.retired:
+                return False
+            self._users += 1
             return True
 
-        if not HAS_TRANSFORMERS:
-            print("[RAG] Warning: RAG disabled - sentence-transformers not installed")
+    def release(self):
+        with self._use_lock:
+            self._users -= 1
+            close_now = self.retired and self._users == 0
+        if close_now:
+            self.close()
+
+    def retire(self):
+        """Take the snapshot out of service; it closes when its last user releases it."""
+        with self._use_lock:
+            self.retired = True
+            close_now = self._users == 0
+        if close_now:
+            self.close()
+
+    def load(self, progress=None):
+        """Load the database files; returns True on success."""
+        if progress is None:
+            progress = lambda stage, value: None
+
+        index_file = self.db_path / INDEX_FILENAME
+        embeddings_file = self.db_path / "embeddings.npy"
+        metadata_json_file = self.db_path / "metadata.json"
+        metadata_pickle_file = self.db_path / "metadata.pkl"
+
+        store_file = self.db_path / STORE_FILENAME
+        use_store = RAG_STORE_MODE != "json" and store_file.exists()
+        if RAG_STORE_MODE == "sqlite" and not store_file.exists():
+            print(f"[RAG] Warning: {store_file.name} not found, falling back to metadata.json")
+
+        if not index_file.exists() and not embeddings_file.exists() and not use_store:
+            print(f"[RAG] Warning: Database not found at {self.db_path}")
+            print("[RAG] Info: Run indexer_simple.py first to build the knowledge base")
+            return False
+        if not use_store and not metadata_json_file.exists() and not metadata_pickle_file.exists():
+            print(f"[RAG] Warning: metadata.json not found at {metadata_json_file}")
+            print("[RAG] Info: Rebuild the knowledge base to generate metadata.json")
             return False
 
-        try:
-            print("[RAG] Info: Loading RAG system...")
+        progress('loading_metadata', 0.6)
+        if use_store:
+            # Rows are read per query, nothing is deserialized up front
+            self.metadata = SqliteChunkStore(store_file, pool_size=STORE_CONNECTIONS)
+            print(f"[RAG] Info: Using {store_file.name} for chunk metadata")
+        elif metadata_json_file.exists():
+            with open(metadata_json_file, 'r', encoding='utf-8') as f:
+                self.metadata = JsonChunkStore(json.load(f))
+        else:
+            # Pickle is intentionally disabled by default because loading untrusted
+            # pickle data can execute arbitrary code.
+            allow_pickle = os.getenv("BLENDER_HELPER_ALLOW_PICKLE_METADATA", "0") == "1"
+            if not allow_pickle:
+                print("[RAG] Error: metadata.json missing and unsafe pickle fallback disabled")
+                print("[RAG] Error: Rebuild database or set BLENDER_HELPER_ALLOW_PICKLE_METADATA=1")
+                return False
 
-            # Load embedding model
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            import pickle
+            with open(metadata_pickle_file, 'rb') as f:
+                self.metadata = JsonChunkStore(pickle.load(f))
+            print("[RAG] Warning: Loaded metadata.pkl fallback (unsafe). Prefer metadata.json.")
 
-            # Load database
-            embeddings_file = DB_PATH / "embeddings.npy"
-            metadata_json_file = DB_PATH / "metadata.json"
-            metadata_pickle_file = DB_PATH / "metadata.pkl"
+        progress('loading_vectors', 0.75)
+        if not self._load_vectors(index_file, embeddings_file):
+            return False
+
+        if len(self.metadata) != self.embeddings.shape[0]:
+            print(f"[RAG] Error: Index has {self.embeddings.shape[0]} vectors but metadata has {len(self.metadata)} entries")
+            print("[RAG] Error: Rebuild the knowledge base")
+            return False
 
-            if not embeddings_file.exists():
-                print(f"[RAG] Warning: Database not found at {DB_PATH}")
-                print("[RAG] Info: Run indexer_simple.py first to build the knowledge base")
+        progress('loading_lexical_index', 0.9)
+        self._load_lexical_index(self.db_path / BM25_FILENAME)
+        return True
+
+    def _load_vectors(self, index_file, embeddings_file):
+        """Memory-map the normalized vector index, falling back to embeddings.npy."""
+        if index_file.exists():
+            verify = os.getenv("BLENDER_HELPER_VERIFY_INDEX", "0") == "1"
+            try:
+                self.embeddings, self.index_header = load_index(index_file, verify_checksum=verify)
+            except IndexFormatError as e:
+                print(f"[RAG] Error: {e}")
+                print("[RAG] Error: Rebuild the knowledge base")
                 return False
-            if not metadata_json_file.exists() and not metadata_pickle_file.exists():
-                print(f"[RAG] Warning: metadata.json not found at {metadata_json_file}")
-                print("[RAG] Info: Rebuild the knowledge base to generate metadata.json")
+
+            if self.index_header.get('model') != EMBEDDING_MODEL_NAME:
+                print(f"[RAG] Warning: Index was built with {self.index_header.get('model')}, queries use {EMBEDDING_MODEL_NAME}")
+            print(f"[RAG] Info: Memory-mapped {index_file.name} ({self.index_header['count']} x {self.index_header['dim']})")
+            self.index_version = self.index_header['checksum']
+            if isinstance(self.metadata, SqliteChunkStore) and self.metadata.index_checksum not in (None, self.index_version):
+                print(f"[RAG] Warning: {STORE_FILENAME} was built for a different vector index")
+            self._load_ann_index(index_file.parent / IVF_FILENAME)
+            return True
+
+        if not embeddings_file.exists() and isinstance(self.metadata, SqliteChunkStore):
+            print(f"[RAG] Warning: {index_file.name} not found, loading vectors from {STORE_FILENAME} into memory")
+            self.embeddings = normalize_rows(self.metadata.load_vectors())
+            self.index_header = None
+            self.index_version = f"sqlite:{self.metadata.index_checksum}"
+            return True
+
+        # Legacy database: normalize once at load instead of on every query
+        print(f"[RAG] Warning: {index_file.name} not found, loading legacy embeddings.npy into memory")
+        self.embeddings = normalize_rows(np.load(embeddings_file))
+        self.index_header = None
+        file_stat = embeddings_file.stat()
+        self.index_version = f"npy:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+        if RAG_SEARCH_MODE == "ivf":
+            print("[RAG] Warning: IVF search needs vectors.bhvi, using exact search")
+        return True
+
+    def _load_ann_index(self, ivf_file):
+        """Load the IVF index if the configured search mode wants it."""
+        self.ann_index = None
+        if RAG_SEARCH_MODE == "exact":
+            return
+        if not ivf_file.exists():
+            if RAG_SEARCH_MODE == "ivf":
+                print(f"[RAG] Warning: {ivf_file.name} not found, using exact search")
+            return
+
+        try:
+            ann_index = IVFIndex.load(ivf_file)
+        except Exception as e:
+            print(f"[RAG] Warning: Could not load {ivf_file.name} - {e}. Using exact search")
+            return
+
+        if ann_index.index_checksum != self.index_header['checksum']:
+            print(f"[RAG] Warning: {ivf_file.name} was built for a different vector index, using exact search")
+            return
+
+        self.ann_index = ann_index
+        print(f"[RAG] Info: IVF search enabled ({ann_index.n_lists} lists, n_probe={IVF_NPROBE})")
+
+    def _load_lexical_index(self, bm25_file):
+        """Load the BM25 index for hybrid retrieval if it exists and matches."""
+        self.lexical_index = None
+        if RAG_HYBRID_MODE == "0" or not bm25_file.exists():
+            return
+
+        try:
+            lexical_index = BM25Index.load(bm25_file)
+        except Exception as e:
+            print(f"[RAG] Warning: Could not load {bm25_file.name} - {e}. Using dense retrieval only")
+            return
+
+        if lexical_index.n_docs != len(self.metadata):
+            print(f"[RAG] Warning: {bm25_file.name} covers {lexical_index.n_docs} docs, expected {len(self.metadata)}. Using dense retrieval only")
+            return
+
+        self.lexical_index = lexical_index
+        print(f"[RAG] Info: Hybrid retrieval enabled ({len(lexical_index.terms)} BM25 terms)")
+
+    def validate_replacement(self, current):
+        """
+        Check that this snapshot can replace current.
+
+        Returns:
+            Error message, or None if the swap is safe.
+        """
+        if self.embeddings.shape[0] == 0:
+            return "index is empty"
+        if current is not None and self.embeddings.shape[1] != current.embeddings.shape[1]:
+            return f"dimension changed from {current.embeddings.shape[1]} to {self.embeddings.shape[1]}"
+        if self.index_header is not None and self.index_header.get('model') != EMBEDDING_MODEL_NAME:
+            return f"index was built with {self.index_header.get('model')}, queries use {EMBEDDING_MODEL_NAME}"
+
+        # One real search end to end: vectors, ANN lists, BM25 and chunk rows
+        indices, _ = self.search([""], np.asarray(self.embeddings[:1]), 1)[0]
+        if len(self.format_contexts(indices, [1.0] * len(indices))) != 1:
+            return "test search returned no results"
+        return None
+
+    def touch_pages(self):
+        """
+        Read one value from every page of a memory-mapped index.
+
+        Run before the snapshot is swapped in, so the first queries after a
+        reload do not stall on page faults.
+        """
+        if not isinstance(self.embeddings, np.memmap):
+            return
+        rows_per_page = max(1, 4096 // max(1, self.embeddings.shape[1] * self.embeddings.itemsize))
+        float(np.asarray(self.embeddings[::rows_per_page, 0]).sum())
+
+    def close(self):
+        """Close the chunk store and drop the memory-mapped vectors."""
+        self.closed = True
+        if self.metadata is not None:
+            self.metadata.close()
+        self.embeddings = None
+        self.ann_index = None
+        self.lexical_index = None
+
+    @property
+    def search_mode(self):
+        mode = "ivf" if self.ann_index is not None else "exact"
+        return mode + "+bm25" if self.lexical_index is not None else mode
+
+    def dense_search(self, query_embeddings, n_results):
+        """Top-k (indices, scores) pairs for each unit-length query embedding."""
+        if self.ann_index is not None:
+            return self.ann_index.search(self.embeddings, query_embeddings, n_results, n_probe=IVF_NPROBE)
+        # Index rows are normalized at build time, so this is cosine similarity
+        return exact_search(self.embeddings, query_embeddings, n_results)
+
+    def search(self, queries, query_embeddings, n_results):
+        """
+        Top-k (indices, scores) pairs per query, fusing BM25 when available.
+
+        Scores are always the dense cosine similarity so callers see the same
+        scale with and without hybrid retrieval; only the ranking changes.
+        """
+        if self.lexical_index is None:
+            return self.dense_search(query_embeddings, n_results)
+
+        n_candidates = max(n_results, HYBRID_CANDIDATES)
+        dense_results = self.dense_search(query_embeddings, n_candidates)
+
+        results = []
+        for query, query_embedding, (dense_ids, _) in zip(queries, query_embeddings, dense_results):
+            lexical_ids, _ = self.lexical_index.search(query, n_candidates)
+            fused = reciprocal_rank_fusion(
+                [dense_ids, lexical_ids],
+                [1.0, HYBRID_LEXICAL_WEIGHT]
+            )[:n_results]
+            ids = np.array(fused, dtype=np.intp)
+            scores = np.asarray(self.embeddings[ids]) @ query_embedding if len(ids) else np.empty(0)
+            results.append((ids, scores))
+        return results
+
+    def format_contexts(self, indices, scores):
+        """Turn ranked row indices and their scores into context dicts for the API."""
+        contexts = []
+        for chunk, score in zip(self.metadata.get_many(indices), scores):
+            contexts.append({
+                'text': chunk['text'],
+                'signature': chunk['signature'],
+                'url': chunk['url'],
+                'similarity': float(score)
+            })
+        return contexts
+
+
+class RAGSystem:
+    """Simple RAG using NumPy arrays, for one knowledge base directory."""
+
+    def __init__(self, db_path=DB_PATH, version=DEFAULT_KB_KEY):
+        self.db_path = Path(db_path)
+        self.version = version
+        self.initialized = False
+        # cold -> warming -> ready | failed; unloaded once the registry evicts it
+        self.state = 'cold'
+        self.warmup_stage = None
+        self.warmup_progress = 0.0
+        self.warmup_started = None
+        self.warmup_seconds = None
+        self._state_lock = threading.Lock()
+        self._ready_event = threading.Event()
+        # Current IndexSnapshot; replaced as a whole by reload()
+        self.snapshot = None
+        self.fingerprint = None
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.reload_failures = 0
+        self.last_reload = None
+
+    @property
+    def metadata(self):
+        return self.snapshot.metadata if self.snapshot is not None else None
+
+    @property
+    def embeddings(self):
+        return self.snapshot.embeddings if self.snapshot is not None else None
+
+    @property
+    def index_version(self):
+        return self.snapshot.index_version if self.snapshot is not None else None
+
+    @property
+    def search_mode(self):
+        return self.snapshot.search_mode if self.snapshot is not None else "exact"
+
+    @contextmanager
+    def use_snapshot(self):
+        """The current snapshot, kept open for the block even if a reload retires it meanwhile."""
+        while True:
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.acquire():
+                break
+            if self.snapshot is snapshot:
+                raise KnowledgeBaseUnloaded(f"Knowledge base '{self.version}' was unloaded")
+        try:
+            yield snapshot
+        finally:
+            snapshot.release()
+
+    def start_warmup(self):
+        """Load the RAG database on a background thread and return immediately."""
+        with self._state_lock:
+            if self.state != 'cold':
+                return
+            self.state = 'warming'
+
+        thread = threading.Thread(target=self._warm_up, name=f'rag-warmup-{self.version}', daemon=True)
+        thread.start()
+
+    def unload(self):
+        """
+        Stop serving this knowledge base (the registry evicted it).
+
+        The snapshot's files close now, or once the requests still using it
+        release it.
+        """
+        with self._state_lock:
+            self.state = 'unloaded'
+            snapshot = self.snapshot
+        if snapshot is not None:
+            snapshot.retire()
+
+    def _install(self, snapshot):
+        """Make snapshot current, unless the knowledge base was unloaded meanwhile."""
+        with self._state_lock:
+            self.snapshot = snapshot
+            unloaded = self.state == 'unloaded'
+        if unloaded:
+            snapshot.retire()
+        return not unloaded
+
+    def initialize(self, timeout=None):
+        """
+        Make sure the RAG database is loaded.
+
+        Starts loading in the background if nothing has started yet, then
+        waits for at most timeout seconds (forever if None). A failed load is
+        not retried on every request.
+
+        Returns:
+            True once the RAG system is ready.
+        """
+        if self.state == 'ready':
+            return True
+        if self.state in ('failed', 'unloaded'):
+            return False
+
+        self.start_warmup()
+        self._ready_event.wait(timeout)
+        return self.initialized
+
+    def _warm_up(self):
+        """Run the load, record timing and wake up any waiting requests."""
+        self.warmup_started = time.time()
+        try:
+            ok = self._load()
+        finally:
+            self.warmup_seconds = time.time() - self.warmup_started
+            with self._state_lock:
+                if self.state != 'unloaded':
+                    self.state = 'ready' if self.initialized else 'failed'
+            self._ready_event.set()
+
+        if ok:
+            print(f"[RAG] OK: Knowledge base '{self.version}' warm-up finished in {self.warmup_seconds:.1f}s")
+        return ok
+
+    def _set_progress(self, stage, progress):
+        self.warmup_stage = stage
+        self.warmup_progress = progress
+
+    def warmup_status(self):
+        """Warm-up state for /health."""
+        if self.state == 'warming' and self.warmup_started is not None:
+            elapsed = time.time() - self.warmup_started
+        else:
+            elapsed = self.warmup_seconds
+        return {
+            'stage': self.warmup_stage,
+            'progress': round(self.warmup_progress, 2),
+            'elapsed_seconds': round(elapsed, 2) if elapsed is not None else None
+        }
+
+    def _load(self):
+        """Load the RAG database."""
+        try:
+            print(f"[RAG] Info: Loading knowledge base '{self.version}' from {self.db_path}...")
+
+            # Load embedding model (shared by all knowledge bases)
+            self._set_progress('loading_model', 0.05)
+            if not query_embedder.load():
                 return False
 
-            self.embeddings = np.load(embeddings_file)
-
-            if metadata_json_file.exists():
-                with open(metadata_json_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-            else:
-                # Pickle is intentionally disabled by default because loading untrusted
-                # pickle data can execute arbitrary code.
-                allow_pickle = os.getenv("BLENDER_HELPER_ALLOW_PICKLE_METADATA", "0") == "1"
-                if not allow_pickle:
-                    print("[RAG] Error: metadata.json missing and unsafe pickle fallback disabled")
-                    print("[RAG] Error: Rebuild database or set BLENDER_HELPER_ALLOW_PICKLE_METADATA=1")
-                    return False
-
-                import pickle
-                with open(metadata_pickle_file, 'rb') as f:
-                    self.metadata = pickle.load(f)
-                print("[RAG] Warning: Loaded metadata.pkl fallback (unsafe). Prefer metadata.json.")
+            # Taken before loading, so a rebuild that lands mid-load is noticed
+            fingerprint = database_fingerprint(self.db_path)
+            snapshot = IndexSnapshot(current_generation(self.db_path))
+            if not snapshot.load(self._set_progress):
+                return False
 
+            if not self._install(snapshot):
+                return False
+            self.fingerprint = fingerprint
+            self._set_progress('ready', 1.0)
             self.initialized = True
-            print(f"[RAG] OK: Successfully loaded {len(self.metadata)} documents")
+            retrieval_cache.invalidate(lambda key: key[0] == self.version)
+            print(f"[RAG] OK: Successfully loaded {len(snapshot.metadata)} documents")
             return True
 
         except Exception as e:
@@ -115,50 +647,443 @@ class RAGSystem:
             traceback.print_exc()
             return False
 
-    def retrieve_context(self, query, n_results=3):
-        """Retrieve relevant documentation."""
-        if not self.initialize():
-            return []
+    def reload(self):
+        """
+        Load the database again and swap it in atomically.
+
+        The new snapshot is loaded, validated and paged in on the calling
+        thread while requests keep using the current one; only then is the
+        reference replaced. If the new files are missing or inconsistent the
+        current snapshot stays in service. A knowledge base that never
+        finished loading (or failed to) is simply warmed up again.
+
+        Returns:
+            Dict describing the outcome for /admin/reload.
+        """
+        with self._reload_lock:
+            with self._state_lock:
+                if self.state == 'unloaded':
+                    return {'status': 'not_loaded'}
+                if self.state == 'warming':
+                    return {'status': 'warming'}
+                if self.state in ('cold', 'failed'):
+                    self.state = 'cold'
+                    self._ready_event.clear()
+                    restart = True
+                else:
+                    restart = False
+            if restart:
+                self.start_warmup()
+                return {'status': 'warming'}
+
+            start = time.perf_counter()
+            current = self.snapshot
+            fingerprint = database_fingerprint(self.db_path)
+            generation = current_generation(self.db_path)
+            print(f"[RAG] Info: Reloading knowledge base '{self.version}' from {generation}...")
+
+            snapshot = IndexSnapshot(generation)
+            try:
+                error = None if snapshot.load() else "load failed (see server log)"
+                if error is None:
+                    error = snapshot.validate_replacement(current)
+                if error is None:
+                    snapshot.touch_pages()
+            except Exception as e:
+                traceback.print_exc()
+                error = str(e)
+
+            if error is not None:
+                snapshot.close()
+                self.reload_failures += 1
+                print(f"[RAG] Warning: Reload of '{self.version}' rejected - {error}. Keeping the current index")
+                return {'status': 'failed', 'error': error, 'index_version': current.index_version}
+
+            # A single reference assignment: each request reads self.snapshot
+            # once and keeps using what it got
+            if not self._install(snapshot):
+                current.retire()
+                return {'status': 'not_loaded'}
+            self.fingerprint = fingerprint
+            # Closed now or when the last request still using it finishes
+            current.retire()
+            self.reloads += 1
+            self.last_reload = time.time()
+            retrieval_cache.invalidate(lambda key: key[0] == self.version)
+
+            seconds = time.perf_counter() - start
+            print(f"[RAG] OK: Reloaded '{self.version}' with {len(snapshot.metadata)} documents in {seconds:.1f}s")
+            return {
+                'status': 'reloaded',
+                'docs': len(snapshot.metadata),
+                'index_version': snapshot.index_version,
+                'previous_index_version': current.index_version,
+                'generation': generation.name,
+                'seconds': round(seconds, 3)
+            }
+
+    def reload_status(self):
+        """Reload counters for /health."""
+        return {
+            'index_version': self.index_version,
+            'reloads': self.reloads,
+            'reload_failures': self.reload_failures,
+            'last_reload': self.last_reload
+        }
+
+    def retrieve_context(self, query, n_results=3, return_embedding=False):
+        """
+        Retrieve relevant documentation.
+
+        With return_embedding, returns (contexts, query embedding) so callers
+        such as the semantic answer cache reuse the vector the search used;
+        the embedding is None when the contexts came from the retrieval cache
+        or retrieval failed.
+        """
+        contexts, query_embedding = [], None
+        if not self.initialize(timeout=RAG_WARMUP_WAIT):
+            self._warn_if_warming()
+        else:
+            try:
+                with self.use_snapshot() as snapshot:
+                    contexts, query_embedding = self._retrieve_context(snapshot, query, n_results)
+            except KnowledgeBaseUnloaded as e:
+                print(f"[RAG] Warning: {e} mid-request, answering without documentation")
+        return (contexts, query_embedding) if return_embedding else contexts
+
+    def _retrieve_context(self, snapshot, query, n_results):
+        cache_key = self._result_cache_key(snapshot, query, n_results)
+        cached = retrieval_cache.get(cache_key)
+        if cached is not None:
+            return [dict(context) for context in cached], None
 
         try:
-            # Embed query
-            query_embedding = self.embedding_model.encode([query])[0]
+            # Embed query (unit length, so cosine similarity is a plain dot product)
+            query_embedding = query_embedder.embed([query])
 
-            # Calculate cosine similarity with division by zero protection
-            norms = np.linalg.norm(self.embeddings, axis=1)
-            query_norm = np.linalg.norm(query_embedding)
+            top_indices, scores = snapshot.search([query], query_embedding, n_results)[0]
 
-            # Avoid division by zero
-            norms = np.where(norms == 0, 1, norms)
-            if query_norm == 0:
-                query_norm = 1
+            contexts = snapshot.format_contexts(top_indices, scores)
+            retrieval_cache.put(cache_key, contexts)
+            return [dict(context) for context in contexts], query_embedding[0]
 
-            similarities = np.dot(self.embeddings, query_embedding) / (norms * query_norm)
+        except Exception as e:
+            print(f"[RAG] Error: Context retrieval failed - {e}")
+            traceback.print_exc()
+            return [], None
 
-            # Get top N
-            top_indices = np.argsort(similarities)[-n_results:][::-1]
+    def question_embedding(self, query):
+        """
+        Unit embedding of query, or None while RAG is unavailable.
 
-            # Format results
-            contexts = []
-            for idx in top_indices:
-                chunk = self.metadata[idx]
-                contexts.append({
-                    'text': chunk['text'],
-                    'signature': chunk['signature'],
-                    'url': chunk['url'],
-                    'similarity': float(similarities[idx])
-                })
+        For queries retrieve_context answered from the retrieval cache, so
+        did not embed; normally served from the query embedding cache.
+        """
+        if not self.initialized:
+            return None
+        try:
+            return query_embedder.embed([query])[0]
+        except Exception as e:
+            print(f"[RAG] Warning: Query embedding failed - {e}")
+            return None
+
+    def retrieve_batch(self, queries, n_results=3):
+        """
+        Retrieve documentation for many queries at once.
+
+        All queries are embedded in a single encode call and, for exact
+        search, scored with one matrix-matrix product, so throughput scales
+        with BLAS rather than with the number of HTTP round trips.
+
+        Returns:
+            One list of contexts per query, in the same order as queries.
+        """
+        if not queries:
+            return []
+        if not self.initialize(timeout=RAG_WARMUP_WAIT):
+            self._warn_if_warming()
+            return [[] for _ in queries]
+
+        try:
+            with self.use_snapshot() as snapshot:
+                return self._retrieve_batch(snapshot, queries, n_results)
+        except KnowledgeBaseUnloaded as e:
+            print(f"[RAG] Warning: {e} mid-request, answering without documentation")
+            return [[] for _ in queries]
+
+    def _retrieve_batch(self, snapshot, queries, n_results):
+        try:
+            cache_keys = [self._result_cache_key(snapshot, query, n_results) for query in queries]
+            results = [retrieval_cache.get(key) for key in cache_keys]
+            missing = [i for i, result in enumerate(results) if result is None]
 
-            return contexts
+            if missing:
+                missing_queries = [queries[i] for i in missing]
+                query_embeddings = query_embedder.embed(missing_queries)
+                searched = snapshot.search(missing_queries, query_embeddings, n_results)
+                for i, (top_indices, scores) in zip(missing, searched):
+                    results[i] = snapshot.format_contexts(top_indices, scores)
+                    retrieval_cache.put(cache_keys[i], results[i])
+
+            return [[dict(context) for context in result] for result in results]
 
         except Exception as e:
-            print(f"[RAG] Error: Context retrieval failed - {e}")
+            print(f"[RAG] Error: Batch context retrieval failed - {e}")
             traceback.print_exc()
-            return []
+            return [[] for _ in queries]
+
+    def _result_cache_key(self, snapshot, query, n_results):
+        # The index version changes whenever the shard is rebuilt, so results
+        # computed against an older index can never be served. BM25 splits
+        # CamelCase identifiers, so case only folds for dense-only retrieval
+        if snapshot.lexical_index is None:
+            query = normalize_query_text(query)
+        else:
+            query = " ".join(query.split())
+        return (self.version, snapshot.index_version, snapshot.search_mode, query, n_results)
 
+    def _warn_if_warming(self):
+        if self.state == 'warming':
+            print(f"[RAG] Warning: Still warming up after {RAG_WARMUP_WAIT:g}s wait, answering without documentation")
 
-# Global RAG instance
-rag = RAGSystem()
+
+def parse_blender_version(value):
+    """
+    Normalize an optional Blender version from a request.
+
+    Accepts "4.2", "4.2.1" or bpy.app.version style lists such as [4, 2, 1]
+    and returns "major.minor", which is how knowledge bases are named.
+
+    Returns:
+        (version or None, error message or None)
+    """
+    if value is None:
+        return None, None
+
+    if isinstance(value, (list, tuple)):
+        if not 2 <= len(value) <= 3 or not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+            return None, "blender_version list must contain 2-3 integers"
+        return f"{value[0]}.{value[1]}", None
+
+    if not isinstance(value, str):
+        return None, "blender_version must be a string like \"4.2\" or a list like [4, 2, 0]"
+
+    match = re.match(r"^\s*(\d{1,3})\.(\d{1,3})(?:\.\d{1,3})?\s*$", value)
+    if not match:
+        return None, "blender_version must look like \"4.2\" or \"4.2.1\""
+    return f"{int(match.group(1))}.{int(match.group(2))}", None
+
+
+def _version_key(version):
+    return tuple(int(part) for part in version.split('.'))
+
+
+class KnowledgeBaseRegistry:
+    """
+    Knowledge bases per Blender version, loaded on demand.
+
+    build_database.py writes one shard per version under DB_PATH (for example
+    simple_db/4.2/). A database written directly into DB_PATH by older builds
+    is served as the "default" knowledge base while no shard exists. Loaded shards are kept in LRU
+    order; beyond MAX_LOADED_KNOWLEDGE_BASES, or after KNOWLEDGE_BASE_IDLE_SECONDS
+    without requests, shards other than the default are unloaded. Requests
+    still holding an unloaded shard finish against it normally; its files are
+    closed after the last of them.
+    """
+
+    def __init__(self, db_root, max_loaded=2, idle_seconds=900):
+        self.db_root = Path(db_root)
+        self.max_loaded = max(1, max_loaded)
+        self.idle_seconds = idle_seconds
+        self._loaded = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.unloads = 0
+        self._versions = None
+        self._versions_checked = 0.0
+
+    @staticmethod
+    def _has_database(path):
+        generation = current_generation(path)
+        return (generation / INDEX_FILENAME).exists() or (generation / "embeddings.npy").exists()
+
+    def available_versions(self):
+        """Blender versions that have a shard on disk, oldest first."""
+        # Rescanned at most every few seconds so requests don't hit the disk
+        now = time.monotonic()
+        if self._versions is not None and now - self._versions_checked < 5:
+            return self._versions
+
+        versions = []
+        if self.db_root.exists():
+            versions = [
+                path.name for path in self.db_root.iterdir()
+                if path.is_dir() and re.match(r"^\d+\.\d+$", path.name) and self._has_database(path)
+            ]
+        self._versions = sorted(versions, key=_version_key)
+        self._versions_checked = now
+        return self._versions
+
+    def default_version(self):
+        """
+        Knowledge base used when a request names no (or an unknown) version:
+        BLENDER_HELPER_DEFAULT_VERSION, else the newest shard, else the legacy
+        database in DB_PATH itself.
+        """
+        versions = self.available_versions()
+        if DEFAULT_BLENDER_VERSION in versions:
+            return DEFAULT_BLENDER_VERSION
+        if versions:
+            return versions[-1]
+        return DEFAULT_KB_KEY
+
+    def resolve(self, requested=None):
+        """Map a requested version to the key of an existing knowledge base."""
+        if requested is not None and requested in self.available_versions():
+            return requested
+        return self.default_version()
+
+    def get(self, requested=None):
+        """Return the knowledge base for requested, creating it if needed."""
+        key = self.resolve(requested)
+        now = time.monotonic()
+
+        with self._lock:
+            kb = self._loaded.get(key)
+            if kb is None:
+                path = self.db_root if key == DEFAULT_KB_KEY else self.db_root / key
+                kb = RAGSystem(path, key)
+                self._loaded[key] = kb
+                self.loads += 1
+            self._loaded.move_to_end(key)
+            self._last_used[key] = now
+            self._evict_locked(keep=key, now=now)
+
+        return kb
+
+    def _evict_locked(self, keep, now):
+        pinned = {keep, self.default_version()}
+        for key in list(self._loaded):
+            if key in pinned:
+                continue
+            over_capacity = len(self._loaded) > self.max_loaded
+            idle = now - self._last_used.get(key, now) > self.idle_seconds
+            if over_capacity or idle:
+                kb = self._loaded.pop(key)
+                self._last_used.pop(key, None)
+                kb.unload()
+                self.unloads += 1
+                reason = "idle" if idle and not over_capacity else "capacity"
+                print(f"[RAG] Info: Unloaded knowledge base '{key}' ({reason})")
+
+    def start_warmup(self):
+        """Warm up the default knowledge base in the background."""
+        self.get().start_warmup()
+
+    def reload(self, requested=None):
+        """
+        Reload one loaded knowledge base, or all of them when requested is None.
+
+        Also rescans DB_PATH, so newly built shards become available. Shards
+        that are not loaded need nothing: they read the new files on first use.
+
+        Returns:
+            Dict of knowledge base key -> RAGSystem.reload() outcome.
+        """
+        self._versions = None
+        with self._lock:
+            loaded = dict(self._loaded)
+
+        if requested is None:
+            targets = loaded
+        elif requested in loaded:
+            targets = {requested: loaded[requested]}
+        else:
+            return {requested: {'status': 'not_loaded'}}
+
+        return {key: kb.reload() for key, kb in targets.items()}
+
+    def start_watcher(self, poll_seconds):
+        """Poll loaded knowledge bases for rebuilt files and reload them."""
+        thread = threading.Thread(target=self._watch, args=(poll_seconds,), name='rag-reload-watch', daemon=True)
+        thread.start()
+
+    def _watch(self, poll_seconds):
+        # build_database.py writes several files one after another, so a
+        # change is only acted on once the fingerprint is stable for a poll
+        pending = {}
+        while True:
+            time.sleep(poll_seconds)
+            with self._lock:
+                loaded = list(self._loaded.items())
+            for key, kb in loaded:
+                if kb.state != 'ready':
+                    continue
+                fingerprint = database_fingerprint(kb.db_path)
+                if fingerprint == kb.fingerprint:
+                    pending.pop(key, None)
+                elif pending.get(key) == fingerprint:
+                    pending.pop(key, None)
+                    try:
+                        kb.reload()
+                    except Exception as e:
+                        print(f"[RAG] Error: Reload of '{key}' failed - {e}")
+                else:
+                    pending[key] = fingerprint
+
+    def close(self):
+        """Release the files of every loaded knowledge base (server shutdown)."""
+        with self._lock:
+            loaded = list(self._loaded.values())
+            self._loaded.clear()
+        for kb in loaded:
+            kb.unload()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded = [
+                {
+                    'version': key,
+                    'state': kb.state,
+                    'docs': len(kb.metadata) if kb.initialized else 0,
+                    'reload': kb.reload_status(),
+                    'idle_seconds': round(now - self._last_used.get(key, now), 1)
+                }
+                for key, kb in self._loaded.items()
+            ]
+        return {
+            'default': self.default_version(),
+            'available': self.available_versions(),
+            'loaded': loaded,
+            'max_loaded': self.max_loaded,
+            'loads': self.loads,
+            'unloads': self.unloads,
+            'reload_watch': RELOAD_POLL_SECONDS if RELOAD_WATCH else None
+        }
+
+
+# Shared encoder, retrieval result cache and per-version knowledge bases
+query_embedder = QueryEmbedder()
+retrieval_cache = LRUCache(RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL)
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL, persist_path=ANSWER_CACHE_PATH)
+semantic_cache = SemanticAnswerCache(SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD)
+knowledge_bases = KnowledgeBaseRegistry(
+    DB_PATH,
+    max_loaded=MAX_LOADED_KNOWLEDGE_BASES,
+    idle_seconds=KNOWLEDGE_BASE_IDLE_SECONDS
+)
+# Keep-alive connection pool and circuit breaker for every Ollama call
+ollama_client = OllamaClient(
+    OLLAMA_URL,
+    connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+    read_timeout=OLLAMA_READ_TIMEOUT,
+    retries=OLLAMA_RETRIES,
+    failure_threshold=OLLAMA_BREAKER_FAILURES,
+    reset_seconds=OLLAMA_BREAKER_RESET_SECONDS
+)
+llm_requests = RequestCoalescer(enabled=OLLAMA_COALESCE)
 
 # Global scene data cache (last received from Blender)
 cached_scene_data = {
@@ -167,7 +1092,7 @@ cached_scene_data = {
 }
 
 
-def call_ollama(system_prompt, user_prompt, model=None, temperature=0.7, timeout=120):
+def call_ollama(system_prompt, user_prompt, model=None, temperature=0.7, timeout=None):
     """
     Call local Ollama API.
 
@@ -176,40 +1101,48 @@ def call_ollama(system_prompt, user_prompt, model=None, temperature=0.7, timeout
         user_prompt: User's actual question/request
         model: Model name (default from env or qwen2.5:7b-instruct-q4_K_M)
         temperature: Sampling temperature for creativity (0.0-1.0)
-        timeout: Request timeout in seconds (default 120)
+        timeout: Read timeout in seconds (default OLLAMA_READ_TIMEOUT, 120)
 
-    Note: 120-second timeout is needed because:
+    Note: 120-second (read) timeout is needed because:
     - First request loads the model into memory (~10-30 seconds)
     - Large context windows with RAG data may take time to process
     - Complex educational responses require reasoning time
     - Better to have a long timeout than fail on legitimate requests
+    A stopped Ollama still fails fast: connecting is bounded by
+    OLLAMA_CONNECT_TIMEOUT, and the circuit breaker refuses calls outright
+    after repeated failures.
     """
     if model is None:
         model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
 
-    payload = {
-        "model": model,
-        "stream": False,
-        "options": {"temperature": temperature},
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    }
+    start = time.perf_counter()
+    content, coalesced = llm_requests.call(
+        request_key(system_prompt, user_prompt, model, temperature),
+        lambda: ollama_client.chat(system_prompt, user_prompt, model, temperature, read_timeout=timeout)
+    )
+    if coalesced:
+        print(f"[Ollama] Info: Joined an identical in-flight request, answered in {time.perf_counter() - start:.2f}s")
+    else:
+        print(f"[Ollama] Info: Generated in {time.perf_counter() - start:.2f}s")
+    return content
 
-    try:
-        response = req_lib.post(
-            "http://127.0.0.1:11434/api/chat",
-            json=payload,
-            timeout=timeout
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["message"]["content"]
-    except req_lib.exceptions.ConnectionError:
-        raise Exception("Ollama not running. Start it with: ollama serve")
-    except Exception as e:
-        raise Exception(f"Ollama request failed: {e}")
+
+def stream_ollama(system_prompt, user_prompt, model=None, temperature=0.7, timeout=None):
+    """
+    Call local Ollama API with streaming.
+
+    Takes the same arguments as call_ollama and returns a ChatStream: iterate
+    it for the content fragments. The connection is opened here, so "Ollama
+    not running" surfaces before a response starts; timeout then bounds the
+    wait between tokens. A stream identical to one already running joins it
+    and replays what has been generated so far.
+    """
+    if model is None:
+        model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
+    return llm_requests.stream(
+        request_key(system_prompt, user_prompt, model, temperature),
+        lambda: ollama_client.chat_stream(system_prompt, user_prompt, model, temperature, read_timeout=timeout)
+    )
 
 
 def validate_model_name(model):
@@ -234,10 +1167,23 @@ def validate_model_name(model):
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
+    rag = knowledge_bases.get()
     return jsonify({
         'status': 'ok',
         'rag_enabled': rag.initialized,
-        'rag_docs': len(rag.metadata) if rag.initialized else 0
+        'rag_state': rag.state,
+        'rag_warmup': rag.warmup_status(),
+        'rag_docs': len(rag.metadata) if rag.initialized else 0,
+        'rag_search': rag.search_mode,
+        'knowledge_bases': knowledge_bases.stats(),
+        'encoder': query_embedder.stats(),
+        'query_cache': query_embedder.query_cache.stats(),
+        'retrieval_cache': retrieval_cache.stats(),
+        'answer_cache': answer_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'llm_unavailable': ollama_client.unavailable,
+        'llm': ollama_client.stats(),
+        'llm_coalescing': llm_requests.stats()
     })
 
 
@@ -266,11 +1212,17 @@ def retrieve_rag():
         if n_results < 1 or n_results > 10:
             return jsonify({'error': 'n_results must be between 1 and 10'}), 400
 
+        blender_version, version_error = parse_blender_version(data.get('blender_version'))
+        if version_error:
+            return jsonify({'error': version_error}), 400
+
+        rag = knowledge_bases.get(blender_version)
         contexts = rag.retrieve_context(query, n_results=n_results)
 
         return jsonify({
             'contexts': contexts,
-            'rag_enabled': rag.initialized
+            'rag_enabled': rag.initialized,
+            'blender_version': rag.version
         })
     except Exception as e:
         print(f"[RAG] Error: Failed to retrieve context - {e}")
@@ -278,6 +1230,107 @@ def retrieve_rag():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/rag/retrieve_batch', methods=['POST'])
+def retrieve_rag_batch():
+    """Retrieve RAG context for many queries in one request (no Ollama call)."""
+    try:
+        data = request.json
+        if data is None:
+            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+
+        queries = data.get('queries')
+        if not isinstance(queries, list):
+            return jsonify({'error': 'queries must be an array of strings'}), 400
+        if not queries:
+            return jsonify({'error': 'queries must be a non-empty array'}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({'error': f'Too many queries (max {MAX_BATCH_QUERIES})'}), 400
+
+        cleaned = []
+        for i, query in enumerate(queries):
+            if not isinstance(query, str):
+                return jsonify({'error': f'queries[{i}] must be a string'}), 400
+            query = query.strip()
+            if not query:
+                return jsonify({'error': f'queries[{i}] must be a non-empty string'}), 400
+            if len(query) > 10000:
+                return jsonify({'error': f'queries[{i}] too long (max 10,000 characters)'}), 400
+            cleaned.append(query)
+
+        n_results = data.get('n_results', 3)
+        if not isinstance(n_results, int):
+            return jsonify({'error': 'n_results must be an integer'}), 400
+        if n_results < 1 or n_results > 10:
+            return jsonify({'error': 'n_results must be between 1 and 10'}), 400
+
+        blender_version, version_error = parse_blender_version(data.get('blender_version'))
+        if version_error:
+            return jsonify({'error': version_error}), 400
+
+        rag = knowledge_bases.get(blender_version)
+        results = rag.retrieve_batch(cleaned, n_results=n_results)
+
+        return jsonify({
+            'results': [{'query': q, 'contexts': c} for q, c in zip(cleaned, results)],
+            'rag_enabled': rag.initialized,
+            'blender_version': rag.version
+        })
+    except Exception as e:
+        print(f"[RAG] Error: Failed to retrieve batch context - {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload knowledge bases from disk after a rebuild, without a restart."""
+    try:
+        # An empty body reloads everything; a malformed one must not
+        data = {}
+        if request.get_data(cache=True).strip():
+            data = request.get_json(force=True, silent=True)
+            if data is None:
+                return jsonify({'error': 'Invalid JSON body'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Body must be a JSON object'}), 400
+
+        requested = data.get('blender_version')
+        if requested != DEFAULT_KB_KEY:
+            requested, version_error = parse_blender_version(requested)
+            if version_error:
+                return jsonify({'error': version_error}), 400
+
+        results = knowledge_bases.reload(requested)
+        ok = all(result['status'] != 'failed' for result in results.values())
+        return jsonify({'results': results}), 200 if ok else 409
+    except Exception as e:
+        print(f"[RAG] Error: Reload failed - {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/admin/semantic_cache', methods=['GET'])
+def admin_semantic_cache():
+    """Semantic cache hit rates and its most recent hits, for spotting false matches."""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'stats': semantic_cache.stats(),
+        'recent_hits': semantic_cache.review(limit)
+    })
+
+
+@app.route('/admin/semantic_cache/forget', methods=['POST'])
+def admin_semantic_cache_forget():
+    """Drop a semantic cache entry that answered the wrong question (counted as a false hit)."""
+    data = request.get_json(silent=True) or {}
+    entry_id = data.get('id') if isinstance(data, dict) else None
+    if not isinstance(entry_id, int):
+        return jsonify({'error': 'id must be the integer id of a cache entry'}), 400
+    if not semantic_cache.forget(entry_id):
+        return jsonify({'error': f'No semantic cache entry {entry_id}'}), 404
+    return jsonify({'forgotten': entry_id, 'stats': semantic_cache.stats()})
+
+
 @app.route('/scene/update', methods=['POST'])
 def update_scene():
     """Receive scene data from Blender addon and cache it."""
@@ -377,67 +1430,79 @@ def get_current_scene():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/ask', methods=['POST'])
-def ask_question():
-    """Answer educational questions about Blender."""
-    try:
-        # Validate input
-        data = request.json
-        if data is None:
-            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
-
-        question = data.get('question', '')
-        scene_context = data.get('scene_context', {})
-        model, model_error = validate_model_name(data.get('model'))
-        if model_error:
-            return jsonify({'error': model_error}), 400
-
-        # Validate question
-        if not isinstance(question, str):
-            return jsonify({'error': 'Question must be a string'}), 400
-
-        question = question.strip()
-
-        # Enforce input length limits (10,000 chars = ~2,500 words)
-        if len(question) > 10000:
-            return jsonify({'error': 'Question too long (max 10,000 characters)'}), 400
-
-        # If no scene_context provided, use cached data
-        if not scene_context and cached_scene_data['scene_data']:
-            scene_context = cached_scene_data['scene_data']
-
-        if not question:
-            return jsonify({'error': 'No question provided'}), 400
-
-        print(f"\n{'='*60}")
-        print(f"Question: {question}")
-        print(f"{'='*60}")
-
-        # Retrieve relevant documentation
-        contexts = rag.retrieve_context(question, n_results=3)
-
-        if contexts:
-            print(f"[RAG] OK: Retrieved {len(contexts)} relevant docs")
-            context_section = "\n\n".join([
-                f"### {ctx['signature']}\n{ctx['text']}"
-                for ctx in contexts
-            ])
-        else:
-            print("[RAG] Warning: No RAG context available")
-            context_section = "(No specific documentation found)"
+def prepare_ask(data):
+    """
+    Validate an /ask request, retrieve documentation and build the prompts.
 
-        # Format scene context
-        scene_summary = ""
-        if scene_context:
-            scene_summary = f"""
+    Returns:
+        (dict of system_prompt, user_prompt, model, contexts, rag, cache_model,
+        cache_key, question, question_embedding, scene_class), or
+        (None, error message) if the request is invalid
+    """
+    question = data.get('question', '')
+    scene_context = data.get('scene_context', {})
+    model, model_error = validate_model_name(data.get('model'))
+    if model_error:
+        return None, model_error
+    blender_version, version_error = parse_blender_version(data.get('blender_version'))
+    if version_error:
+        return None, version_error
+
+    # Validate question
+    if not isinstance(question, str):
+        return None, 'Question must be a string'
+
+    question = question.strip()
+
+    # Enforce input length limits (10,000 chars = ~2,500 words)
+    if len(question) > 10000:
+        return None, 'Question too long (max 10,000 characters)'
+
+    # If no scene_context provided, use cached data
+    if not scene_context and cached_scene_data['scene_data']:
+        scene_context = cached_scene_data['scene_data']
+
+    if not question:
+        return None, 'No question provided'
+
+    print(f"\n{'='*60}")
+    print(f"Question: {question}")
+    print(f"{'='*60}")
+
+    # Retrieve relevant documentation
+    rag = knowledge_bases.get(blender_version)
+    contexts, question_embedding = rag.retrieve_context(question, n_results=3, return_embedding=True)
+    if question_embedding is None and semantic_cache.enabled:
+        question_embedding = rag.question_embedding(question)
+
+    if contexts:
+        print(f"[RAG] OK: Retrieved {len(contexts)} relevant docs")
+        context_section = "\n\n".join([
+            f"### {ctx['signature']}\n{ctx['text']}"
+            for ctx in contexts
+        ])
+    else:
+        print("[RAG] Warning: No RAG context available")
+        context_section = "(No specific documentation found)"
+
+    # Format scene context
+    scene_summary = ""
+    scene_fields = None
+    if scene_context:
+        scene_fields = {
+            'object_count': scene_context.get('object_count', 0),
+            'active_object': scene_context.get('active_object', 'None'),
+            'mode': scene_context.get('mode', 'OBJECT'),
+        }
+        scene_summary = f"""
 Current Scene Information:
 - Objects: {scene_context.get('object_count', 0)} total
 - Active: {scene_context.get('active_object', 'None')}
 - Mode: {scene_context.get('mode', 'OBJECT')}
 """
 
-        # Educational prompt
-        system_prompt = f"""You are a patient Blender instructor helping students learn 3D modeling through the Blender interface.
+    # Educational prompt
+    system_prompt = f"""You are a patient Blender instructor helping students learn 3D modeling through the Blender interface.
 
 CRITICAL INSTRUCTION: You MUST teach using UI-based instructions only. NEVER provide Python code or bpy commands.
 
@@ -468,77 +1533,112 @@ NEVER write responses like this:
 - "Run this Python code: ..."
 - Any Python code snippets or bpy commands"""
 
-        user_prompt = f"""Question: {question}
+    user_prompt = f"""Question: {question}
 
 Provide a clear, educational answer that helps the student understand this Blender concept."""
 
-        # Call Ollama
-        print("[Ollama] Info: Calling Ollama for educational response...")
-        response = call_ollama(
-            system_prompt,
-            user_prompt,
-            model=model,
-            temperature=0.7
-        )
-
-        print("[Ollama] OK: Answer generated successfully")
-        print(f"{'='*60}\n")
-
-        return jsonify({
-            'answer': response.strip(),
-            'contexts_used': len(contexts),
-            'rag_enabled': rag.initialized
-        })
+    # Cache keys use the model that will actually answer
+    cache_model = model or os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
+
+    return {
+        'system_prompt': system_prompt,
+        'user_prompt': user_prompt,
+        'model': model,
+        'contexts': contexts,
+        'rag': rag,
+        'cache_model': cache_model,
+        'cache_key': answer_cache_key(
+            question, scene_fields, cache_model, ASK_TEMPERATURE,
+            [chunk_hash(ctx['text']) for ctx in contexts]
+        ),
+        'question': question,
+        'question_embedding': question_embedding if semantic_cache.enabled else None,
+        'scene_class': scene_class(scene_fields),
+    }, None
+
+
+def scene_class(scene_fields):
+    """
+    Coarse scene description for the semantic answer cache.
 
-    except Exception as e:
-        error_msg = str(e)
-        print(f"[Ask] Error: Request failed - {error_msg}")
-        traceback.print_exc()
-        return jsonify({'error': error_msg}), 500
+    Rephrased questions may share an answer when the scenes are alike (same
+    mode, empty or not), not only when they are identical.
+    """
+    if scene_fields is None:
+        return 'no_scene'
+    populated = 'objects' if scene_fields['object_count'] else 'empty'
+    return f"{str(scene_fields['mode']).lower()}:{populated}"
 
 
-@app.route('/scene_analysis', methods=['POST'])
-def analyze_scene():
-    """Analyze scene and suggest next steps for learning."""
-    try:
-        # Validate input
-        data = request.json
-        if data is None:
-            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+def semantic_partition(prepared):
+    return (prepared['cache_model'], prepared['rag'].version, prepared['scene_class'])
 
-        goal = data.get('goal', 'learning blender')
-        scene_data = data.get('scene_data', {})
-        model, model_error = validate_model_name(data.get('model'))
-        if model_error:
-            return jsonify({'error': model_error}), 400
 
-        # Validate goal
-        if not isinstance(goal, str):
-            return jsonify({'error': 'Goal must be a string'}), 400
+def cached_answer(prepared):
+    """
+    Answer for a prepared /ask from the exact or the semantic cache.
 
-        goal = goal.strip()
+    Returns:
+        (answer, semantic match or None), or (None, None) on a miss
+    """
+    answer = answer_cache.get(prepared['cache_key'])
+    if answer is not None or prepared['question_embedding'] is None:
+        return answer, None
+    match = semantic_cache.lookup(prepared['question_embedding'], semantic_partition(prepared), prepared['question'])
+    if match is None:
+        return None, None
+    print(f"[Cache] Info: Semantic match {match['similarity']:.3f} with \"{match['question']}\"")
+    return match['answer'], {'id': match['id'], 'question': match['question'], 'similarity': round(match['similarity'], 4)}
 
-        # Enforce input length limits
-        if len(goal) > 500:
-            return jsonify({'error': 'Goal too long (max 500 characters)'}), 400
 
-        # Validate scene_data is a dict
-        if not isinstance(scene_data, dict):
-            return jsonify({'error': 'Scene data must be an object'}), 400
+def remember_answer(prepared, answer):
+    """Store a generated /ask answer in the exact and the semantic cache."""
+    answer_cache.put(prepared['cache_key'], answer)
+    if prepared['question_embedding'] is not None:
+        semantic_cache.put(prepared['question_embedding'], semantic_partition(prepared), prepared['question'], answer)
 
-        print(f"\n{'='*60}")
-        print(f"Scene Analysis - Goal: {goal}")
-        print(f"Objects in scene: {scene_data.get('object_count', 0)}")
-        print(f"{'='*60}")
 
-        # Format scene info
-        objects_list = "\n".join([
-            f"  - {obj['name']} ({obj['type']})" +
-            (f" with {len(obj.get('modifiers', []))} modifiers" if obj.get('modifiers') else "")
-            for obj in scene_data.get('objects', [])
-        ])
+def prepare_scene_analysis(data):
+    """
+    Validate a /scene_analysis request and build the prompts.
 
-        scene_summary = f"""Current Scene:
+    Returns:
+        (dict of system_prompt, user_prompt, model, scene_summary), or
+        (None, error message) if the request is invalid
+    """
+    goal = data.get('goal', 'learning blender')
+    scene_data = data.get('scene_data', {})
+    model, model_error = validate_model_name(data.get('model'))
+    if model_error:
+        return None, model_error
+
+    # Validate goal
+    if not isinstance(goal, str):
+        return None, 'Goal must be a string'
+
+    goal = goal.strip()
+
+    # Enforce input length limits
+    if len(goal) > 500:
+        return None, 'Goal too long (max 500 characters)'
+
+    # Validate scene_data is a dict
+    if not isinstance(scene_data, dict):
+        return None, 'Scene data must be an object'
+
+    print(f"\n{'='*60}")
+    print(f"Scene Analysis - Goal: {goal}")
+    print(f"Objects in scene: {scene_data.get('object_count', 0)}")
+    print(f"{'='*60}")
+
+    # Format scene info
+    objects_list = "\n".join([
+        f"  - {obj['name']} ({obj['type']})" +
+        (f" with {len(obj.get('modifiers', []))} modifiers" if obj.get('modifiers') else "")
+        for obj in scene_data.get('objects', [])
+    ])
+
+    scene_summary = f"""Current Scene:
 - Total objects: {scene_data.get('object_count', 0)}
 - Active object: {scene_data.get('active_object', 'None')}
 - Mode: {scene_data.get('mode', 'OBJECT')}
@@ -548,8 +1648,8 @@ Objects:
 {objects_list if objects_list else '  (empty scene)'}
 """
 
-        # Educational suggestion prompt
-        system_prompt = f"""You are a Blender instructor analyzing a student's scene to suggest what they should learn next.
+    # Educational suggestion prompt
+    system_prompt = f"""You are a Blender instructor analyzing a student's scene to suggest what they should learn next.
 
 {scene_summary}
 
@@ -562,39 +1662,225 @@ Your task:
 
 Provide suggestions as a numbered list. Each suggestion should be ONE sentence that starts with an action verb."""
 
-        user_prompt = f"""The student's goal is: {goal}
+    user_prompt = f"""The student's goal is: {goal}
 
 Based on their current scene, what should they try next to continue learning? Provide 3-5 specific suggestions."""
 
+    return {
+        'system_prompt': system_prompt,
+        'user_prompt': user_prompt,
+        'model': model,
+        'scene_summary': scene_summary,
+    }, None
+
+
+def clean_suggestion(line):
+    """One line of the model's numbered list without its number, or "" for blank lines."""
+    # Remove leading number and punctuation (e.g., "1.", "1)", "1 -")
+    return re.sub(r'^\d+[\.\)\-\:]\s*', '', line.strip())
+
+
+def parse_suggestions(text):
+    """
+    Parse numbered list into array.
+
+    Expected format: "1. First suggestion\n2. Second suggestion\n..."
+    """
+    suggestions = []
+    for line in text.strip().split('\n'):
+        cleaned = clean_suggestion(line)
+        if cleaned:
+            suggestions.append(cleaned)
+    return suggestions
+
+
+def ndjson_event(event_type, **fields):
+    """One line of a streamed (application/x-ndjson) response."""
+    return json.dumps({'type': event_type, **fields}) + "\n"
+
+
+def stream_response(events, on_close=None):
+    """
+    Flask response that sends each NDJSON line as soon as it is produced.
+
+    on_close runs when the response is closed, including when the client
+    disconnected before the events generator even started.
+    """
+    response = Response(
+        stream_with_context(events),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+@app.route('/ask', methods=['POST'])
+def ask_question():
+    """Answer educational questions about Blender."""
+    try:
+        # Validate input
+        data = request.json
+        if data is None:
+            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+
+        prepared, error = prepare_ask(data)
+        if error:
+            return jsonify({'error': error}), 400
+        rag = prepared['rag']
+
+        answer, semantic_match = cached_answer(prepared)
+        cached = answer is not None
+        if cached:
+            print("[Ollama] OK: Answer served from cache")
+        else:
+            # Call Ollama
+            print("[Ollama] Info: Calling Ollama for educational response...")
+            response = call_ollama(
+                prepared['system_prompt'],
+                prepared['user_prompt'],
+                model=prepared['model'],
+                temperature=ASK_TEMPERATURE
+            )
+            answer = response.strip()
+            remember_answer(prepared, answer)
+            print("[Ollama] OK: Answer generated successfully")
+        print(f"{'='*60}\n")
+
+        result = {
+            'answer': answer,
+            'cached': cached,
+            'contexts_used': len(prepared['contexts']),
+            'rag_enabled': rag.initialized,
+            'blender_version': rag.version
+        }
+        if semantic_match:
+            result['semantic_match'] = semantic_match
+        return jsonify(result)
+
+    except LLMUnavailable as e:
+        print(f"[Ask] Error: LLM unavailable - {e}")
+        return jsonify({'error': str(e), 'llm_unavailable': True}), 503
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[Ask] Error: Request failed - {error_msg}")
+        traceback.print_exc()
+        return jsonify({'error': error_msg}), 500
+
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming /ask: the answer is relayed token by token as NDJSON lines.
+
+    Events: "start" (contexts_used, rag_enabled, blender_version, cached,
+    semantic_match when the answer belongs to a similar question),
+    then "token" (content) per fragment, then "done" (answer, timings) or
+    "error". A cached answer arrives as a single token.
+    """
+    stream = None
+    try:
+        data = request.json
+        if data is None:
+            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+
+        prepared, error = prepare_ask(data)
+        if error:
+            return jsonify({'error': error}), 400
+        rag = prepared['rag']
+
+        cached, semantic_match = cached_answer(prepared)
+        if cached is None:
+            print("[Ollama] Info: Streaming educational response...")
+            stream = stream_ollama(
+                prepared['system_prompt'],
+                prepared['user_prompt'],
+                model=prepared['model'],
+                temperature=ASK_TEMPERATURE
+            )
+    except LLMUnavailable as e:
+        print(f"[Ask] Error: LLM unavailable - {e}")
+        return jsonify({'error': str(e), 'llm_unavailable': True}), 503
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[Ask] Error: Request failed - {error_msg}")
+        traceback.print_exc()
+        return jsonify({'error': error_msg}), 500
+
+    def events():
+        try:
+            yield ndjson_event(
+                'start',
+                contexts_used=len(prepared['contexts']),
+                rag_enabled=rag.initialized,
+                blender_version=rag.version,
+                cached=cached is not None,
+                **({'semantic_match': semantic_match} if semantic_match else {})
+            )
+            if cached is not None:
+                print("[Ollama] OK: Answer served from cache")
+                print(f"{'='*60}\n")
+                yield ndjson_event('token', content=cached)
+                yield ndjson_event('done', answer=cached, time_to_first_token_ms=0.0, total_ms=0.0)
+                return
+            parts = []
+            try:
+                for content in stream:
+                    parts.append(content)
+                    yield ndjson_event('token', content=content)
+            except Exception as e:
+                print(f"[Ask] Error: Stream failed - {e}")
+                yield ndjson_event('error', error=str(e))
+                return
+            answer = "".join(parts).strip()
+            remember_answer(prepared, answer)
+            print(f"[Ollama] OK: Answer streamed ({stream.describe_timings()})")
+            print(f"{'='*60}\n")
+            yield ndjson_event('done', answer=answer, **stream.timings())
+        finally:
+            # Also reached when the client disconnects, even before the first token
+            if stream is not None:
+                stream.close()
+
+    return stream_response(events(), on_close=stream.close if stream is not None else None)
+
+
+@app.route('/scene_analysis', methods=['POST'])
+def analyze_scene():
+    """Analyze scene and suggest next steps for learning."""
+    try:
+        # Validate input
+        data = request.json
+        if data is None:
+            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+
+        prepared, error = prepare_scene_analysis(data)
+        if error:
+            return jsonify({'error': error}), 400
+
         # Call Ollama
         print("[Ollama] Info: Generating scene analysis suggestions...")
         response = call_ollama(
-            system_prompt,
-            user_prompt,
-            model=model,
+            prepared['system_prompt'],
+            prepared['user_prompt'],
+            model=prepared['model'],
             temperature=0.7
         )
 
-        # Parse numbered list into array
-        # Expected format: "1. First suggestion\n2. Second suggestion\n..."
-        suggestions_list = []
-        for line in response.strip().split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-            # Remove leading number and punctuation (e.g., "1.", "1)", "1 -")
-            cleaned = re.sub(r'^\d+[\.\)\-\:]\s*', '', line)
-            if cleaned:
-                suggestions_list.append(cleaned)
+        suggestions_list = parse_suggestions(response)
 
         print("[Ollama] OK: Suggestions generated successfully")
         print(f"{'='*60}\n")
 
         return jsonify({
             'suggestions': suggestions_list,
-            'scene_summary': scene_summary
+            'scene_summary': prepared['scene_summary']
         })
 
+    except LLMUnavailable as e:
+        print(f"[SceneAnalysis] Error: LLM unavailable - {e}")
+        return jsonify({'error': str(e), 'llm_unavailable': True}), 503
     except Exception as e:
         error_msg = str(e)
         print(f"[SceneAnalysis] Error: Request failed - {error_msg}")
@@ -602,13 +1888,79 @@ Based on their current scene, what should they try next to continue learning? Pr
         return jsonify({'error': error_msg}), 500
 
 
+@app.route('/scene_analysis/stream', methods=['POST'])
+def analyze_scene_stream():
+    """
+    Streaming /scene_analysis: each suggestion is sent as soon as its line is complete.
+
+    Events: "start" (scene_summary), then "suggestion" (index, text) per list
+    item, then "done" (suggestions, timings) or "error".
+    """
+    try:
+        data = request.json
+        if data is None:
+            return jsonify({'error': 'Invalid JSON or Content-Type must be application/json'}), 400
+
+        prepared, error = prepare_scene_analysis(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        print("[Ollama] Info: Streaming scene analysis suggestions...")
+        stream = stream_ollama(
+            prepared['system_prompt'],
+            prepared['user_prompt'],
+            model=prepared['model'],
+            temperature=0.7
+        )
+    except LLMUnavailable as e:
+        print(f"[SceneAnalysis] Error: LLM unavailable - {e}")
+        return jsonify({'error': str(e), 'llm_unavailable': True}), 503
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[SceneAnalysis] Error: Request failed - {error_msg}")
+        traceback.print_exc()
+        return jsonify({'error': error_msg}), 500
+
+    def events():
+        try:
+            yield ndjson_event('start', scene_summary=prepared['scene_summary'])
+            suggestions = []
+            pending = ""
+            try:
+                for content in stream:
+                    pending += content
+                    # Every newline completes a list item
+                    *lines, pending = pending.split('\n')
+                    for line in lines:
+                        cleaned = clean_suggestion(line)
+                        if cleaned:
+                            suggestions.append(cleaned)
+                            yield ndjson_event('suggestion', index=len(suggestions) - 1, text=cleaned)
+            except Exception as e:
+                print(f"[SceneAnalysis] Error: Stream failed - {e}")
+                yield ndjson_event('error', error=str(e))
+                return
+            cleaned = clean_suggestion(pending)
+            if cleaned:
+                suggestions.append(cleaned)
+                yield ndjson_event('suggestion', index=len(suggestions) - 1, text=cleaned)
+            print(f"[Ollama] OK: Suggestions streamed ({stream.describe_timings()})")
+            print(f"{'='*60}\n")
+            yield ndjson_event('done', suggestions=suggestions, **stream.timings())
+        finally:
+            # Also reached when the client disconnects, even before the first suggestion
+            stream.close()
+
+    return stream_response(events(), on_close=stream.close)
+
+
 @app.route('/test', methods=['GET'])
 def test():
     """Test endpoint."""
     return jsonify({
         'message': 'RAG Server is running!',
-        'rag_enabled': rag.initialized,
-        'endpoints': ['/health', '/rag/retrieve', '/scene/update', '/scene/current', '/ask', '/scene_analysis', '/test']
+        'rag_enabled': knowledge_bases.get().initialized,
+        'endpoints': ['/health', '/rag/retrieve', '/rag/retrieve_batch', '/scene/update', '/scene/current', '/ask', '/ask/stream', '/scene_analysis', '/scene_analysis/stream', '/admin/reload', '/admin/semantic_cache', '/test']
     })
 
 
@@ -622,24 +1974,37 @@ def main():
     print("")
     print("Educational Mode:")
     print("  - RAG retrieval: POST /rag/retrieve")
+    print("  - Batch retrieval: POST /rag/retrieve_batch")
     print("  - Q&A endpoint: POST /ask")
     print("  - Scene analysis: POST /scene_analysis")
+    print("  - Streaming (NDJSON): POST /ask/stream, POST /scene_analysis/stream")
     print("  - Scene update: POST /scene/update")
     print("  - Scene current: GET /scene/current")
+    print("  - Reload index: POST /admin/reload")
+    print("  - Semantic cache review: GET /admin/semantic_cache")
     print("")
     print(f"Model: {os.getenv('OLLAMA_MODEL', 'qwen2.5:7b-instruct-q4_K_M')}")
+    print(f"Ollama: {OLLAMA_URL}")
     print("="*60 + "\n")
 
-    # Try to initialize RAG
-    if rag.initialize():
-        print("[Server] OK: RAG system ready (API documentation loaded)\n")
-    else:
-        print("[Server] Warning: RAG disabled - will use LLM knowledge only\n")
+    # Warm up RAG in the background so the port is open immediately;
+    # /health reports rag_state "warming" until it is done
+    knowledge_bases.start_warmup()
+    print("[Server] Info: RAG system warming up in the background (see /health)")
+    print("[Server] Info: Requests during warm-up fall back to LLM knowledge only\n")
+
+    if RELOAD_WATCH:
+        knowledge_bases.start_watcher(RELOAD_POLL_SECONDS)
+        print(f"[Server] Info: Reloading knowledge bases when their files change (every {RELOAD_POLL_SECONDS:g}s)\n")
 
     print("Press Ctrl+C to stop the server\n")
 
     # Run server
-    app.run(host='127.0.0.1', port=5179, debug=False)
+    try:
+        app.run(host='127.0.0.1', port=5179, debug=False)
+    finally:
+        knowledge_bases.close()
+        ollama_client.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,137 @@
+"""
+Shard Generations for Blender Helper AI
+
+Every build of a knowledge base shard writes its files into a new
+generation directory and then points the shard at it:
+
+    simple_db/4.2/CURRENT          "gen-000003"
+    simple_db/4.2/gen-000003/      vectors.bhvi, knowledge.sqlite, ...
+
+Files a running server has memory-mapped or open are never replaced in
+place, which Windows refuses to do. The server opens the generation CURRENT
+names, and after /admin/reload releases the old one once no request uses it
+any more. Old generations are deleted by later builds; one still held open
+is skipped and removed by the build after that.
+
+Shards from before generations keep their files directly in the shard
+directory and are read from there until their first rebuild.
+"""
+
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+POINTER_FILENAME = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+_GENERATION_RE = re.compile(rf"^{GENERATION_PREFIX}(\d+)$")
+
+
+def generation_number(path):
+    match = _GENERATION_RE.match(Path(path).name)
+    return int(match.group(1)) if match else None
+
+
+def list_generations(shard_path):
+    """Generation directories of a shard, oldest first."""
+    shard_path = Path(shard_path)
+    if not shard_path.is_dir():
+        return []
+    generations = [p for p in shard_path.iterdir() if p.is_dir() and generation_number(p) is not None]
+    return sorted(generations, key=generation_number)
+
+
+def current_generation(shard_path):
+    """
+    Directory holding the shard's current files.
+
+    The generation CURRENT names, or the shard directory itself for shards
+    written before generations (or when CURRENT is missing or dangling).
+    """
+    shard_path = Path(shard_path)
+    try:
+        name = (shard_path / POINTER_FILENAME).read_text(encoding='utf-8').strip()
+    except OSError:
+        return shard_path
+    generation = shard_path / name
+    if generation_number(generation) is None or not generation.is_dir():
+        return shard_path
+    return generation
+
+
+def new_generation(shard_path):
+    """Create an empty generation directory numbered after the newest one."""
+    shard_path = Path(shard_path)
+    generations = list_generations(shard_path)
+    number = generation_number(generations[-1]) + 1 if generations else 1
+    generation = shard_path / f"{GENERATION_PREFIX}{number:06d}"
+    generation.mkdir(parents=True)
+    return generation
+
+
+def publish_generation(shard_path, generation, attempts=5):
+    """
+    Make generation the shard's current one.
+
+    CURRENT is replaced atomically. Readers only hold it open for a moment,
+    so a replace that Windows refuses is retried.
+    """
+    shard_path = Path(shard_path)
+    pointer = shard_path / POINTER_FILENAME
+    tmp_pointer = shard_path / (POINTER_FILENAME + ".tmp")
+    tmp_pointer.write_text(Path(generation).name + "\n", encoding='utf-8')
+    for attempt in range(attempts):
+        try:
+            os.replace(tmp_pointer, pointer)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+def remove_old_generations(shard_path, keep=2):
+    """
+    Delete all but the newest keep generations (the current one is always kept).
+
+    Returns:
+        (names removed, names still in use and skipped)
+    """
+    current = current_generation(shard_path)
+    removed, in_use = [], []
+    for generation in list_generations(shard_path)[:-max(1, keep)]:
+        if generation == current:
+            continue
+        try:
+            shutil.rmtree(generation)
+            removed.append(generation.name)
+        except OSError:
+            in_use.append(generation.name)
+    return removed, in_use
+
+
+def remove_legacy_files(shard_path, names):
+    """
+    Delete files a pre-generation build left directly in the shard directory.
+
+    Only done once a generation is current; files still open are skipped.
+
+    Returns:
+        Names removed.
+    """
+    shard_path = Path(shard_path)
+    if current_generation(shard_path) == shard_path:
+        return []
+    removed = []
+    for name in names:
+        path = shard_path / name
+        if not path.is_file():
+            continue
+        try:
+            path.unlink()
+            removed.append(name)
+        except OSError:
+            pass
+    return removed
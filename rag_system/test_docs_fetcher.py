@@ -0,0 +1,143 @@
+"""
+Tests for docs_fetcher.DocsFetcher against the fixture site in fixtures/.
+
+Run from rag_system/:
+    python -m pytest test_docs_fetcher.py
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from docs_crawler import DocsCrawler
+from docs_fetcher import CRAWL_STATE_FILENAME, DocsFetcher
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+PAGES = sorted("/" + p.name for p in FIXTURES.glob("*.html"))
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serves fixtures/ (with Last-Modified and 304s) and records (path, status) per request."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), partial(FixtureHandler, directory=str(FIXTURES)))
+        self.lock = threading.Lock()
+        self.log = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def take_log(self):
+        with self.lock:
+            log, self.log = self.log, []
+        return log
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, code='-', size='-'):
+        with self.server.lock:
+            self.server.log.append((self.path, int(code)))
+
+    def log_message(self, *args):
+        pass
+
+
+class DocsFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer()
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.state_path = self.tmp / CRAWL_STATE_FILENAME
+        self.fetchers = []
+
+    def tearDown(self):
+        for fetcher in self.fetchers:
+            fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def fetcher(self):
+        fetcher = DocsFetcher(self.server.url, self.tmp / "cache", state_path=self.state_path,
+                              max_workers=4, min_interval=0.0, retries=0)
+        self.fetchers.append(fetcher)
+        return fetcher
+
+    def fetch_all(self, fetcher, pages=PAGES):
+        results = dict(fetcher.fetch_all(pages))
+        self.assertEqual(sorted(results), sorted(pages))
+        for url_path, html in results.items():
+            self.assertEqual(html, (FIXTURES / url_path.lstrip("/")).read_text(encoding='utf-8'))
+        return results
+
+    def test_first_fetch_downloads_every_page(self):
+        fetcher = self.fetcher()
+        self.fetch_all(fetcher)
+        self.assertEqual(sorted(self.server.take_log()), [(p, 200) for p in PAGES])
+        self.assertEqual(fetcher.stats()['fetched'], len(PAGES))
+        self.assertTrue(all(fetcher.cache_file(p).exists() for p in PAGES))
+
+    def test_rerun_revalidates_with_304_and_keeps_crawl_state(self):
+        first = self.fetcher()
+        self.fetch_all(first)
+        first.state.clear()
+        self.server.take_log()
+
+        second = self.fetcher()
+        self.fetch_all(second)
+        self.assertEqual(sorted(self.server.take_log()), [(p, 304) for p in PAGES])
+        stats = second.stats()
+        self.assertEqual(stats['not_modified'], len(PAGES))
+        self.assertEqual(stats['fetched'], 0)
+        self.assertEqual(stats['bytes_downloaded'], 0)
+
+        # Kept until the build that owns it completes
+        saved = json.loads(self.state_path.read_text(encoding='utf-8'))
+        self.assertEqual(saved['base_url'], self.server.url)
+        self.assertEqual(sorted(saved['done']), PAGES)
+
+    def test_resumes_after_interrupted_run(self):
+        interrupted = self.fetcher()
+        for url_path in PAGES[:3]:
+            self.assertIsNotNone(interrupted.fetch(url_path))
+        interrupted.state.save()  # as the periodic save would have
+        self.server.take_log()
+
+        resumed = self.fetcher()
+        self.assertEqual(resumed.state.resumed, frozenset(PAGES[:3]))
+        self.fetch_all(resumed)
+        self.assertEqual(sorted(path for path, _ in self.server.take_log()), PAGES[3:])
+        self.assertEqual(resumed.stats()['resumed'], 3)
+
+        # Completed build: the next run starts over and resumes nothing
+        resumed.state.clear()
+        self.assertFalse(self.state_path.exists())
+        fresh = self.fetcher()
+        self.fetch_all(fresh)
+        self.assertEqual(fresh.stats()['resumed'], 0)
+        self.assertEqual(len(self.server.take_log()), len(PAGES))
+
+    def test_pages_fetched_by_discovery_are_not_counted_as_resumed(self):
+        fetcher = self.fetcher()
+        pages = DocsCrawler(fetcher, max_depth=2).discover()
+        self.assertIn("/bpy.types.BevelModifier.html", pages)
+        self.fetch_all(fetcher, pages)
+        stats = fetcher.stats()
+        self.assertEqual(stats['resumed'], 0)
+        self.assertGreater(stats['reused'], 0)
+        self.assertEqual(stats['fetched'], len(self.server.take_log()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+Tests for ollama_client.OllamaClient against a stub Ollama HTTP server.
+
+Run from rag_system/:
+    python -m pytest test_ollama_client.py
+"""
+
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import LLMUnavailable, OllamaClient, RequestCoalescer
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    Answers POST /api/chat from a script of actions, one per request:
+    "ok", an HTTP status code, or "reset" (drop the connection unanswered).
+    Runs out of script -> "ok".
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.script = []
+        self.requests = 0
+        self.client_ports = []
+        self.connections_opened = 0
+        self.connections_closed = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_action(self, client_port):
+        with self.lock:
+            self.requests += 1
+            self.client_ports.append(client_port)
+            return self.script.pop(0) if self.script else "ok"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections_opened += 1
+
+    def finish(self):
+        super().finish()
+        with self.server.lock:
+            self.server.connections_closed += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        action = self.server.next_action(self.client_address[1])
+        if action == "reset":
+            self.close_connection = True
+            return
+        if action == "ok":
+            status, body = 200, {"message": {"role": "assistant", "content": "hello"}, "done": True}
+        else:
+            status, body = action, {"error": "stub failure"}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class OllamaClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubOllama()
+        threading.Thread(target=self.stub.serve_forever, args=(0.05,), daemon=True).start()
+        self.client = OllamaClient(self.stub.url, connect_timeout=2.0, read_timeout=5.0,
+                                   retries=2, backoff=0.0, failure_threshold=2, reset_seconds=0.3)
+
+    def tearDown(self):
+        self.client.close()
+        self.stub.shutdown()
+        self.stub.server_close()
+
+    def chat(self):
+        return self.client.chat("system", "user", "stub-model")
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return condition()
+
+    def test_reuses_connection(self):
+        for _ in range(5):
+            self.assertEqual(self.chat(), "hello")
+        self.assertEqual(self.stub.requests, 5)
+        self.assertEqual(len(set(self.stub.client_ports)), 1)
+        self.assertEqual(self.stub.connections_opened, 1)
+
+    def test_retries_retryable_5xx(self):
+        self.stub.script = [503, 502]
+        self.assertEqual(self.chat(), "hello")
+        self.assertEqual(self.stub.requests, 3)
+        self.assertEqual(self.client.counts['retries'], 2)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_retries_connection_reset(self):
+        self.stub.script = ["reset"]
+        self.assertEqual(self.chat(), "hello")
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(self.client.counts['retries'], 1)
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.stub.script = [500, 500]
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailable):
+                self.chat()
+        self.assertEqual(self.client.breaker.state, 'open')
+        self.assertTrue(self.client.unavailable)
+
+        started = time.perf_counter()
+        with self.assertRaises(LLMUnavailable) as raised:
+            self.chat()
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertIn("paused", str(raised.exception))
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(self.client.breaker.stats()['rejected'], 1)
+
+    def test_half_open_trial_recovers(self):
+        self.stub.script = [500, 500]
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailable):
+                self.chat()
+        time.sleep(0.35)
+        self.assertEqual(self.chat(), "hello")
+        self.assertEqual(self.client.breaker.state, 'closed')
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_failed_half_open_trial_reopens(self):
+        self.stub.script = [500, 500, 500]
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailable):
+                self.chat()
+        time.sleep(0.35)
+        with self.assertRaises(LLMUnavailable):
+            self.chat()
+        self.assertEqual(self.client.breaker.state, 'open')
+        self.assertEqual(self.client.breaker.stats()['opens'], 2)
+
+    def test_close_releases_connections(self):
+        self.chat()
+        self.assertEqual(self.stub.connections_closed, 0)
+        self.client.close()
+        self.assertTrue(self.wait_for(lambda: self.stub.connections_closed == 1))
+
+
+class RequestCoalescerTest(unittest.TestCase):
+
+    def endless_generation(self, closed):
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "token"
+        finally:
+            closed.set()
+
+    def test_stream_closed_before_iterating_is_abandoned(self):
+        coalescer = RequestCoalescer()
+        closed = threading.Event()
+        stream = coalescer.stream("key", lambda: self.endless_generation(closed))
+        stream.close()
+        stream.close()  # releases the subscriber only once
+        self.assertTrue(closed.wait(2.0))
+        self.assertEqual(coalescer.stats()['abandoned_streams'], 1)
+        self.assertEqual(coalescer.stats()['in_flight'], 0)
+
+    def test_stream_runs_on_while_a_subscriber_remains(self):
+        coalescer = RequestCoalescer()
+        closed = threading.Event()
+        leaving = coalescer.stream("key", lambda: self.endless_generation(closed))
+        staying = coalescer.stream("key", lambda: self.endless_generation(closed))
+        leaving.close()
+        fragments = iter(staying)
+        self.assertEqual([next(fragments) for _ in range(3)], ["token"] * 3)
+        self.assertFalse(closed.is_set())
+        fragments.close()
+        self.assertTrue(closed.wait(2.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
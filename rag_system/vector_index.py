@@ -0,0 +1,218 @@
+"""
+Vector Index File Format for Blender Helper AI
+
+Binary container for the RAG embedding matrix, written by build_database.py
+and memory-mapped by server.py.
+
+Layout:
+- 8 byte magic (b"BHVINDEX")
+- 4 byte little-endian header length
+- JSON header (format_version, dim, count, dtype, model, normalized, checksum)
+- zero padding up to a 64 byte boundary
+- count x dim unit-normalized float32 rows (C order)
+
+Rows are normalized at build time so cosine similarity is a single dot
+product at query time, and the data section can be opened with np.memmap so
+every server process shares the same page-cache pages.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+INDEX_FILENAME = "vectors.bhvi"
+INDEX_MAGIC = b"BHVINDEX"
+INDEX_FORMAT_VERSION = 1
+INDEX_DTYPE = "float32"
+DATA_ALIGNMENT = 64
+
+
+class IndexFormatError(Exception):
+    """Raised when a vector index file is missing, truncated or corrupt."""
+
+
+def normalize_rows(matrix):
+    """Return a float32 copy of matrix with every row scaled to unit length."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Zero rows stay zero instead of becoming NaN
+    norms = np.where(norms == 0, 1, norms)
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _data_offset(header_len):
+    prefix = len(INDEX_MAGIC) + 4 + header_len
+    return (prefix + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+
+def write_index(path, embeddings, model_name):
+    """
+    Normalize embeddings and write them as a versioned index file.
+
+    The file is written to a temporary sibling and renamed into place so a
+    running server never maps a half-written index.
+
+    Returns:
+        The header dict that was written.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return write_index_blocks(path, [matrix], matrix.shape[0], matrix.shape[1], model_name)
+
+
+def write_index_blocks(path, blocks, count, dim, model_name):
+    """
+    Write an index from an iterable of row blocks, one block in memory at a time.
+
+    Each block is normalized as it is written and the checksum is computed
+    incrementally. The header has a fixed length (the checksum is a fixed
+    width hex digest), so it is written last over a placeholder.
+
+    Returns:
+        The header dict that was written.
+    """
+    path = Path(path)
+    header = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "dim": int(dim),
+        "count": int(count),
+        "dtype": INDEX_DTYPE,
+        "model": model_name,
+        "normalized": True,
+        "checksum": "sha256:" + "0" * 64,
+    }
+    header_len = len(json.dumps(header, sort_keys=True).encode("utf-8"))
+    data_offset = _data_offset(header_len)
+
+    digest = hashlib.sha256()
+    written = 0
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.seek(data_offset)
+        for block in blocks:
+            rows = normalize_rows(block)
+            if rows.shape[0] == 0:
+                continue
+            if rows.shape[1] != dim:
+                raise ValueError(f"Block has dimension {rows.shape[1]}, expected {dim}")
+            data = rows.tobytes(order="C")
+            digest.update(data)
+            f.write(data)
+            written += rows.shape[0]
+        if written != count:
+            raise ValueError(f"Wrote {written} rows, expected {count}")
+
+        header["checksum"] = "sha256:" + digest.hexdigest()
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        f.seek(0)
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\x00" * (data_offset - (len(INDEX_MAGIC) + 4 + len(header_bytes))))
+    os.replace(tmp_path, path)
+
+    return header
+
+
+def read_header(path):
+    """Read and validate the header of an index file without touching the rows."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic = f.read(len(INDEX_MAGIC))
+        if magic != INDEX_MAGIC:
+            raise IndexFormatError(f"{path} is not a vector index (bad magic)")
+        raw_len = f.read(4)
+        if len(raw_len) != 4:
+            raise IndexFormatError(f"{path} is truncated (no header length)")
+        (header_len,) = struct.unpack("<I", raw_len)
+        header_bytes = f.read(header_len)
+        if len(header_bytes) != header_len:
+            raise IndexFormatError(f"{path} is truncated (short header)")
+
+    try:
+        header = json.loads(header_bytes.decode("utf-8"))
+    except ValueError as e:
+        raise IndexFormatError(f"{path} has an unreadable header - {e}")
+
+    if header.get("format_version") != INDEX_FORMAT_VERSION:
+        raise IndexFormatError(
+            f"{path} has format version {header.get('format_version')}, "
+            f"expected {INDEX_FORMAT_VERSION}"
+        )
+    if header.get("dtype") != INDEX_DTYPE:
+        raise IndexFormatError(f"{path} has unsupported dtype {header.get('dtype')}")
+
+    header["data_offset"] = _data_offset(header_len)
+    expected_size = header["data_offset"] + header["count"] * header["dim"] * 4
+    actual_size = path.stat().st_size
+    if actual_size != expected_size:
+        raise IndexFormatError(
+            f"{path} is {actual_size} bytes, header describes {expected_size}"
+        )
+
+    return header
+
+
+def load_index(path, verify_checksum=False):
+    """
+    Memory-map an index file.
+
+    Args:
+        path: Path to the index file
+        verify_checksum: Hash the whole data section and compare it with the
+            header. This reads every page once, so it is off by default.
+
+    Returns:
+        (vectors, header) where vectors is a read-only (count, dim) memmap.
+    """
+    header = read_header(path)
+    shape = (header["count"], header["dim"])
+
+    if header["count"] == 0:
+        vectors = np.zeros(shape, dtype=np.float32)
+    else:
+        vectors = np.memmap(
+            path,
+            dtype=np.float32,
+            mode="r",
+            offset=header["data_offset"],
+            shape=shape,
+        )
+
+    if verify_checksum:
+        digest = "sha256:" + hashlib.sha256(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+        if digest != header["checksum"]:
+            raise IndexFormatError(f"{path} failed checksum verification")
+
+    return vectors, header
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first.
+
+    Works on a 1-D score vector or row-wise on a 2-D (queries, docs) matrix.
+    Uses argpartition so the cost is linear in the corpus size, and only the
+    k selected entries are sorted.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=-1)[..., n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
@@ -160,7 +160,7 @@ fn get_rag_directory(app: &tauri::App) -> PathBuf {
     if let Ok(resource_dir) = app.path().resource_dir() {
         // Tauri 2 bundles "resources/rag_system/..." relative to the resource dir
         let bundled = resource_dir.join("resources").join("rag_system");
-        if bundled.join("simple_db").join("metadata.json").exists() {
+        if rag::index::has_knowledge_base(&bundled) {
             return bundled;
         }
     }
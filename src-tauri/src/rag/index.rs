@@ -1,9 +1,13 @@
 use crate::rag::retriever::keyword_top_k;
 use crate::rag::types::{RagChunk, RagContext};
-use std::fs::File;
-use std::path::Path;
+use std::fs::{self, File};
+use std::path::{Path, PathBuf};
 
 const MAX_RETRIEVAL_RESULTS: usize = 10;
+// Written by rag_system/shard_generations.py: each shard's CURRENT file names
+// the gen-NNNNNN directory holding its latest build
+const POINTER_FILENAME: &str = "CURRENT";
+const GENERATION_PREFIX: &str = "gen-";
 
 pub struct RagIndex {
     metadata: Vec<RagChunk>,
@@ -13,7 +17,8 @@ pub struct RagIndex {
 
 impl RagIndex {
     pub fn load_from_dir(rag_dir: &Path) -> Self {
-        let db_dir = rag_dir.join("simple_db");
+        let db_dir = resolve_db_dir(rag_dir);
+        log::info!("[RAG] Reading knowledge base from {}", db_dir.display());
         let metadata_json_path = db_dir.join("metadata.json");
         let metadata_pickle_path = db_dir.join("metadata.pkl");
 
@@ -80,6 +85,74 @@ impl RagIndex {
     }
 }
 
+/// Directory holding the knowledge base files, chosen like the Python server's
+/// default: the shard named by BLENDER_HELPER_DEFAULT_VERSION, else the newest
+/// shard under simple_db/<version>/ (its current generation), else a database
+/// stored directly in simple_db/.
+pub fn resolve_db_dir(rag_dir: &Path) -> PathBuf {
+    let db_root = rag_dir.join("simple_db");
+
+    let mut shards: Vec<((u32, u32), PathBuf)> = fs::read_dir(&db_root)
+        .into_iter()
+        .flatten()
+        .filter_map(|entry| entry.ok())
+        .filter_map(|entry| {
+            let version = parse_version(entry.file_name().to_str()?)?;
+            let generation = current_generation(&entry.path());
+            has_metadata(&generation).then_some((version, generation))
+        })
+        .collect();
+    shards.sort_by_key(|(version, _)| *version);
+
+    if let Some(default) = std::env::var("BLENDER_HELPER_DEFAULT_VERSION")
+        .ok()
+        .and_then(|value| parse_version(&value))
+    {
+        if let Some((_, generation)) = shards.iter().find(|(version, _)| *version == default) {
+            return generation.clone();
+        }
+    }
+
+    match shards.pop() {
+        Some((_, generation)) => generation,
+        None => db_root,
+    }
+}
+
+/// Whether rag_dir has a knowledge base the loader can read.
+pub fn has_knowledge_base(rag_dir: &Path) -> bool {
+    has_metadata(&resolve_db_dir(rag_dir))
+}
+
+/// The generation CURRENT names, or the shard directory itself for shards
+/// written before generations (or when CURRENT is missing or dangling).
+fn current_generation(shard_dir: &Path) -> PathBuf {
+    if let Ok(name) = fs::read_to_string(shard_dir.join(POINTER_FILENAME)) {
+        let name = name.trim();
+        let numbered = name
+            .strip_prefix(GENERATION_PREFIX)
+            .is_some_and(|n| !n.is_empty() && n.bytes().all(|b| b.is_ascii_digit()));
+        let generation = shard_dir.join(name);
+        if numbered && generation.is_dir() {
+            return generation;
+        }
+    }
+    shard_dir.to_path_buf()
+}
+
+fn parse_version(name: &str) -> Option<(u32, u32)> {
+    let (major, minor) = name.split_once('.')?;
+    let digits = |part: &str| !part.is_empty() && part.bytes().all(|b| b.is_ascii_digit());
+    if !digits(major) || !digits(minor) {
+        return None;
+    }
+    Some((major.parse().ok()?, minor.parse().ok()?))
+}
+
+fn has_metadata(dir: &Path) -> bool {
+    dir.join("metadata.json").exists() || dir.join("metadata.pkl").exists()
+}
+
 fn load_metadata(json_path: &Path, pickle_path: &Path) -> Result<Vec<RagChunk>, String> {
     if json_path.exists() {
         let file = File::open(json_path).map_err(|e| format!("{} ({})", json_path.display(), e))?;
@@ -104,3 +177,56 @@ fn load_metadata(json_path: &Path, pickle_path: &Path) -> Result<Vec<RagChunk>,
         pickle_path.display()
     ))
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn temp_rag_dir(name: &str) -> PathBuf {
+        let dir =
+            std::env::temp_dir().join(format!("blender_helper_{}_{}", name, std::process::id()));
+        let _ = fs::remove_dir_all(&dir);
+        fs::create_dir_all(dir.join("simple_db")).unwrap();
+        dir
+    }
+
+    fn write_metadata(dir: &Path) {
+        fs::create_dir_all(dir).unwrap();
+        fs::write(dir.join("metadata.json"), "[]").unwrap();
+    }
+
+    #[test]
+    fn prefers_newest_shard_generation_over_root_database() {
+        let rag_dir = temp_rag_dir("resolve");
+        let db_root = rag_dir.join("simple_db");
+        write_metadata(&db_root);
+        write_metadata(&db_root.join("3.6"));
+        write_metadata(&db_root.join("4.10").join("gen-000002"));
+        write_metadata(&db_root.join("4.10").join("gen-000003"));
+        fs::write(db_root.join("4.10").join(POINTER_FILENAME), "gen-000003\n").unwrap();
+        write_metadata(&db_root.join("4.2"));
+
+        assert_eq!(
+            resolve_db_dir(&rag_dir),
+            db_root.join("4.10").join("gen-000003")
+        );
+
+        // Dangling pointer: 4.10 has no readable database, so the next newest wins
+        fs::write(db_root.join("4.10").join(POINTER_FILENAME), "gen-000009\n").unwrap();
+        assert_eq!(resolve_db_dir(&rag_dir), db_root.join("4.2"));
+
+        let _ = fs::remove_dir_all(&rag_dir);
+    }
+
+    #[test]
+    fn falls_back_to_root_database_without_shards() {
+        let rag_dir = temp_rag_dir("root");
+        write_metadata(&rag_dir.join("simple_db"));
+        fs::create_dir_all(rag_dir.join("simple_db").join("9.9")).unwrap();
+
+        assert_eq!(resolve_db_dir(&rag_dir), rag_dir.join("simple_db"));
+        assert!(has_knowledge_base(&rag_dir));
+
+        let _ = fs::remove_dir_all(&rag_dir);
+    }
+}